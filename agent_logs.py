@@ -0,0 +1,242 @@
+"""Log documents and API payloads built from agent objects.
+
+Shared by the Flask app (app.py) and its asyncio variant (asgi_app.py), so
+both store the same Cosmos DB documents and return the same response
+shapes to the frontend.
+"""
+
+import json
+import uuid
+from datetime import datetime
+
+from azure.ai.agents.models import (
+    AgentStreamEvent,
+    MessageDeltaChunk,
+    MessageRole,
+    MessageStatus,
+    ThreadMessage,
+    ThreadRun,
+)
+
+from run_scheduler import TERMINAL_STATUSES, run_status_value
+
+
+def log_document(thread_id, log_type, log_data):
+    """A new log document for the thread log container."""
+    return {
+        "id": str(uuid.uuid4()),
+        "thread_id": thread_id,
+        "log_type": log_type,  # 'message', 'run', 'thread_created', etc.
+        "timestamp": datetime.utcnow().isoformat(),
+        "data": log_data
+    }
+
+
+def message_log_data(message_data):
+    """The `data` of a message log document."""
+    log_data = {
+        "message_id": message_data.get("id"),
+        "role": message_data.get("role"),
+        "content": message_data.get("content"),
+        "created_at": message_data.get("created_at")
+    }
+    if message_data.get("cache_hit"):
+        # Answered from the response cache rather than by an agent run.
+        log_data["cache_hit"] = True
+    return log_data
+
+
+def run_log_data(run_data):
+    """The `data` of a run log document."""
+    return {
+        "run_id": run_data.get("id"),
+        "status": run_data.get("status"),
+        "model": run_data.get("model"),
+        "created_at": run_data.get("created_at"),
+        "completed_at": run_data.get("completed_at")
+    }
+
+
+def run_data(run):
+    """The fields of a `ThreadRun` that are logged."""
+    return {
+        "id": run.id,
+        "status": run.status.value if hasattr(run.status, 'value') else str(run.status),
+        "model": run.model if hasattr(run, 'model') else None,
+        "created_at": run.created_at.isoformat() if run.created_at else datetime.utcnow().isoformat(),
+        "completed_at": run.completed_at.isoformat() if hasattr(run, 'completed_at') and run.completed_at else None
+    }
+
+
+def user_message_data(user_message, text):
+    """The logged fields of the user's `ThreadMessage`."""
+    return {
+        "id": user_message.id,
+        "role": "user",
+        "content": [{"type": "text", "text": text}],
+        "created_at": user_message.created_at.isoformat() if user_message.created_at else datetime.utcnow().isoformat()
+    }
+
+
+def assistant_message_data(assistant_message):
+    """The logged fields of an assistant `ThreadMessage`."""
+    content_list = []
+    if assistant_message.text_messages:
+        for text_msg in assistant_message.text_messages:
+            content_list.append({
+                "type": "text",
+                "text": text_msg.text.value if hasattr(text_msg.text, 'value') else str(text_msg.text)
+            })
+
+    return {
+        "id": assistant_message.id,
+        "role": "assistant",
+        "content": content_list,
+        "created_at": assistant_message.created_at.isoformat() if assistant_message.created_at else datetime.utcnow().isoformat()
+    }
+
+
+def format_agent_message(msg):
+    """Format an agent `ThreadMessage` for the logs panel."""
+    log_entry = {
+        'id': msg.id,
+        'role': msg.role.value if hasattr(msg.role, 'value') else str(msg.role),
+        'created_at': msg.created_at.isoformat() if msg.created_at else None,
+        'content': []
+    }
+
+    # Extract text content
+    if msg.text_messages:
+        for text_msg in msg.text_messages:
+            log_entry['content'].append({
+                'type': 'text',
+                'text': text_msg.text.value if hasattr(text_msg.text, 'value') else str(text_msg.text)
+            })
+
+    # Include file citations if present
+    if hasattr(msg, 'file_citations') and msg.file_citations:
+        log_entry['file_citations'] = [
+            {'file_id': citation.file_id}
+            for citation in msg.file_citations
+        ]
+
+    return log_entry
+
+
+def format_agent_run(run):
+    """Format an agent `ThreadRun` for the logs panel."""
+    return {
+        'id': run.id,
+        'status': run.status.value if hasattr(run.status, 'value') else str(run.status),
+        'created_at': run.created_at.isoformat() if run.created_at else None,
+        'completed_at': run.completed_at.isoformat() if hasattr(run, 'completed_at') and run.completed_at else None,
+        'model': run.model if hasattr(run, 'model') else None
+    }
+
+
+def format_sse(event, payload):
+    """Encode one server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+class ThreadLogger:
+    """The log entries the chat pipeline writes for a thread.
+
+    Both apps log the same entries and differ only in how a document is
+    written, so each passes its own `store(thread_id, log_type, log_data)`.
+    `run_details()` may return extra fields for run logs.
+    """
+
+    def __init__(self, store, run_details=None):
+        self.store = store
+        self.run_details = run_details
+
+    def message(self, thread_id, message_data):
+        """Log a message given as `message_data`-style fields."""
+        return self.store(thread_id, "message", message_log_data(message_data))
+
+    def user_message(self, thread_id, user_message, text):
+        """Log the user's `ThreadMessage`."""
+        return self.message(thread_id, user_message_data(user_message, text))
+
+    def assistant_message(self, thread_id, assistant_message):
+        """Log an assistant `ThreadMessage`."""
+        return self.message(thread_id, assistant_message_data(assistant_message))
+
+    def run(self, thread_id, run):
+        """Log the final state of a `ThreadRun`."""
+        log_data = run_log_data(run_data(run))
+        if self.run_details:
+            log_data.update(self.run_details())
+        return self.store(thread_id, "run", log_data)
+
+
+class RunStream:
+    """The SSE frames of one streamed agent run.
+
+    The apps feed every event of the SDK stream to `event()`, which forwards
+    text deltas and also assembles them, so the finished answer is known
+    without a follow-up `messages.list` call.  The completed assistant
+    message and the final run are handed to `on_message(thread_id, message)`
+    and `on_run(thread_id, run)`.  `finish()` gives the closing frame.
+    """
+
+    def __init__(self, thread_id, session_id, on_message, on_run):
+        self.thread_id = thread_id
+        self.session_id = session_id
+        self.on_message = on_message
+        self.on_run = on_run
+        self.chunks = []
+        self.run = None
+        # Set by `finish()` when the run answered.
+        self.response = None
+        # Set when the stream reported an error; stop reading it.
+        self.failed = False
+        self._message_text = None
+
+    def start(self):
+        """The opening frame."""
+        return format_sse('start', {'thread_id': self.thread_id, 'session_id': self.session_id})
+
+    def event(self, event_type, event_data):
+        """The frame to send for one stream event, or None."""
+        if isinstance(event_data, MessageDeltaChunk):
+            if event_data.text:
+                self.chunks.append(event_data.text)
+                return format_sse('delta', {'text': event_data.text})
+
+        elif isinstance(event_data, ThreadMessage):
+            if event_data.status == MessageStatus.COMPLETED and event_data.role == MessageRole.AGENT:
+                self.on_message(self.thread_id, event_data)
+                if event_data.text_messages:
+                    self._message_text = event_data.text_messages[-1].text.value
+
+        elif isinstance(event_data, ThreadRun):
+            self.run = event_data
+            if run_status_value(self.run) in TERMINAL_STATUSES:
+                self.on_run(self.thread_id, self.run)
+
+        elif event_type == AgentStreamEvent.ERROR:
+            self.failed = True
+            return self.error(str(event_data))
+        return None
+
+    def error(self, message):
+        """An `error` frame."""
+        return format_sse('error', {'error': message})
+
+    def finish(self):
+        """The closing frame once the stream ended: `done` or `error`."""
+        if self.run and run_status_value(self.run) != "completed":
+            return self.error(f'Agent run failed: {self.run.last_error}')
+
+        response = self._message_text or ''.join(self.chunks)
+        if not response:
+            return self.error('No response from agent')
+
+        self.response = response
+        return format_sse('done', {
+            'response': response,
+            'session_id': self.session_id,
+            'run_id': self.run.id if self.run else None
+        })
@@ -5,15 +5,34 @@ Azure AI Agent.  This file focuses on wiring—credential bootstrapping, thread
 management, and returning responses in a shape that the frontend understands.
 """
 
+import atexit
+import contextvars
+import json
 import os
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 from dotenv import load_dotenv
-from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
-from azure.ai.agents.models import ListSortOrder
-from azure.cosmos import CosmosClient, PartitionKey, exceptions
+from azure.ai.agents.models import ListSortOrder, MessageRole, ThreadMessageOptions
+from azure.core.exceptions import ResourceNotFoundError
+from azure.cosmos import PartitionKey, exceptions
+
+from agent_logs import RunStream, ThreadLogger, format_agent_message, format_agent_run, format_sse, log_document
+from client_factory import close_transports, create_cosmos_client, create_project_client, pool_snapshot
+from cosmos_queries import queries
+from credential_cache import CachingCredential, credential_from_env
+from log_format import compact_enabled, decode, rewind_cursor, store_format, thread_logs_query
+from log_pipeline import LogPipeline, provision_log_containers
+from response_cache import ResponseCache, agent_fingerprint
+from run_analytics import read_rollups, summarize_rollups
+from run_scheduler import TERMINAL_STATUSES, RunScheduler, run_status_value
+from session_store import CachedSessionStore, CosmosSessionStore, InMemorySessionStore
+from startup import CachedAgent, Warmup
+from thread_log_cache import ThreadLogCache, page_after
+from timing import counter_lines, current_trace, endpoints, record, server_timing, span, stages, start_trace
 
 # Load environment variables from .env file
 #
@@ -45,28 +64,99 @@ cosmos_endpoint = os.getenv("COSMOS_ENDPOINT")
 cosmos_key = os.getenv("COSMOS_KEY")
 cosmos_database_name = os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB")
 cosmos_container_name = os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs")
+cosmos_sessions_container_name = os.getenv("COSMOS_SESSIONS_CONTAINER_NAME", "Sessions")
+session_store_backend = os.getenv("SESSION_STORE", "memory").lower()
+cosmos_apply_provisioning = os.getenv("COSMOS_APPLY_PROVISIONING", "false").lower() == "true"
+cosmos_by_day_container_name = os.getenv("COSMOS_BY_DAY_CONTAINER_NAME", "ThreadLogsByDay")
+
+# Registered first so the shared HTTP sessions are closed last, after the
+# log writers have drained (atexit is LIFO).
+atexit.register(close_transports)
+
+# Start-up
+#
+# Nothing below talks to Azure at import time.  Connecting to Cosmos DB and
+# fetching the agent definition run as background warm-up tasks (retried with
+# backoff), so the worker starts serving `/` and `/api/new-session` at once.
+# Other routes wait up to `STARTUP_WAIT` seconds for the first warm-up
+# attempt; `/api/ready` reports when everything is warm (see startup.py).
+warmup = Warmup(max_retry_interval=float(os.getenv("WARMUP_MAX_RETRY_INTERVAL", "60")))
+startup_wait = float(os.getenv("STARTUP_WAIT", "30"))
 
 cosmos_client = None
 cosmos_container = None
+cosmos_sessions_container = None
+thread_summaries = None
+log_stats = None
+cosmos_by_day_container = None
+daily_logs = None
+log_writer = None
+log_pipeline = None
 
-if cosmos_endpoint and cosmos_key:
-    try:
-        cosmos_client = CosmosClient(cosmos_endpoint, cosmos_key)
-        # Create database if it doesn't exist
-        database = cosmos_client.create_database_if_not_exists(id=cosmos_database_name)
-        # Create container if it doesn't exist with partition key
-        # Note: Serverless accounts don't support offer_throughput parameter
-        cosmos_container = database.create_container_if_not_exists(
-            id=cosmos_container_name,
-            partition_key=PartitionKey(path="/thread_id")
+# Incremental log reads re-read this many seconds before the client's cursor
+# to pick up logs the background writer stored out of order.
+cosmos_cursor_overlap = float(os.getenv("COSMOS_LOG_CURSOR_OVERLAP", "5"))
+
+def init_cosmos():
+    """Connect to Cosmos DB, provision containers and start the log writers.
+
+    Runs as the `cosmos` warm-up task.  Globals are only published once
+    every step succeeded, so a failed attempt can simply be retried.
+    """
+    global cosmos_client, cosmos_container, cosmos_sessions_container, thread_summaries
+    global log_stats, cosmos_by_day_container, daily_logs, log_writer, log_pipeline
+    
+    # Built on a shared, pooled transport with throttle retries (see
+    # client_factory.py).
+    client = create_cosmos_client(cosmos_endpoint, cosmos_key)
+    # Create database if it doesn't exist
+    database = client.create_database_if_not_exists(id=cosmos_database_name)
+    # Create the log, summaries and (optional) by-day containers with their
+    # partition keys, lean indexing policies and the optional retention TTL
+    # (see log_pipeline.py and cosmos_provisioning.py).
+    # Note: Serverless accounts don't support offer_throughput parameter
+    container, summaries_container, by_day_container = provision_log_containers(
+        database, apply_to_existing=cosmos_apply_provisioning)
+    sessions_container = None
+    if session_store_backend == "cosmos":
+        # Session documents are keyed by session ID so a lookup is a
+        # single point read.
+        sessions_container = database.create_container_if_not_exists(
+            id=cosmos_sessions_container_name,
+            partition_key=PartitionKey(path="/session_id")
         )
-        print(f"✓ Connected to Cosmos DB: {cosmos_database_name}/{cosmos_container_name}")
-        print(f"  Mode: Serverless (pay-per-request)")
-    except Exception as e:
-        print(f"⚠ Warning: Could not connect to Cosmos DB: {e}")
-        print("  Application will continue without log persistence.")
-else:
-    print("⚠ Warning: Cosmos DB credentials not provided. Logs will not be persisted.")
+    
+    # Background log writer
+    #
+    # Log documents are queued and written by worker threads in
+    # per-partition transactional batches, so Cosmos latency stays out of
+    # the chat response time.  Written documents then update the thread
+    # summaries, the stats counters and the by-day copy.  Set
+    # `COSMOS_LOG_WRITER_ASYNC=false` to fall back to writing inline on the
+    # request thread (handy when debugging a single request).
+    pipeline = LogPipeline(
+        container, summaries_container, by_day_container,
+        background=os.getenv("COSMOS_LOG_WRITER_ASYNC", "true").lower() == "true"
+    )
+    # Drain whatever is still queued when the process exits normally.
+    atexit.register(pipeline.close)
+    
+    cosmos_client = client
+    cosmos_sessions_container = sessions_container
+    log_pipeline = pipeline
+    log_writer = pipeline.writer
+    thread_summaries = pipeline.summaries
+    log_stats = pipeline.stats
+    daily_logs = pipeline.daily_logs
+    cosmos_by_day_container = by_day_container
+    use_cosmos_sessions(sessions_container)
+    # Published last: `cosmos_container` is what the rest of the app checks
+    # to decide whether logs are persisted.
+    cosmos_container = container
+    print(f"✓ Connected to Cosmos DB: {cosmos_database_name}/{cosmos_container_name}")
+    print(f"  Mode: Serverless (pay-per-request)")
+    if compact_enabled():
+        print("  Log format: compact (see log_format.py)")
 
 # Initialize Azure client
 #
@@ -75,82 +165,224 @@ else:
 # in production (e.g., App Service / managed identity) it automatically picks
 # up the managed identity token.  The `AIProjectClient` holds the connection to
 # the Azure AI service, and we can reuse it across requests because it is
-# thread-safe for basic operations.
-credential = DefaultAzureCredential()
+# thread-safe for basic operations.  It is built on a shared, pooled transport
+# with 429 retries (see client_factory.py).  Neither makes a network call
+# until the first request.
+#
+# The credential is wrapped in a token cache that refreshes tokens in the
+# background before they expire, so token acquisition stays off the chat
+# path; `TOKEN_CACHE_FILE` additionally shares tokens between the workers on
+# one host through an encrypted file (see credential_cache.py).
+credential = credential_from_env(DefaultAzureCredential())
+if isinstance(credential, CachingCredential):
+    atexit.register(credential.close)
 
-project = AIProjectClient(
-    credential=credential,
-    endpoint=azure_endpoint
+project = create_project_client(azure_endpoint, credential)
+
+# Answer cache for first-turn messages
+#
+# Opt in with `RESPONSE_CACHE_ENABLED=true`.  The first message of a
+# conversation is answered from the cache when the same agent version has
+# already answered the same (normalized) question; see response_cache.py.
+response_cache = None
+
+if os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true":
+    response_cache = ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    )
+
+# Agent thread log cache
+#
+# `/api/thread-logs` with `source=agent` serves the formatted messages and
+# runs of a thread from this cache; the chat path appends new messages and
+# finished runs to it (see thread_log_cache.py).  Set
+# `THREAD_LOG_CACHE_SIZE=0` to always list from the Agents API.  Listings
+# fetch messages and runs concurrently on a small shared pool.
+thread_log_cache = None
+
+if int(os.getenv("THREAD_LOG_CACHE_SIZE", "500")) > 0:
+    thread_log_cache = ThreadLogCache(
+        max_threads=int(os.getenv("THREAD_LOG_CACHE_SIZE", "500")),
+        max_items=int(os.getenv("THREAD_LOG_CACHE_MAX_ITEMS", "50000")),
+        ttl=float(os.getenv("THREAD_LOG_CACHE_TTL", "300"))
+    )
+
+agent_list_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("THREAD_LOGS_FETCH_WORKERS", "8")),
+    thread_name_prefix="agent-list"
 )
 
-agent = project.agents.get_agent(azure_agent_id)
+# Agent definition
+#
+# Runs only need the agent ID, so the definition itself is just cached: it is
+# fetched by the `agent` warm-up task (which also acquires the first token and
+# opens the first pooled connection) and refreshed by a timer thread every
+# `AGENT_REFRESH_INTERVAL` seconds.  A changed definition invalidates the
+# response cache.
+agent_version = None
 
-# Store active threads (in production, use a database)
+def on_agent_refresh(refreshed):
+    """Track the agent version and invalidate stale cached answers."""
+    global agent_version
+    agent_version = agent_fingerprint(refreshed)
+    if response_cache:
+        response_cache.set_agent_version(azure_agent_id, agent_version)
+
+agent_cache = CachedAgent(
+    lambda: project.agents.get_agent(azure_agent_id),
+    refresh_interval=float(os.getenv("AGENT_REFRESH_INTERVAL", "60")),
+    on_refresh=on_agent_refresh
+)
+
+# Session → thread store
 #
 # The browser sends a `session_id` so the backend can keep consecutive messages
-# in the same agent thread.  For this sample we tuck the thread IDs into a
-# module-level dictionary.  A production implementation should move this into a
-# persistent or distributed cache (Redis, Cosmos DB, etc.) to support scale-out
-# scenarios.
-active_threads = {}
+# in the same agent thread.  `SESSION_STORE=memory` (the default) keeps the map
+# in this process, which is fine for a single worker.  `SESSION_STORE=cosmos`
+# shares it across workers and replicas and survives restarts; it is swapped in
+# by the Cosmos warm-up task.  Either way a small LRU cache with TTL sits in
+# front so hot sessions skip the backend.
+session_cache_size = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+
+def build_session_store(backend):
+    """Wrap a session store backend in the LRU cache, if enabled."""
+    if session_cache_size > 0:
+        return CachedSessionStore(
+            backend,
+            max_entries=session_cache_size,
+            ttl=float(os.getenv("SESSION_CACHE_TTL", "300"))
+        )
+    return backend
+
+session_store = build_session_store(InMemorySessionStore())
+session_store_fell_back = False
+
+def use_cosmos_sessions(sessions_container):
+    """Switch to the Cosmos session store once its container is ready."""
+    global session_store
+    if sessions_container is None:
+        return
+    if session_store_fell_back:
+        # Requests already ran on in-memory sessions; switching now would
+        # orphan their threads, so stay in memory until the next restart.
+        print("⚠ Warning: Cosmos DB session store became available after start-up; keeping in-memory sessions.")
+        return
+    session_store = build_session_store(CosmosSessionStore(sessions_container))
+
+if cosmos_endpoint and cosmos_key:
+    warmup.start("cosmos", init_cosmos)
+else:
+    print("⚠ Warning: Cosmos DB credentials not provided. Logs will not be persisted.")
+    if session_store_backend == "cosmos":
+        print("⚠ Warning: Cosmos DB session store unavailable, using in-memory sessions.")
+warmup.start("agent", agent_cache.refresh)
+agent_cache.start()
+
+# Request timing
+#
+# Every request collects the spans of the Azure and Cosmos calls it makes
+# (see timing.py).  They are exported at `/metrics`, saved with the run log
+# document and, with `SERVER_TIMING_ENABLED=true`, returned in a
+# `Server-Timing` header for browser devtools.
+server_timing_enabled = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+@app.before_request
+def begin_request_timing():
+    """Start the span trace of this request."""
+    g.request_started = time.perf_counter()
+    start_trace()
+
+@app.after_request
+def finish_request_timing(response):
+    """Record the request duration and add the `Server-Timing` header."""
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    endpoints.observe(request.endpoint or 'unknown', elapsed)
+    trace = current_trace()
+    if server_timing_enabled and trace:
+        # For streamed responses this covers the work before the first byte;
+        # the run itself is recorded in the run log document.
+        response.headers['Server-Timing'] = f"{server_timing(trace)}, total;dur={elapsed * 1000:.1f}"
+    return response
+
+# Routes that never touch Azure and are served while warming up.
+WARMUP_EXEMPT_ENDPOINTS = {"index", "new_session", "get_readiness", "get_metrics", "static"}
+
+@app.before_request
+def wait_for_warmup():
+    """Hold Azure-backed requests until the first Cosmos warm-up attempt ends."""
+    global session_store_fell_back
+    if request.endpoint in WARMUP_EXEMPT_ENDPOINTS:
+        return None
+    if warmup.is_settled("cosmos"):
+        cosmos_ready = warmup.is_ready("cosmos")
+    else:
+        with span("warmup_wait"):
+            cosmos_ready = warmup.wait("cosmos", startup_wait)
+    if not cosmos_ready and session_store_backend == "cosmos":
+        if not session_store_fell_back:
+            print("⚠ Warning: Cosmos DB session store unavailable, using in-memory sessions.")
+        session_store_fell_back = True
+    return None
 
 # Cosmos DB Helper Functions
 def store_log_to_cosmos(thread_id, log_type, log_data):
-    """Store a log entry to Cosmos DB."""
+    """Store a log entry to Cosmos DB.
+
+    With the background writer enabled this only queues the document and
+    returns immediately; the write itself happens on a worker thread.
+    """
     if not cosmos_container:
         return False
     
     try:
-        document = {
-            "id": str(uuid.uuid4()),
-            "thread_id": thread_id,
-            "log_type": log_type,  # 'message', 'run', 'thread_created', etc.
-            "timestamp": datetime.utcnow().isoformat(),
-            "data": log_data
-        }
-        cosmos_container.create_item(body=document)
+        document = log_document(thread_id, log_type, log_data)
+        if log_writer:
+            with span("cosmos_enqueue"):
+                return log_writer.submit(document)
+        with span("cosmos_write") as details:
+            cosmos_container.upsert_item(
+                body=store_format(document),
+                response_hook=lambda headers, result: details.update(
+                    request_charge=float(headers.get("x-ms-request-charge", 0)))
+            )
+        log_pipeline.notify([document])
         return True
     except Exception as e:
         print(f"Error storing log to Cosmos DB: {e}")
         return False
 
-def store_message_to_cosmos(thread_id, message_data):
-    """Store a message log entry to Cosmos DB."""
-    log_data = {
-        "message_id": message_data.get("id"),
-        "role": message_data.get("role"),
-        "content": message_data.get("content"),
-        "created_at": message_data.get("created_at")
-    }
-    return store_log_to_cosmos(thread_id, "message", log_data)
-
-def store_run_to_cosmos(thread_id, run_data):
-    """Store a run log entry to Cosmos DB."""
-    log_data = {
-        "run_id": run_data.get("id"),
-        "status": run_data.get("status"),
-        "model": run_data.get("model"),
-        "created_at": run_data.get("created_at"),
-        "completed_at": run_data.get("completed_at")
-    }
-    return store_log_to_cosmos(thread_id, "run", log_data)
+def run_timings():
+    """Where the request spent its time so far, for analyzing slow runs."""
+    trace = current_trace()
+    return {"timings": list(trace)} if trace else {}
+
+thread_logger = ThreadLogger(store_log_to_cosmos, run_details=run_timings)
 
-def get_logs_from_cosmos(thread_id):
-    """Retrieve all logs for a specific thread from Cosmos DB."""
+def get_logs_from_cosmos(thread_id, since=None):
+    """Iterate the logs for a thread from Cosmos DB, oldest first.
+
+    Items come straight from the query iterator, so callers never hold the
+    whole thread in memory.  `since` restricts results to logs stored after
+    that timestamp.  Logs stored in the compact format are decoded back to
+    full documents (see log_format.py).
+    """
     if not cosmos_container:
-        return []
+        return iter(())
     
-    try:
-        query = f"SELECT * FROM c WHERE c.thread_id = '{thread_id}' ORDER BY c.timestamp ASC"
-        items = list(cosmos_container.query_items(
-            query=query,
-            enable_cross_partition_query=False,
-            partition_key=thread_id
-        ))
-        return items
-    except Exception as e:
-        print(f"Error retrieving logs from Cosmos DB: {e}")
-        return []
+    name, parameters = thread_logs_query(thread_id, since)
+    return map(decode, queries.iterate(cosmos_container, name, parameters, partition_key=thread_id))
+
+def get_logs_page_from_cosmos(thread_id, page_size, continuation=None, since=None):
+    """Return one page of thread logs and the continuation token for the next."""
+    if not cosmos_container:
+        return [], None
+    
+    name, parameters = thread_logs_query(thread_id, since)
+    logs, next_continuation = queries.page(
+        cosmos_container, name, parameters,
+        partition_key=thread_id, page_size=page_size, continuation=continuation)
+    return [decode(log) for log in logs], next_continuation
 
 def get_all_threads_from_cosmos():
     """Retrieve all unique thread IDs from Cosmos DB."""
@@ -158,16 +390,276 @@ def get_all_threads_from_cosmos():
         return []
     
     try:
-        query = "SELECT DISTINCT c.thread_id FROM c"
-        items = list(cosmos_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        return [item['thread_id'] for item in items]
+        return list(queries.iterate(cosmos_container, "distinct_threads"))
     except Exception as e:
         print(f"Error retrieving threads from Cosmos DB: {e}")
         return []
 
+# Chat pipeline helpers
+#
+# The synchronous `/api/chat` path and the async run scheduler share these
+# steps so both log the same documents to Cosmos DB.
+def get_or_create_thread(session_id, known_new=False):
+    """Return the agent thread ID for a session, creating the thread if needed.
+
+    Pass `known_new=True` right after `session_store.get()` found no thread,
+    so the store does not read the session a second time.
+    """
+    # Each conversation maps to an Azure AI "thread".  When we see a brand
+    # new session we create a thread and remember its ID.  Otherwise we keep
+    # reusing the stored thread so that the agent has context for follow-up
+    # questions.  The session store makes sure concurrent first messages for
+    # the same session only create one thread.
+    def create_thread():
+        with span("thread_create"):
+            thread = project.agents.threads.create()
+        
+        # Store thread creation to Cosmos DB
+        store_log_to_cosmos(thread.id, "thread_created", {
+            "session_id": session_id,
+            "created_at": datetime.utcnow().isoformat()
+        })
+        return thread.id
+    
+    return session_store.get_or_create(session_id, create_thread, known_new)
+
+def response_cache_version(thread_id):
+    """Return the agent version to cache this message under, or None.
+
+    Only first-turn messages (sessions without a thread yet) are cacheable,
+    so callers pass the session's current thread ID from the session store.
+    """
+    if not response_cache or thread_id:
+        return None
+    return agent_version
+
+def answer_from_cache(session_id, message, cache_version):
+    """Answer a first-turn message from the response cache.
+
+    On a hit the session still gets a real agent thread, created in one call
+    with the question and the cached answer, so follow-up questions have
+    their context.  Returns `(thread_id, answer)`, or None on a miss.
+    """
+    answer = response_cache.lookup(azure_agent_id, cache_version, message)
+    if answer is None:
+        return None
+    
+    created = []
+    def create_seeded_thread():
+        with span("thread_create"):
+            thread = project.agents.threads.create(messages=[
+                ThreadMessageOptions(role=MessageRole.USER, content=message),
+                ThreadMessageOptions(role=MessageRole.AGENT, content=answer)
+            ])
+        created.append(thread.id)
+        store_log_to_cosmos(thread.id, "thread_created", {
+            "session_id": session_id,
+            "created_at": datetime.utcnow().isoformat(),
+            "cache_hit": True
+        })
+        return thread.id
+    
+    thread_id = session_store.get_or_create(session_id, create_seeded_thread, known_new=True)
+    if not created:
+        # A concurrent request started this conversation first, so this
+        # message is no longer a first turn.
+        return None
+    
+    created_at = datetime.utcnow().isoformat()
+    for role, text in (("user", message), ("assistant", answer)):
+        thread_logger.message(thread_id, {
+            "id": None,
+            "role": role,
+            "content": [{"type": "text", "text": text}],
+            "created_at": created_at,
+            "cache_hit": True
+        })
+    return thread_id, answer
+
+def post_user_message(thread_id, message):
+    """Send the user's message to the agent thread and log it."""
+    # The agent message API mirrors the OpenAI format.  We only need to
+    # send the role and the user content—the SDK handles brooming extra
+    # metadata.
+    with span("message_create"):
+        user_message = project.agents.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=message
+        )
+    
+    # Store user message to Cosmos DB
+    thread_logger.user_message(thread_id, user_message, message)
+    if thread_log_cache:
+        thread_log_cache.add_message(thread_id, format_agent_message(user_message), run_pending=True)
+    return user_message
+
+def record_run(thread_id, run):
+    """Store the final state of an agent run to Cosmos DB."""
+    thread_logger.run(thread_id, run)
+    if thread_log_cache:
+        thread_log_cache.add_run(thread_id, format_agent_run(run))
+
+def forget_thread_logs(thread_id):
+    """Drop a thread's cached logs after a turn that failed part-way.
+
+    The cache bypasses a thread from the user message until the run and its
+    answer arrive; a turn that errors out never delivers them, so the entry
+    is dropped and refilled from the service on the next listing.
+    """
+    if thread_log_cache and thread_id:
+        thread_log_cache.invalidate(thread_id)
+
+def store_assistant_message(thread_id, assistant_message):
+    """Store an assistant `ThreadMessage` to Cosmos DB."""
+    if thread_log_cache:
+        thread_log_cache.add_message(thread_id, format_agent_message(assistant_message))
+    return thread_logger.assistant_message(thread_id, assistant_message)
+
+def collect_agent_response(thread_id, store=True):
+    """Fetch the newest assistant message, log it, and return its text.
+
+    With `store=False` the message is only read, for callers that know the
+    worker owning the run logs it.
+    """
+    # The SDK returns messages in reverse chronological order when using
+    # `ListSortOrder.DESCENDING`.  We only need the newest assistant payload
+    # plus the user's message for context (the latter is already in memory,
+    # but fetching both keeps the flow symmetric).
+    # The list is paged lazily, so the span covers the loop that fetches it.
+    with span("message_list"):
+        messages = project.agents.messages.list(
+            thread_id=thread_id, 
+            order=ListSortOrder.DESCENDING,
+            limit=2  # Get last 2 messages (user + agent)
+        )
+        
+        # Find the agent's response
+        #
+        # Some agent responses may contain multiple text blocks; grabbing the
+        # last one preserves the full answer, including tool call summaries or
+        # notes the agent may append.
+        agent_response = None
+        assistant_message = None
+        for msg in messages:
+            if msg.role.value.lower() == 'assistant' and msg.text_messages:
+                agent_response = msg.text_messages[-1].text.value
+                assistant_message = msg
+                break
+    
+    # Store assistant message to Cosmos DB
+    if assistant_message and store:
+        store_assistant_message(thread_id, assistant_message)
+    
+    return agent_response
+
+def complete_async_run(handle, run):
+    """Scheduler callback: log the finished run and collect the answer."""
+    record_run(handle.thread_id, run)
+    
+    if run_status_value(run) != "completed":
+        raise RuntimeError(f'Agent run {run_status_value(run)}: {run.last_error}')
+    
+    agent_response = collect_agent_response(handle.thread_id)
+    if not agent_response:
+        forget_thread_logs(handle.thread_id)
+        raise RuntimeError('No response from agent')
+    
+    return {
+        'response': agent_response,
+        'session_id': handle.context.get('session_id')
+    }
+
+def stream_agent_run(thread_id, session_id, message=None, cache_version=None):
+    """Run the agent with streaming and yield SSE frames as output arrives.
+
+    Events are turned into frames by `agent_logs.RunStream`, which also
+    persists the assistant message and the run once each completes.  With a
+    `cache_version` the finished answer is added to the response cache.
+    """
+    run_stream = RunStream(thread_id, session_id, store_assistant_message, record_run)
+    try:
+        yield run_stream.start()
+        
+        started = time.perf_counter()
+        try:
+            with span("run_stream"), project.agents.runs.stream(thread_id=thread_id, agent_id=azure_agent_id) as stream:
+                for event_type, event_data, _ in stream:
+                    first_token = not run_stream.chunks
+                    frame = run_stream.event(event_type, event_data)
+                    if first_token and run_stream.chunks:
+                        record("run_first_token", time.perf_counter() - started)
+                    if frame:
+                        yield frame
+                    if run_stream.failed:
+                        return
+        except Exception as e:
+            yield run_stream.error(str(e))
+            return
+        
+        frame = run_stream.finish()
+        if cache_version and run_stream.response:
+            response_cache.store(azure_agent_id, cache_version, message, run_stream.response)
+        yield frame
+    finally:
+        # Failed, errored, answerless or abandoned by the client.
+        if not run_stream.response:
+            forget_thread_logs(thread_id)
+
+def stream_cached_answer(thread_id, session_id, answer):
+    """Replay a cached answer with the same SSE events as a live run."""
+    yield format_sse('start', {'thread_id': thread_id, 'session_id': session_id})
+    yield format_sse('delta', {'text': answer})
+    yield format_sse('done', {
+        'response': answer,
+        'session_id': session_id,
+        'run_id': None,
+        'cached': True
+    })
+
+# Async run scheduler
+#
+# In async mode `/api/chat` starts the run and returns immediately; this
+# scheduler polls every in-flight run from one shared thread with adaptive
+# backoff and runs `complete_async_run` when each one finishes.
+run_scheduler = RunScheduler(
+    project,
+    on_complete=complete_async_run,
+    min_interval=float(os.getenv("RUN_POLL_MIN_INTERVAL", "0.25")),
+    max_interval=float(os.getenv("RUN_POLL_MAX_INTERVAL", "2.0")),
+    max_workers=int(os.getenv("RUN_POLL_WORKERS", "8")),
+    result_ttl=int(os.getenv("RUN_RESULT_TTL", "600")),
+    max_errors=int(os.getenv("RUN_POLL_MAX_ERRORS", "10")),
+    deadline=float(os.getenv("RUN_DEADLINE", "1800"))
+)
+
+def run_status_from_service(thread_id, run_id, session_id=None):
+    """Status payload of a run this worker is not tracking.
+
+    Handles only live in the memory of the worker that started the run, so
+    behind several gunicorn workers a status request often lands elsewhere.
+    The run is then looked up in the Agents service directly.  The owning
+    worker still logs the run and its answer, so this only reads them.
+    """
+    with span("run_get"):
+        run = project.agents.runs.get(thread_id=thread_id, run_id=run_id)
+    status = run_status_value(run)
+    payload = {
+        'run_id': run_id,
+        'thread_id': thread_id,
+        'status': status,
+        'done': status in TERMINAL_STATUSES,
+        'polls': 1
+    }
+    if status == "completed":
+        payload['response'] = collect_agent_response(thread_id, store=False)
+        payload['session_id'] = session_id
+        if not payload['response']:
+            payload['error'] = 'No response from agent'
+    elif payload['done']:
+        payload['error'] = f'Agent run {status}: {run.last_error}'
+    return payload
+
 @app.route('/')
 def index():
     """Render the main chat interface template."""
@@ -175,7 +667,12 @@ def index():
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    """Handle chat messages from the browser client."""
+    """Handle chat messages from the browser client.
+
+    Pass `"async": true` to start the run and return a run handle right away
+    (HTTP 202); the answer is then collected from `/api/run-status`.
+    """
+    thread_id = None
     try:
         data = request.get_json()
         # All incoming payloads are expected to be JSON with a message and a
@@ -183,116 +680,73 @@ def chat():
         # in case the frontend ends up sending padded messages.
         message = data.get('message', '').strip()
         session_id = data.get('session_id')
+        async_mode = bool(data.get('async', False))
         
         if not message:
             return jsonify({'error': 'Message is required'}), 400
+        if not session_id:
+            return jsonify({'error': 'Session ID is required'}), 400
         
-        # Create or get existing thread
-        #
-        # Each conversation maps to an Azure AI "thread".  When we see a brand
-        # new session we create a thread and remember its ID.  Otherwise we keep
-        # reusing the stored thread so that the agent has context for follow-up
-        # questions.
-        if session_id not in active_threads:
-            thread = project.agents.threads.create()
-            active_threads[session_id] = thread.id
-            
-            # Store thread creation to Cosmos DB
-            store_log_to_cosmos(thread.id, "thread_created", {
-                "session_id": session_id,
-                "created_at": datetime.utcnow().isoformat()
-            })
-        else:
-            thread_id = active_threads[session_id]
+        # One session lookup serves both the cache check and the thread.
+        thread_id = session_store.get(session_id)
+        cache_version = None if async_mode else response_cache_version(thread_id)
+        if cache_version:
+            cached = answer_from_cache(session_id, message, cache_version)
+            if cached:
+                return jsonify({
+                    'response': cached[1],
+                    'session_id': session_id,
+                    'cached': True
+                })
         
-        thread_id = active_threads[session_id]
+        # Create or get existing thread
+        thread_id = thread_id or get_or_create_thread(session_id, known_new=True)
         
         # Send message to the agent
-        #
-        # The agent message API mirrors the OpenAI format.  We only need to
-        # send the role and the user content—the SDK handles brooming extra
-        # metadata.
-        user_message = project.agents.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=message
-        )
+        post_user_message(thread_id, message)
         
-        # Store user message to Cosmos DB
-        store_message_to_cosmos(thread_id, {
-            "id": user_message.id,
-            "role": "user",
-            "content": [{"type": "text", "text": message}],
-            "created_at": user_message.created_at.isoformat() if user_message.created_at else datetime.utcnow().isoformat()
-        })
+        if async_mode:
+            # Start the run without waiting for it; the scheduler takes over
+            # polling so this worker thread is free for the next request.
+            with span("run_create"):
+                run = project.agents.runs.create(
+                    thread_id=thread_id,
+                    agent_id=azure_agent_id
+                )
+            handle = run_scheduler.submit(thread_id, run.id, {'session_id': session_id})
+            return jsonify({
+                'run_id': handle.run_id,
+                'thread_id': thread_id,
+                'status': handle.status,
+                'session_id': session_id
+            }), 202
         
         # Process the message with the agent
         #
         # `create_and_process` kicks off a run and blocks until it finishes.
-        # That keeps the API simple, but in higher-traffic apps you would likely
-        # move to the async pattern and poll for completion, freeing up worker
-        # threads.
-        run = project.agents.runs.create_and_process(
-            thread_id=thread_id,
-            agent_id=agent.id
-        )
+        # That keeps the API simple; clients that need to free up worker
+        # threads should send `"async": true` instead.
+        with span("run"):
+            run = project.agents.runs.create_and_process(
+                thread_id=thread_id,
+                agent_id=azure_agent_id
+            )
         
         # Store run information to Cosmos DB
-        store_run_to_cosmos(thread_id, {
-            "id": run.id,
-            "status": run.status.value if hasattr(run.status, 'value') else str(run.status),
-            "model": run.model if hasattr(run, 'model') else None,
-            "created_at": run.created_at.isoformat() if run.created_at else datetime.utcnow().isoformat(),
-            "completed_at": run.completed_at.isoformat() if hasattr(run, 'completed_at') and run.completed_at else None
-        })
+        record_run(thread_id, run)
         
         if run.status == "failed":
             return jsonify({'error': f'Agent run failed: {run.last_error}'}), 500
         
         # Get the latest messages
-        #
-        # The SDK returns messages in reverse chronological order when using
-        # `ListSortOrder.DESCENDING`.  We only need the newest assistant payload
-        # plus the user's message for context (the latter is already in memory,
-        # but fetching both keeps the flow symmetric).
-        messages = project.agents.messages.list(
-            thread_id=thread_id, 
-            order=ListSortOrder.DESCENDING,
-            limit=2  # Get last 2 messages (user + agent)
-        )
-        
-        # Find the agent's response
-        #
-        # Some agent responses may contain multiple text blocks; grabbing the
-        # last one preserves the full answer, including tool call summaries or
-        # notes the agent may append.
-        agent_response = None
-        assistant_message = None
-        for msg in messages:
-            if msg.role.value.lower() == 'assistant' and msg.text_messages:
-                agent_response = msg.text_messages[-1].text.value
-                assistant_message = msg
-                break
+        agent_response = collect_agent_response(thread_id)
         
         if not agent_response:
+            forget_thread_logs(thread_id)
             return jsonify({'error': 'No response from agent'}), 500
         
-        # Store assistant message to Cosmos DB
-        if assistant_message:
-            content_list = []
-            if assistant_message.text_messages:
-                for text_msg in assistant_message.text_messages:
-                    content_list.append({
-                        "type": "text",
-                        "text": text_msg.text.value if hasattr(text_msg.text, 'value') else str(text_msg.text)
-                    })
-            
-            store_message_to_cosmos(thread_id, {
-                "id": assistant_message.id,
-                "role": "assistant",
-                "content": content_list,
-                "created_at": assistant_message.created_at.isoformat() if assistant_message.created_at else datetime.utcnow().isoformat()
-            })
+        if cache_version:
+            response_cache.store(azure_agent_id, cache_version, message, agent_response)
         
         return jsonify({
             'response': agent_response,
@@ -300,7 +754,95 @@ def chat():
         })
         
     except Exception as e:
+        forget_thread_logs(thread_id)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Handle a chat message and stream the agent's answer as SSE."""
+    data = request.get_json()
+    message = data.get('message', '').strip()
+    session_id = data.get('session_id')
+    
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    if not session_id:
+        return jsonify({'error': 'Session ID is required'}), 400
+    
+    thread_id = None
+    try:
+        thread_id = session_store.get(session_id)
+        cache_version = response_cache_version(thread_id)
+        cached = cache_version and answer_from_cache(session_id, message, cache_version)
+        if cached:
+            events = stream_cached_answer(cached[0], session_id, cached[1])
+        else:
+            thread_id = thread_id or get_or_create_thread(session_id, known_new=True)
+            post_user_message(thread_id, message)
+            events = stream_agent_run(thread_id, session_id, message, cache_version)
+    except Exception as e:
+        forget_thread_logs(thread_id)
         return jsonify({'error': str(e)}), 500
+    
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/run-status', methods=['GET'])
+def get_run_status():
+    """Report the state of a run started with `/api/chat` in async mode.
+
+    `wait` (seconds, capped at 30) turns the call into a long poll that
+    returns as soon as the run finishes.  Pass the `thread_id` returned by
+    `/api/chat` as well so any worker can answer, not just the one that
+    started the run (other workers answer right away, without long-polling).
+    """
+    run_id = request.args.get('run_id')
+    if not run_id:
+        return jsonify({'error': 'Run ID is required'}), 400
+    
+    try:
+        wait = min(float(request.args.get('wait', 0)), 30.0)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number'}), 400
+    
+    handle = run_scheduler.get(run_id)
+    if handle:
+        if wait > 0:
+            handle.wait(wait)
+        payload = handle.to_dict()
+    else:
+        thread_id = request.args.get('thread_id')
+        if not thread_id:
+            return jsonify({'error': 'Unknown or expired run'}), 404
+        try:
+            payload = run_status_from_service(thread_id, run_id, request.args.get('session_id'))
+        except ResourceNotFoundError:
+            return jsonify({'error': 'Unknown or expired run'}), 404
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    if payload.get('error'):
+        return jsonify(payload), 500
+    return jsonify(payload)
+
+@app.route('/api/ready', methods=['GET'])
+def get_readiness():
+    """Readiness probe: 200 once the app is warm, 503 while warming up.
+
+    The instance is ready when the agent definition has been fetched and
+    Cosmos DB has finished its first connection attempt.  A failed Cosmos
+    DB connection does not block readiness, because the app then runs
+    without log persistence (and keeps retrying in the background).
+    """
+    ready = warmup.is_ready("agent") and warmup.is_settled("cosmos")
+    return jsonify({
+        'ready': ready,
+        'log_persistence': cosmos_container is not None,
+        'components': warmup.snapshot()
+    }), 200 if ready else 503
 
 @app.route('/api/new-session', methods=['POST'])
 def new_session():
@@ -318,28 +860,18 @@ def get_cosmos_stats():
                 'message': 'Cosmos DB is not configured'
             })
         
-        # Get total count of documents
-        query = "SELECT VALUE COUNT(1) FROM c"
-        total_logs = list(cosmos_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))[0]
+        if not log_stats:
+            return jsonify({'error': 'Log statistics are not available'}), 503
         
-        # Get count by type
-        query = "SELECT c.log_type, COUNT(1) as count FROM c GROUP BY c.log_type"
-        log_types = list(cosmos_container.query_items(
-            query=query,
-            enable_cross_partition_query=True
-        ))
-        
-        # Get all unique threads
-        threads = get_all_threads_from_cosmos()
+        # Served from the incrementally maintained stats document (one cached
+        # point read) rather than counting the whole container.
+        stats = log_stats.get()
         
         return jsonify({
             'enabled': True,
-            'total_logs': total_logs,
-            'total_threads': len(threads),
-            'log_types': log_types,
+            'total_logs': stats['total_logs'],
+            'total_threads': stats['total_threads'],
+            'log_types': stats['log_types'],
             'database': cosmos_database_name,
             'container': cosmos_container_name
         })
@@ -347,9 +879,131 @@ def get_cosmos_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/query-metrics', methods=['GET'])
+def get_query_metrics():
+    """Report RU charge and latency per registered Cosmos DB query."""
+    return jsonify({'queries': queries.snapshot()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint: stage and request latency histograms, RU charges."""
+    lines = stages.render() + endpoints.render()
+    query_metrics = queries.snapshot()
+    if query_metrics:
+        lines += counter_lines(
+            "cosmos_query_request_charge_total", "Cosmos DB request units consumed, per query.",
+            "query", {name: values["request_charge"] for name, values in query_metrics.items()})
+        lines += counter_lines(
+            "cosmos_query_calls_total", "Cosmos DB query executions, per query.",
+            "query", {name: values["calls"] for name, values in query_metrics.items()})
+    if log_writer:
+        writer_stats = log_writer.snapshot()
+        lines += counter_lines(
+            "cosmos_log_writer_documents_total", "Log documents processed by the background writer.",
+            "result", {"written": writer_stats["written"], "failed": writer_stats["failed"]})
+        lines += counter_lines(
+            "cosmos_log_writer_queue_depth", "Log documents waiting to be written.",
+            "writer", {"primary": writer_stats["queue_depth"]}, metric_type="gauge")
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/pool-metrics', methods=['GET'])
+def get_pool_metrics():
+    """Report HTTP connection pool utilization of the Azure clients."""
+    return jsonify({'transports': pool_snapshot()})
+
+@app.route('/api/token-cache', methods=['GET'])
+def get_token_cache_stats():
+    """Report how often requests blocked on credential token acquisition."""
+    if not isinstance(credential, CachingCredential):
+        return jsonify({'enabled': False})
+    stats = credential.snapshot()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/api/response-cache', methods=['GET'])
+def get_response_cache_stats():
+    """Report hit/miss counters of the first-turn answer cache."""
+    if not response_cache:
+        return jsonify({'enabled': False})
+    stats = response_cache.snapshot()
+    stats['enabled'] = True
+    stats['agent_version'] = agent_version
+    return jsonify(stats)
+
+@app.route('/api/thread-log-cache', methods=['GET'])
+def get_thread_log_cache_stats():
+    """Report hit/miss counters of the per-thread agent log cache."""
+    if not thread_log_cache:
+        return jsonify({'enabled': False})
+    stats = thread_log_cache.snapshot()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+@app.route('/api/daily-activity', methods=['GET'])
+def get_daily_activity():
+    """Report log counts per day and log type for a date range.
+
+    Accepts `start` and `end` (`YYYY-MM-DD`, inclusive; both default to
+    today).  Needs `COSMOS_BY_DAY_ENABLED=true`.
+    """
+    if not daily_logs:
+        return jsonify({
+            'enabled': False,
+            'days': [],
+            'message': 'The by-day log container is not enabled'
+        })
+
+    today = datetime.utcnow().date().isoformat()
+    start = request.args.get('start', today)
+    end = request.args.get('end', start if 'start' in request.args else today)
+    try:
+        days = daily_logs.daily_counts(start, end)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'enabled': True,
+        'start': start,
+        'end': end,
+        'days': days,
+        'container': cosmos_by_day_container_name
+    })
+
+@app.route('/api/run-analytics', methods=['GET'])
+def get_run_analytics():
+    """Report run latency, failure rates and message volumes per model and hour.
+
+    Reads the hourly rollups kept by the change feed processor
+    (`python run_analytics.py`) for the last `hours` hours (default 24).
+    """
+    if not thread_summaries:
+        return jsonify({
+            'enabled': False,
+            'message': 'Cosmos DB is not configured'
+        })
+
+    try:
+        hours = min(max(int(request.args.get('hours', 24)), 1), 24 * 31)
+    except ValueError:
+        return jsonify({'error': 'hours must be an integer'}), 400
+    try:
+        analytics = summarize_rollups(read_rollups(thread_summaries.container, hours))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    analytics['enabled'] = True
+    analytics['hours_requested'] = hours
+    return jsonify(analytics)
+
 @app.route('/api/all-threads', methods=['GET'])
 def get_all_threads():
-    """Retrieve all thread IDs stored in Cosmos DB."""
+    """List thread summaries, most recently active first.
+
+    Accepts `page_size` (default 50, max 200) and the `continuation` token
+    returned by the previous page.
+    """
     try:
         if not cosmos_container:
             return jsonify({
@@ -358,114 +1012,186 @@ def get_all_threads():
                 'message': 'Cosmos DB is not configured'
             })
         
-        threads = get_all_threads_from_cosmos()
+        if not thread_summaries:
+            return jsonify({'error': 'Thread summaries are not available'}), 503
         
-        # Get summary for each thread
-        thread_summaries = []
-        for thread_id in threads[:50]:  # Limit to 50 for performance
-            logs = get_logs_from_cosmos(thread_id)
-            message_count = len([log for log in logs if log.get('log_type') == 'message'])
-            
-            # Get first and last timestamp
-            timestamps = [log.get('timestamp') for log in logs if log.get('timestamp')]
-            first_activity = min(timestamps) if timestamps else None
-            last_activity = max(timestamps) if timestamps else None
-            
-            thread_summaries.append({
-                'thread_id': thread_id,
-                'message_count': message_count,
-                'total_logs': len(logs),
-                'first_activity': first_activity,
-                'last_activity': last_activity
-            })
+        try:
+            page_size = max(1, min(int(request.args.get('page_size', 50)), 200))
+        except ValueError:
+            return jsonify({'error': 'page_size must be an integer'}), 400
+        continuation = request.args.get('continuation') or None
         
-        return jsonify({
+        # One ordered, paginated query over the materialized summaries
+        # replaces the old DISTINCT + per-thread log scans.
+        try:
+            summaries, next_continuation = thread_summaries.list_page(page_size, continuation)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = {
             'enabled': True,
-            'threads': thread_summaries,
-            'total_threads': len(threads)
-        })
+            'threads': summaries,
+            'continuation': next_continuation
+        }
+        if not continuation:
+            response['total_threads'] = thread_summaries.count()
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def list_agent_items(list_method, thread_id, after=None, page_size=None):
+    """List thread messages or runs oldest first, starting after `after`.
+
+    The Agents API pages with an `after` object ID, which the SDK exposes as
+    the `by_page` continuation token, so an earlier item ID works as a cursor.
+    With `page_size` only one page is fetched.
+    """
+    pages = list_method(
+        thread_id=thread_id,
+        order=ListSortOrder.ASCENDING,
+        limit=page_size
+    ).by_page(continuation_token=after)
+    if page_size:
+        return list(next(pages, []))
+    return [item for page in pages for item in page]
+
+def fetch_agent_logs(thread_id, since=None, run_since=None, page_size=None):
+    """List a thread's messages and runs concurrently, formatted for the logs panel.
+
+    With the thread log cache enabled, a client without cursors gets the
+    whole thread listed and cached (once all its runs have finished), then
+    sliced like the API would page it.  A client with cursors the cache
+    cannot serve, or any client while a run is pending, only gets what comes
+    after its cursors, so a refresh never lists the whole thread again.
+    """
+    full_listing = (thread_log_cache is not None and not since and not run_since
+                    and not thread_log_cache.run_pending(thread_id))
+    started = time.monotonic()
+    # Runs are listed on the pool while this thread lists the messages.
+    runs_future = agent_list_pool.submit(
+        contextvars.copy_context().run, list_agent_items, project.agents.runs.list, thread_id,
+        None if full_listing else run_since, None if full_listing else page_size)
+    with span("thread_logs_list"):
+        messages = list_agent_items(project.agents.messages.list, thread_id,
+                                    None if full_listing else since, None if full_listing else page_size)
+        runs = runs_future.result()
+    logs = [format_agent_message(msg) for msg in messages]
+    run_info = [format_agent_run(run) for run in runs]
+    if not full_listing:
+        return logs, run_info
+    
+    if all(run['status'].lower() in TERMINAL_STATUSES for run in run_info):
+        thread_log_cache.fill(thread_id, logs, run_info, started)
+    return page_after(logs, since, page_size) or [], page_after(run_info, run_since, page_size) or []
+
+def stream_json_logs(logs, fields):
+    """Stream a `{..., "logs": [...], "total_messages": n}` JSON body.
+
+    Log documents are written out as the query iterator yields them instead
+    of being collected into one big list first.
+    """
+    yield json.dumps(fields)[:-1] + ', "logs": ['
+    total_messages = 0
+    try:
+        for index, log in enumerate(logs):
+            if log.get('log_type') == 'message':
+                total_messages += 1
+            yield (',' if index else '') + json.dumps(log)
+    except Exception as e:
+        print(f"Error retrieving logs from Cosmos DB: {e}")
+    yield f'], "total_messages": {total_messages}}}'
+
 @app.route('/api/thread-logs', methods=['POST'])
 def get_thread_logs():
-    """Retrieve all messages/logs from the current agent thread."""
+    """Retrieve messages/logs from the current agent thread.
+
+    Optional fields make the call incremental and paginated:
+
+    * `since` – only return entries after this cursor.  Use the `cursor`
+      from the previous response: a log timestamp for `source=cosmos`, a
+      message ID for `source=agent` (runs use `run_since`/`run_cursor`).
+      Cosmos reads overlap the cursor slightly, so dedupe by `id`.
+    * `page_size` – return at most this many entries.  More are available
+      when the response carries a Cosmos `continuation` token (pass it back
+      with the same `since`) or `has_more` (call again with `since=cursor`).
+    """
     try:
         data = request.get_json()
         session_id = data.get('session_id')
         source = data.get('source', 'agent')  # 'agent' or 'cosmos'
+        since = data.get('since') or None
+        continuation = data.get('continuation') or None
+        page_size = data.get('page_size')
         
         if not session_id:
             return jsonify({'error': 'Session ID is required'}), 400
         
+        if page_size is not None:
+            try:
+                page_size = max(1, min(int(page_size), 500))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'page_size must be an integer'}), 400
+        
         # Check if thread exists for this session
-        if session_id not in active_threads:
+        thread_id = session_store.get(session_id)
+        if not thread_id:
             return jsonify({'logs': [], 'thread_id': None, 'source': source})
         
-        thread_id = active_threads[session_id]
-        
         # If requesting from Cosmos DB
         if source == 'cosmos' and cosmos_container:
-            cosmos_logs = get_logs_from_cosmos(thread_id)
+            if not page_size:
+                # Unpaged: stream the whole (or remaining, with `since`)
+                # thread straight from the query iterator.
+                return Response(
+                    stream_json_logs(get_logs_from_cosmos(thread_id, rewind_cursor(since, cosmos_cursor_overlap)), {
+                        'thread_id': thread_id,
+                        'source': 'cosmos'
+                    }),
+                    mimetype='application/json'
+                )
+            
+            cosmos_logs, next_continuation = get_logs_page_from_cosmos(
+                thread_id, page_size, continuation, rewind_cursor(since, cosmos_cursor_overlap))
+            cursor = max([since or ''] + [log.get('timestamp', '') for log in cosmos_logs]) or None
             return jsonify({
                 'logs': cosmos_logs,
                 'thread_id': thread_id,
                 'source': 'cosmos',
+                'continuation': next_continuation,
+                'cursor': cursor,
                 'total_messages': len([log for log in cosmos_logs if log.get('log_type') == 'message'])
             })
         
-        # Retrieve all messages from the thread
-        # Using ASCENDING order to show messages from oldest to newest
-        messages = project.agents.messages.list(
-            thread_id=thread_id,
-            order=ListSortOrder.ASCENDING
-        )
+        # Messages and runs of the thread, oldest to newest, after the
+        # client's cursors so a refresh only transfers what is new.  They
+        # come from the thread log cache when possible; otherwise only what
+        # follows the cursors is listed (see `fetch_agent_logs`).
+        run_since = data.get('run_since') or None
+        logs = run_info = None
+        cached = thread_log_cache.get(thread_id) if thread_log_cache else None
+        if cached:
+            logs = page_after(cached[0], since, page_size)
+            run_info = page_after(cached[1], run_since, page_size)
+        if logs is None or run_info is None:
+            logs, run_info = fetch_agent_logs(thread_id, since, run_since, page_size)
         
-        # Format messages for frontend display
-        logs = []
-        for msg in messages:
-            log_entry = {
-                'id': msg.id,
-                'role': msg.role.value if hasattr(msg.role, 'value') else str(msg.role),
-                'created_at': msg.created_at.isoformat() if msg.created_at else None,
-                'content': []
-            }
-            
-            # Extract text content
-            if msg.text_messages:
-                for text_msg in msg.text_messages:
-                    log_entry['content'].append({
-                        'type': 'text',
-                        'text': text_msg.text.value if hasattr(text_msg.text, 'value') else str(text_msg.text)
-                    })
-            
-            # Include file citations if present
-            if hasattr(msg, 'file_citations') and msg.file_citations:
-                log_entry['file_citations'] = [
-                    {'file_id': citation.file_id} 
-                    for citation in msg.file_citations
-                ]
-            
-            logs.append(log_entry)
-        
-        # Get run information for the thread
-        runs = project.agents.runs.list(thread_id=thread_id)
-        run_info = []
-        for run in runs:
-            run_info.append({
-                'id': run.id,
-                'status': run.status.value if hasattr(run.status, 'value') else str(run.status),
-                'created_at': run.created_at.isoformat() if run.created_at else None,
-                'completed_at': run.completed_at.isoformat() if hasattr(run, 'completed_at') and run.completed_at else None,
-                'model': run.model if hasattr(run, 'model') else None
-            })
+        # The run cursor only advances past finished runs so that
+        # in-progress runs are fetched again.
+        run_cursor = run_since
+        for run in run_info:
+            if run['status'].lower() not in TERMINAL_STATUSES:
+                break
+            run_cursor = run['id']
         
         return jsonify({
             'logs': logs,
             'thread_id': thread_id,
             'run_info': run_info,
-            'total_messages': len(logs)
+            'total_messages': len(logs),
+            'cursor': logs[-1]['id'] if logs else since,
+            'run_cursor': run_cursor,
+            'has_more': bool(page_size) and (len(logs) == page_size or len(run_info) == page_size)
         })
         
     except Exception as e:
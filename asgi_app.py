@@ -0,0 +1,483 @@
+"""ASGI variant of the chat app on the asyncio Azure SDK clients.
+
+app.py is a WSGI app on the synchronous SDKs: every in-flight request holds
+an OS thread while it waits on the agent, and a worker can only serve as many
+chats at once as it has threads.  This module serves the same frontend and
+the same endpoints with the same response shapes, built on Quart (the
+asyncio port of Flask) and the `aio` clients of `azure-ai-projects`,
+`azure-cosmos` and `azure-identity`, so one process handles many concurrent
+chats on a single event loop.  Independent I/O is issued concurrently:
+
+* Cosmos DB log writes run as background tasks (`AsyncCosmosLogWriter`) and
+  overlap with the next agent call instead of preceding it;
+* `/api/thread-logs` lists the thread's messages and runs at the same time;
+* `/api/all-threads` reads the first page and the total count together.
+
+Configuration is the same environment as app.py.  Run it with an ASGI
+server, e.g.:
+
+    hypercorn asgi_app:app --bind 0.0.0.0:8000 --workers 2
+
+Only the endpoints the chat UI uses are served here: `/`,
+`/api/new-session`, `/api/chat` (without `"async": true`),
+`/api/chat/stream`, `/api/thread-logs`, `/api/all-threads` and
+`/api/cosmos-stats`.  The response cache, the by-day container and the
+metrics endpoints stay in app.py.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+from quart import Quart, Response, jsonify, render_template, request
+from azure.ai.agents.models import ListSortOrder
+from azure.cosmos import PartitionKey
+from azure.identity.aio import DefaultAzureCredential
+
+from agent_logs import RunStream, ThreadLogger, format_agent_message, format_agent_run, log_document
+from client_factory import create_async_cosmos_client, create_async_project_client
+from cosmos_provisioning import (
+    LOG_INDEXING_POLICY,
+    SUMMARY_INDEXING_POLICY,
+    provision_container_async,
+    retention_ttl,
+)
+from cosmos_queries import queries
+from cosmos_stats import AsyncCosmosStats, reconcile_interval
+from log_format import decode, rewind_cursor, store_format, thread_logs_query
+from log_writer import AsyncCosmosLogWriter
+from run_scheduler import TERMINAL_STATUSES, run_status_value
+from session_store import AsyncCachedSessionStore, AsyncCosmosSessionStore, AsyncInMemorySessionStore
+from thread_summaries import AsyncThreadSummaryStore
+
+load_dotenv()
+
+app = Quart(__name__)
+
+azure_endpoint = os.getenv("AZURE_ENDPOINT")
+azure_agent_id = os.getenv("AZURE_AGENT_ID")
+
+if not azure_endpoint or not azure_agent_id:
+    raise ValueError("Please set AZURE_ENDPOINT and AZURE_AGENT_ID environment variables")
+
+cosmos_endpoint = os.getenv("COSMOS_ENDPOINT")
+cosmos_key = os.getenv("COSMOS_KEY")
+cosmos_database_name = os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB")
+cosmos_container_name = os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs")
+cosmos_sessions_container_name = os.getenv("COSMOS_SESSIONS_CONTAINER_NAME", "Sessions")
+cosmos_summaries_container_name = os.getenv("COSMOS_SUMMARIES_CONTAINER_NAME", "ThreadSummaries")
+session_store_backend = os.getenv("SESSION_STORE", "memory").lower()
+cosmos_cursor_overlap = float(os.getenv("COSMOS_LOG_CURSOR_OVERLAP", "5"))
+
+# Clients and stores
+#
+# The aio clients and their aiohttp sessions belong to the event loop that
+# creates them, so they are built in `startup()` rather than at import time.
+credential = None
+project = None
+cosmos_client = None
+cosmos_container = None
+thread_summaries = None
+log_stats = None
+log_writer = None
+session_store = None
+
+@app.before_serving
+async def startup():
+    """Create the async clients and connect to Cosmos DB."""
+    global credential, project, session_store
+    credential = DefaultAzureCredential()
+    project = create_async_project_client(azure_endpoint, credential)
+    session_store = build_session_store(AsyncInMemorySessionStore())
+
+    if cosmos_endpoint and cosmos_key:
+        try:
+            await init_cosmos()
+        except Exception as e:
+            print(f"⚠ Warning: Could not connect to Cosmos DB: {e}")
+            print("  Logs will not be persisted.")
+    else:
+        print("⚠ Warning: Cosmos DB credentials not provided. Logs will not be persisted.")
+
+@app.after_serving
+async def shutdown():
+    """Finish pending log writes and close the clients."""
+    if log_writer:
+        await log_writer.close()
+    if log_stats:
+        await log_stats.close()
+    if cosmos_client:
+        await cosmos_client.close()
+    await project.close()
+    await credential.close()
+
+async def init_cosmos():
+    """Provision the containers and start the log writer and stats."""
+    global cosmos_client, cosmos_container, thread_summaries, log_stats, log_writer, session_store
+
+    client = create_async_cosmos_client(cosmos_endpoint, cosmos_key)
+    try:
+        database = await client.create_database_if_not_exists(id=cosmos_database_name)
+        container = await provision_container_async(
+            database, cosmos_container_name, "/thread_id", LOG_INDEXING_POLICY, retention_ttl())
+        summaries_container = await provision_container_async(
+            database, cosmos_summaries_container_name, "/partition", SUMMARY_INDEXING_POLICY, retention_ttl())
+        sessions_container = None
+        if session_store_backend == "cosmos":
+            sessions_container = await database.create_container_if_not_exists(
+                id=cosmos_sessions_container_name,
+                partition_key=PartitionKey(path="/session_id")
+            )
+    except Exception:
+        await client.close()
+        raise
+
+    thread_summaries = AsyncThreadSummaryStore(summaries_container)
+    log_stats = AsyncCosmosStats(
+        summaries_container,
+        container,
+        flush_interval=float(os.getenv("COSMOS_STATS_FLUSH_INTERVAL", "5")),
+        cache_ttl=float(os.getenv("COSMOS_STATS_CACHE_TTL", "10")),
+        reconcile_interval=reconcile_interval()
+    )
+    log_stats.start()
+    log_writer = AsyncCosmosLogWriter(
+        container, max_concurrency=int(os.getenv("COSMOS_ASYNC_WRITE_CONCURRENCY", "32")),
+        max_pending=int(os.getenv("COSMOS_ASYNC_MAX_PENDING_WRITES", "1000")),
+        encode=store_format)
+    log_writer.add_listener(thread_summaries.apply)
+    log_writer.add_listener(log_stats.record)
+    if sessions_container is not None:
+        session_store = build_session_store(AsyncCosmosSessionStore(sessions_container))
+
+    cosmos_client = client
+    cosmos_container = container
+    print(f"✓ Connected to Cosmos DB: {cosmos_database_name}/{cosmos_container_name}")
+
+def build_session_store(backend):
+    """Wrap a session store backend in the LRU cache, if enabled."""
+    session_cache_size = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+    if session_cache_size > 0:
+        return AsyncCachedSessionStore(
+            backend,
+            max_entries=session_cache_size,
+            ttl=float(os.getenv("SESSION_CACHE_TTL", "300"))
+        )
+    return backend
+
+# Cosmos DB helpers
+#
+# Writes are started in the background and never awaited by the request, so
+# a log write overlaps with whatever agent call comes next.
+def store_log_to_cosmos(thread_id, log_type, log_data):
+    """Start writing a log entry to Cosmos DB."""
+    if not cosmos_container:
+        return False
+    return log_writer.submit(log_document(thread_id, log_type, log_data))
+
+thread_logger = ThreadLogger(store_log_to_cosmos)
+
+# Chat pipeline helpers
+async def get_or_create_thread(session_id):
+    """Return the agent thread ID for a session, creating the thread if needed."""
+    if log_writer:
+        # Every chat starts here and writes a few logs; hold new chats while
+        # earlier writes are backed up.
+        await log_writer.wait_for_room()
+
+    async def create_thread():
+        thread = await project.agents.threads.create()
+        store_log_to_cosmos(thread.id, "thread_created", {
+            "session_id": session_id,
+            "created_at": datetime.utcnow().isoformat()
+        })
+        return thread.id
+
+    return await session_store.get_or_create(session_id, create_thread)
+
+async def post_user_message(thread_id, message):
+    """Send the user's message to the agent thread and log it."""
+    user_message = await project.agents.messages.create(
+        thread_id=thread_id,
+        role="user",
+        content=message
+    )
+    thread_logger.user_message(thread_id, user_message, message)
+    return user_message
+
+async def collect_agent_response(thread_id):
+    """Fetch the newest assistant message, log it, and return its text."""
+    messages = project.agents.messages.list(
+        thread_id=thread_id,
+        order=ListSortOrder.DESCENDING,
+        limit=2
+    )
+    async for msg in messages:
+        if msg.role.value.lower() == 'assistant' and msg.text_messages:
+            thread_logger.assistant_message(thread_id, msg)
+            return msg.text_messages[-1].text.value
+    return None
+
+async def list_agent_items(list_method, thread_id, after=None, page_size=None):
+    """List thread messages or runs oldest first, starting after `after`."""
+    pages = list_method(
+        thread_id=thread_id,
+        order=ListSortOrder.ASCENDING,
+        limit=page_size
+    ).by_page(continuation_token=after)
+    items = []
+    async for page in pages:
+        items.extend([item async for item in page])
+        if page_size:
+            break
+    return items
+
+async def stream_agent_run(thread_id, session_id):
+    """Run the agent with streaming and yield SSE frames as output arrives."""
+    run_stream = RunStream(thread_id, session_id, thread_logger.assistant_message, thread_logger.run)
+    yield run_stream.start()
+
+    try:
+        async with await project.agents.runs.stream(thread_id=thread_id, agent_id=azure_agent_id) as stream:
+            async for event_type, event_data, _ in stream:
+                frame = run_stream.event(event_type, event_data)
+                if frame:
+                    yield frame
+                if run_stream.failed:
+                    return
+    except Exception as e:
+        yield run_stream.error(str(e))
+        return
+
+    yield run_stream.finish()
+
+async def stream_json_logs(logs, fields):
+    """Stream a `{..., "logs": [...], "total_messages": n}` JSON body of decoded logs."""
+    yield json.dumps(fields)[:-1] + ', "logs": ['
+    total_messages = 0
+    index = 0
+    try:
+        async for log in logs:
+            log = decode(log)
+            if log.get('log_type') == 'message':
+                total_messages += 1
+            yield (',' if index else '') + json.dumps(log)
+            index += 1
+    except Exception as e:
+        print(f"Error retrieving logs from Cosmos DB: {e}")
+    yield f'], "total_messages": {total_messages}}}'
+
+# Routes
+@app.route('/')
+async def index():
+    """Render the main chat interface template."""
+    return await render_template('index.html')
+
+@app.route('/api/new-session', methods=['POST'])
+async def new_session():
+    """Create a new chat session identifier for the frontend."""
+    return jsonify({'session_id': str(uuid.uuid4())})
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    """Handle chat messages from the browser client."""
+    try:
+        data = await request.get_json()
+        message = data.get('message', '').strip()
+        session_id = data.get('session_id')
+
+        if not message:
+            return jsonify({'error': 'Message is required'}), 400
+        if not session_id:
+            return jsonify({'error': 'Session ID is required'}), 400
+        if data.get('async'):
+            return jsonify({'error': 'Async runs are only supported by app.py'}), 400
+
+        thread_id = await get_or_create_thread(session_id)
+        await post_user_message(thread_id, message)
+
+        run = await project.agents.runs.create_and_process(
+            thread_id=thread_id,
+            agent_id=azure_agent_id
+        )
+        # Written in the background while the answer is fetched.
+        thread_logger.run(thread_id, run)
+
+        if run.status == "failed":
+            return jsonify({'error': f'Agent run failed: {run.last_error}'}), 500
+
+        agent_response = await collect_agent_response(thread_id)
+        if not agent_response:
+            return jsonify({'error': 'No response from agent'}), 500
+
+        return jsonify({
+            'response': agent_response,
+            'session_id': session_id
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/chat/stream', methods=['POST'])
+async def chat_stream():
+    """Handle a chat message and stream the agent's answer as SSE."""
+    data = await request.get_json()
+    message = data.get('message', '').strip()
+    session_id = data.get('session_id')
+
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    if not session_id:
+        return jsonify({'error': 'Session ID is required'}), 400
+
+    try:
+        thread_id = await get_or_create_thread(session_id)
+        await post_user_message(thread_id, message)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return Response(
+        stream_agent_run(thread_id, session_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/cosmos-stats', methods=['GET'])
+async def get_cosmos_stats():
+    """Get statistics about stored logs in Cosmos DB."""
+    try:
+        if not cosmos_container:
+            return jsonify({
+                'enabled': False,
+                'message': 'Cosmos DB is not configured'
+            })
+
+        stats = await log_stats.get()
+        return jsonify({
+            'enabled': True,
+            'total_logs': stats['total_logs'],
+            'total_threads': stats['total_threads'],
+            'log_types': stats['log_types'],
+            'database': cosmos_database_name,
+            'container': cosmos_container_name
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/all-threads', methods=['GET'])
+async def get_all_threads():
+    """List thread summaries, most recently active first."""
+    try:
+        if not cosmos_container:
+            return jsonify({
+                'enabled': False,
+                'threads': [],
+                'message': 'Cosmos DB is not configured'
+            })
+
+        try:
+            page_size = max(1, min(int(request.args.get('page_size', 50)), 200))
+        except ValueError:
+            return jsonify({'error': 'page_size must be an integer'}), 400
+        continuation = request.args.get('continuation') or None
+
+        response = {'enabled': True}
+        if continuation:
+            try:
+                page = await thread_summaries.list_page(page_size, continuation)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            # The first page also reports the total; both queries at once.
+            page, response['total_threads'] = await asyncio.gather(
+                thread_summaries.list_page(page_size), thread_summaries.count())
+        response['threads'], response['continuation'] = page
+        return jsonify(response)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/thread-logs', methods=['POST'])
+async def get_thread_logs():
+    """Retrieve messages/logs from the current agent thread.
+
+    Accepts the same fields as app.py: `source`, `since`, `run_since`,
+    `continuation` and `page_size`.
+    """
+    try:
+        data = await request.get_json()
+        session_id = data.get('session_id')
+        source = data.get('source', 'agent')
+        since = data.get('since') or None
+        continuation = data.get('continuation') or None
+        page_size = data.get('page_size')
+
+        if not session_id:
+            return jsonify({'error': 'Session ID is required'}), 400
+
+        if page_size is not None:
+            try:
+                page_size = max(1, min(int(page_size), 500))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'page_size must be an integer'}), 400
+
+        thread_id = await session_store.get(session_id)
+        if not thread_id:
+            return jsonify({'logs': [], 'thread_id': None, 'source': source})
+
+        if source == 'cosmos' and cosmos_container:
+            name, parameters = thread_logs_query(thread_id, rewind_cursor(since, cosmos_cursor_overlap))
+            if not page_size:
+                logs = queries.iterate_async(cosmos_container, name, parameters, partition_key=thread_id)
+                return Response(
+                    stream_json_logs(logs, {'thread_id': thread_id, 'source': 'cosmos'}),
+                    mimetype='application/json'
+                )
+
+            cosmos_logs, next_continuation = await queries.page_async(
+                cosmos_container, name, parameters, partition_key=thread_id,
+                page_size=page_size, continuation=continuation)
+            cosmos_logs = [decode(log) for log in cosmos_logs]
+            cursor = max([since or ''] + [log.get('timestamp', '') for log in cosmos_logs]) or None
+            return jsonify({
+                'logs': cosmos_logs,
+                'thread_id': thread_id,
+                'source': 'cosmos',
+                'continuation': next_continuation,
+                'cursor': cursor,
+                'total_messages': len([log for log in cosmos_logs if log.get('log_type') == 'message'])
+            })
+
+        # Messages and runs are independent, so both lists are fetched at once.
+        run_since = data.get('run_since') or None
+        messages, runs = await asyncio.gather(
+            list_agent_items(project.agents.messages.list, thread_id, since, page_size),
+            list_agent_items(project.agents.runs.list, thread_id, run_since, page_size)
+        )
+        logs = [format_agent_message(msg) for msg in messages]
+        run_info = [format_agent_run(run) for run in runs]
+        run_cursor = run_since
+        for run in runs:
+            if run_status_value(run) not in TERMINAL_STATUSES:
+                break
+            run_cursor = run.id
+
+        return jsonify({
+            'logs': logs,
+            'thread_id': thread_id,
+            'run_info': run_info,
+            'total_messages': len(logs),
+            'cursor': logs[-1]['id'] if logs else since,
+            'run_cursor': run_cursor,
+            'has_more': bool(page_size) and (len(logs) == page_size or len(runs) == page_size)
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+if __name__ == '__main__':
+    app.run(debug=True, host='0.0.0.0', port=5000)
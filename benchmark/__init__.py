@@ -0,0 +1 @@
+"""Offline load testing for the chat app; see load_test.py."""
@@ -0,0 +1,899 @@
+"""In-process stand-ins for the Azure AI Agents and Cosmos DB clients.
+
+They implement just the surface app.py and its helper modules use, with
+configurable latency, failures and throttling, so the whole app can be
+driven at high concurrency without touching Azure.  Latencies are real
+`time.sleep` calls, which release the GIL the way network I/O does.  The
+`Async*` wrappers at the end give asgi_app.py the same fakes behind the
+`aio` client surface.
+
+Cosmos DB queries are not parsed: every statement registered in
+`cosmos_queries.QUERIES` has a small Python implementation below, looked up
+by its text.  A query without one raises `NotImplementedError`, which is the
+cue to add it here when adding it to the registry.
+
+Request unit charges follow a rough model (point read 1 RU, writes ~6 RU
+plus size, queries by items and bytes returned).  They are good for comparing two
+runs of the same benchmark, not for capacity planning.  The size term of
+query charges came with the compact log format, so `--baseline` reports
+recorded before it charge queries less and are not comparable.
+"""
+
+import asyncio
+import contextlib
+import copy
+import itertools
+import json
+import operator
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+
+from azure.ai.agents.models import (
+    Agent,
+    AgentStreamEvent,
+    AgentThread,
+    MessageDeltaChunk,
+    ThreadMessage,
+    ThreadRun,
+)
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError
+from azure.core.paging import ItemPaged
+from azure.cosmos import exceptions
+
+from cosmos_queries import CROSS_PARTITION, PARTITION, QUERIES
+
+
+class _Latency:
+    """Sleep around a base latency with ±50% jitter."""
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            jitter = self._random.uniform(0.5, 1.5)
+        time.sleep(seconds * jitter)
+
+    def chance(self, probability):
+        with self._lock:
+            return self._random.random() < probability
+
+
+# Cosmos DB -----------------------------------------------------------------
+
+
+class FakeCosmosClient:
+    """Drop-in for `CosmosClient` that keeps every container in memory.
+
+    `latency` maps an operation kind ("read", "write", "batch", "query") to
+    seconds; `throttle_rate` is the share of calls that get a 429 first and
+    are retried after `retry_after` seconds, like the SDK's own throttle
+    retry.  Each container's change feed is split into `feed_ranges`
+    partition key ranges.
+    """
+
+    def __init__(self, latency=None, throttle_rate=0.0, retry_after=0.01, max_retries=9, seed=None,
+                 feed_ranges=4):
+        self.latency = {"read": 0.004, "write": 0.006, "batch": 0.01, "query": 0.008}
+        self.latency.update(latency or {})
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+        self.feed_ranges = feed_ranges
+        self._timer = _Latency(seed)
+        self._databases = {}
+        self._lock = threading.Lock()
+        self.request_charge = Counter()
+        self.operations = Counter()
+        self.throttled = 0
+
+    def create_database_if_not_exists(self, id, **kwargs):
+        with self._lock:
+            return self._databases.setdefault(id, FakeDatabase(self, id))
+
+    def get_database_client(self, database):
+        return self.create_database_if_not_exists(database)
+
+    def snapshot(self):
+        """Return operation counts, RU charges per operation and throttles."""
+        with self._lock:
+            return {
+                "operations": dict(self.operations),
+                "request_charge": {key: round(value, 2) for key, value in self.request_charge.items()},
+                "total_request_charge": round(sum(self.request_charge.values()), 2),
+                "throttled": self.throttled
+            }
+
+    def _call(self, operation, kind, charge):
+        """Apply throttling and latency, then account for the call."""
+        for _ in range(self.max_retries + 1):
+            if not self._timer.chance(self.throttle_rate):
+                break
+            with self._lock:
+                self.throttled += 1
+            time.sleep(self.retry_after)
+        else:
+            raise exceptions.CosmosHttpResponseError(status_code=429, message="Request rate is large")
+        self._timer.sleep(self.latency[kind])
+        with self._lock:
+            self.operations[operation] += 1
+            self.request_charge[operation] += charge
+        return {"x-ms-request-charge": str(round(charge, 2))}
+
+
+class FakeDatabase:
+    def __init__(self, client, id):
+        self.client = client
+        self.id = id
+        self._containers = {}
+        self._lock = threading.Lock()
+
+    def create_container_if_not_exists(self, id, partition_key, **kwargs):
+        with self._lock:
+            if id not in self._containers:
+                self._containers[id] = FakeContainer(self.client, id, partition_key["paths"], kwargs)
+            return self._containers[id]
+
+    def get_container_client(self, container):
+        return self._containers[container]
+
+    def replace_container(self, container, partition_key, **kwargs):
+        container.properties.update(kwargs)
+        return container
+
+
+class _Response:
+    """Just enough of a pipeline response for `raw_response_hook`."""
+
+    def __init__(self, headers, status_code=200):
+        self.http_response = type("HttpResponse", (), {"headers": headers, "status_code": status_code})()
+
+
+class FakeContainer:
+    """In-memory container with partition-scoped point operations and queries.
+
+    Every write stamps the document with a new `_lsn`, which orders the
+    change feed (latest version of each document, like the real one).
+    """
+
+    def __init__(self, client, id, partition_key_path, properties):
+        self.client = client
+        self.id = id
+        self.paths = partition_key_path if isinstance(partition_key_path, list) else [partition_key_path]
+        self.properties = dict(properties)
+        self.container_link = f"dbs/fake/colls/{id}"
+        self.client_connection = _FakeConnection(client.feed_ranges)
+        self._items = {}
+        self._lsn = 0
+        self._lock = threading.Lock()
+
+    def read(self):
+        return {
+            "indexingPolicy": self.properties.get("indexing_policy", {}),
+            "defaultTtl": self.properties.get("default_ttl")
+        }
+
+    # Point operations ------------------------------------------------------
+
+    def read_item(self, item, partition_key, response_hook=None, **kwargs):
+        headers = self.client._call("read_item", "read", 1.0)
+        with self._lock:
+            document = self._items.get((self._key_value(partition_key), item))
+        if document is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{item} not found")
+        return self._respond(copy.deepcopy(document), headers, response_hook)
+
+    def create_item(self, body, response_hook=None, **kwargs):
+        headers = self.client._call("create_item", "write", _write_charge(body))
+        key = (self._partition_of(body), body["id"])
+        with self._lock:
+            if key in self._items:
+                raise exceptions.CosmosResourceExistsError(status_code=409, message=f"{body['id']} exists")
+            document = self._store(key, body)
+        return self._respond(document, headers, response_hook)
+
+    def upsert_item(self, body, response_hook=None, **kwargs):
+        headers = self.client._call("upsert_item", "write", _write_charge(body))
+        with self._lock:
+            document = self._store((self._partition_of(body), body["id"]), body)
+        return self._respond(document, headers, response_hook)
+
+    def replace_item(self, item, body, etag=None, match_condition=None, response_hook=None, **kwargs):
+        headers = self.client._call("replace_item", "write", _write_charge(body))
+        key = (self._partition_of(body), item)
+        with self._lock:
+            current = self._items.get(key)
+            if current is None:
+                raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{item} not found")
+            if match_condition == MatchConditions.IfNotModified and current.get("_etag") != etag:
+                raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="etag mismatch")
+            document = self._store(key, body)
+        return self._respond(document, headers, response_hook)
+
+    def patch_item(self, item, partition_key, patch_operations, filter_predicate=None,
+                   response_hook=None, **kwargs):
+        headers = self.client._call("patch_item", "write", 6.0 + 0.5 * len(patch_operations))
+        key = (self._key_value(partition_key), item)
+        with self._lock:
+            document = self._store(key, self._patched(key, patch_operations, filter_predicate))
+        return self._respond(document, headers, response_hook)
+
+    def delete_item(self, item, partition_key, etag=None, match_condition=None, response_hook=None, **kwargs):
+        headers = self.client._call("delete_item", "write", 5.7)
+        key = (self._key_value(partition_key), item)
+        with self._lock:
+            current = self._items.get(key)
+            if current is None:
+                raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{item} not found")
+            if match_condition == MatchConditions.IfNotModified and current.get("_etag") != etag:
+                raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="etag mismatch")
+            del self._items[key]
+        self._respond(None, headers, response_hook)
+
+    def execute_item_batch(self, batch_operations, partition_key, response_hook=None, **kwargs):
+        charge = sum(_write_charge(args[-1]) for _, args, *_ in batch_operations)
+        headers = self.client._call("execute_item_batch", "batch", charge)
+        partition = self._key_value(partition_key)
+        with self._lock:
+            # All or nothing: every operation is validated before any is stored.
+            staged = []
+            for index, (operation, args, *options) in enumerate(batch_operations):
+                options = options[0] if options else {}
+                try:
+                    if operation in ("upsert", "create"):
+                        body = args[0]
+                        if operation == "create" and (partition, body["id"]) in self._items:
+                            raise exceptions.CosmosResourceExistsError(status_code=409, message="exists")
+                        staged.append(((partition, body["id"]), body))
+                    elif operation == "patch":
+                        key = (partition, args[0])
+                        current = dict(staged).get(key)
+                        staged.append((key, self._patched(key, args[1], options.get("filter_predicate"),
+                                                          current)))
+                    else:
+                        raise NotImplementedError(f"Batch operation '{operation}' is not faked")
+                except exceptions.CosmosHttpResponseError as e:
+                    raise exceptions.CosmosBatchOperationError(
+                        error_index=index, headers=headers, status_code=e.status_code,
+                        message=str(e), operation_responses=[])
+            results = [self._store(key, body) for key, body in staged]
+        return self._respond(results, headers, response_hook)
+
+    def query_items_change_feed(self, partition_key_range_id=None, is_start_from_beginning=False,
+                                continuation=None, max_item_count=None, start_time=None,
+                                raw_response_hook=None, **kwargs):
+        if continuation:
+            after = int(continuation)
+        elif is_start_from_beginning:
+            after = 0
+        elif start_time:
+            with self._lock:
+                after = max([0] + [document["_lsn"] for document in self._items.values()
+                                   if document["_ts"] < start_time.timestamp()])
+        else:
+            after = self._lsn
+        page_size = max_item_count or 100
+
+        def get_next(token):
+            start = int(token or after)
+            with self._lock:
+                page = sorted(
+                    (copy.deepcopy(document) for (partition, _), document in self._items.items()
+                     if document["_lsn"] > start and (partition_key_range_id is None or
+                                                      self._feed_range(partition) == partition_key_range_id)),
+                    key=lambda document: document["_lsn"])[:page_size]
+            headers = self.client._call("change_feed", "query", _read_charge(page))
+            headers["etag"] = str(page[-1]["_lsn"] if page else start)
+            if raw_response_hook:
+                raw_response_hook(_Response(headers, 200 if page else 304))
+            return page, headers["etag"]
+
+        def extract_data(response):
+            page, continuation = response
+            if not page:
+                raise StopIteration
+            return continuation, iter(page)
+
+        return ItemPaged(get_next, extract_data)
+
+    def read_all_items(self, max_item_count=None, **kwargs):
+        with self._lock:
+            documents = [copy.deepcopy(document) for document in self._items.values()]
+        return self._paged(documents, "read_all_items", max_item_count or 100, None)
+
+    # Queries ---------------------------------------------------------------
+
+    def query_items(self, query, parameters=None, partition_key=None, max_item_count=None,
+                    raw_response_hook=None, **kwargs):
+        name = _query_name(query, partition_key)
+        handler = _QUERY_HANDLERS.get(name)
+        if handler is None:
+            raise NotImplementedError(f"No fake implementation for query: {query}")
+
+        values = {parameter["name"]: parameter["value"] for parameter in parameters or []}
+        with self._lock:
+            documents = [
+                copy.deepcopy(document) for (partition, _), document in self._items.items()
+                if partition_key is None or _matches(partition, self._key_value(partition_key))
+            ]
+        return self._paged(handler(documents, values), f"query:{name}",
+                           max_item_count or 100, raw_response_hook)
+
+    # Internals -------------------------------------------------------------
+
+    def _paged(self, results, operation, page_size, raw_response_hook):
+        def get_next(continuation):
+            start = int(continuation or 0)
+            page = results[start:start + page_size]
+            headers = self.client._call(operation, "query", _read_charge(page))
+            if raw_response_hook:
+                raw_response_hook(_Response(headers))
+            following = start + page_size
+            return page, (str(following) if following < len(results) else None)
+
+        def extract_data(response):
+            page, continuation = response
+            return continuation, iter(page)
+
+        return ItemPaged(get_next, extract_data)
+
+    def _store(self, key, body):
+        document = copy.deepcopy(body)
+        self._lsn += 1
+        document["_etag"] = uuid.uuid4().hex
+        document["_ts"] = int(time.time())
+        document["_lsn"] = self._lsn
+        self._items[key] = document
+        return copy.deepcopy(document)
+
+    def _patched(self, key, patch_operations, filter_predicate=None, current=None):
+        current = current or self._items.get(key)
+        if current is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{key[1]} not found")
+        if filter_predicate and not _satisfies(current, filter_predicate):
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="predicate failed")
+        document = copy.deepcopy(current)
+        for operation in patch_operations:
+            _apply_patch(document, operation)
+        return document
+
+    def _feed_range(self, partition):
+        return str(zlib.crc32(json.dumps(partition).encode()) % self.client.feed_ranges)
+
+    def _partition_of(self, document):
+        return tuple(document.get(path.strip("/")) for path in self.paths)
+
+    def _key_value(self, partition_key):
+        return tuple(partition_key) if isinstance(partition_key, list) else (partition_key,)
+
+    @staticmethod
+    def _respond(result, headers, response_hook):
+        if response_hook:
+            response_hook(headers, result)
+        return result
+
+
+class _FakeConnection:
+    """The private client connection call used to list partition key ranges."""
+
+    def __init__(self, feed_ranges):
+        self.feed_ranges = feed_ranges
+
+    def _ReadPartitionKeyRanges(self, collection_link):
+        return [{"id": str(range_id)} for range_id in range(self.feed_ranges)]
+
+
+_COMPARISONS = {"=": operator.eq, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+def _satisfies(document, filter_predicate):
+    """Evaluate a patch condition of `AND`ed `c.field <op> 'value'` terms.
+
+    A term may also be `(NOT IS_DEFINED(c.field) OR c.field <op> 'value')`.
+    As in Cosmos DB, comparing a missing or null field is never true.
+    """
+    match = re.fullmatch(r"FROM c WHERE (.+)", filter_predicate.strip())
+    if match is None:
+        raise NotImplementedError(f"Filter predicate is not faked: {filter_predicate}")
+    for term in match.group(1).split(" AND "):
+        optional = re.fullmatch(r"\(NOT IS_DEFINED\(c\.(\w+)\) OR (.+)\)", term)
+        if optional:
+            if optional.group(1) not in document:
+                continue
+            term = optional.group(2)
+        comparison = re.fullmatch(r"c\.(\w+) (=|<=|>=|<|>) '([^']*)'", term)
+        if comparison is None:
+            raise NotImplementedError(f"Filter predicate is not faked: {filter_predicate}")
+        field, op, value = comparison.groups()
+        if document.get(field) is None or not _COMPARISONS[op](document[field], value):
+            return False
+    return True
+
+
+def _matches(partition, key):
+    """True if `key` equals the partition or is a prefix of a hierarchical key."""
+    return partition[:len(key)] == key
+
+
+def _write_charge(body):
+    return 5.7 + len(json.dumps(body, default=str)) / 1024
+
+
+def _read_charge(page):
+    return 2.5 + 0.1 * len(page) + len(json.dumps(page, default=str)) / 4096
+
+
+def _apply_patch(document, operation):
+    *parents, leaf = operation["path"].strip("/").split("/")
+    target = document
+    for part in parents:
+        target = target.setdefault(part, {})
+    if operation["op"] == "incr":
+        target[leaf] = target.get(leaf, 0) + operation["value"]
+    elif operation["op"] in ("set", "add", "replace"):
+        target[leaf] = operation["value"]
+    elif operation["op"] == "remove":
+        target.pop(leaf, None)
+    else:
+        raise NotImplementedError(f"Patch operation '{operation['op']}' is not faked")
+
+
+def _log_fields(document):
+    return {field: document.get(field) for field in ("id", "thread_id", "log_type", "timestamp", "data")}
+
+
+def _compact_fields(document):
+    return {field: document.get(field) for field in ("id", "thread_id", "t", "ts", "v", "d")}
+
+
+def _count_by(documents, field):
+    counts = Counter(document.get(field) for document in documents)
+    return [{field: value, "count": count} for value, count in counts.items()]
+
+
+def _thread_summaries_page(documents, values):
+    cursor = (values["@before"], values["@thread_id"])
+    summaries = [document for document in documents if document.get("partition") in values["@partitions"]
+                 and (document.get("last_activity") or "", document["thread_id"]) < cursor]
+    summaries.sort(key=lambda document: (document.get("last_activity") or "", document["thread_id"]),
+                   reverse=True)
+    fields = ("thread_id", "message_count", "total_logs", "first_activity", "last_activity", "last_run_status")
+    return [{field: document.get(field) for field in fields} for document in summaries[:values["@limit"]]]
+
+
+_QUERY_HANDLERS = {
+    "thread_logs": lambda documents, values: sorted(
+        (_log_fields(d) for d in documents if d.get("thread_id") == values["@thread_id"]),
+        key=lambda d: d["timestamp"]),
+    "thread_logs_since": lambda documents, values: sorted(
+        (_log_fields(d) for d in documents
+         if d.get("thread_id") == values["@thread_id"] and d.get("timestamp", "") > values["@since"]),
+        key=lambda d: d["timestamp"]),
+    "logs_by_type": lambda documents, values: sorted(
+        (_log_fields(d) for d in documents if d.get("log_type") == values["@log_type"]),
+        key=lambda d: d["timestamp"], reverse=True),
+    "distinct_threads": lambda documents, values: sorted({d["thread_id"] for d in documents}),
+    "count_logs": lambda documents, values: [len(documents)],
+    "count_by_log_type": lambda documents, values: _count_by(documents, "log_type"),
+    "summary_fields": lambda documents, values: [
+        {"thread_id": d.get("thread_id"), "log_type": d.get("log_type"), "timestamp": d.get("timestamp"),
+         "status": (d.get("data") or {}).get("status"), "session_id": (d.get("data") or {}).get("session_id")}
+        for d in documents],
+    "thread_logs_compact": lambda documents, values: sorted(
+        (_compact_fields(d) for d in documents if d.get("thread_id") == values["@thread_id"] and "ts" in d),
+        key=lambda d: d["ts"]),
+    "thread_logs_since_compact": lambda documents, values: sorted(
+        (_compact_fields(d) for d in documents
+         if d.get("thread_id") == values["@thread_id"] and d.get("ts", 0) > values["@since"]),
+        key=lambda d: d["ts"]),
+    "count_by_log_type_compact": lambda documents, values: [
+        {"log_type": item["t"], "count": item["count"]} for item in _count_by(documents, "t")],
+    "summary_fields_compact": lambda documents, values: [
+        {"thread_id": d.get("thread_id"), "log_type": d.get("t"), "timestamp": d.get("ts"),
+         "status": (d.get("d") or {}).get("st"), "session_id": (d.get("d") or {}).get("sid")}
+        for d in documents],
+    "full_format_logs": lambda documents, values: [_log_fields(d) for d in documents if "v" not in d],
+    "day_logs": lambda documents, values: sorted(
+        (_log_fields(d) for d in documents), key=lambda d: d["timestamp"]),
+    "day_logs_by_type": lambda documents, values: sorted(
+        (_log_fields(d) for d in documents if d.get("log_type") == values["@log_type"]),
+        key=lambda d: d["timestamp"]),
+    "day_counts_by_log_type": lambda documents, values: _count_by(documents, "log_type"),
+    "thread_summaries_page": _thread_summaries_page,
+    "count_thread_summaries": lambda documents, values: [
+        sum(1 for d in documents if d.get("partition") in values["@partitions"])],
+    "summary_ids": lambda documents, values: [
+        {"id": d["id"]} for d in documents if d.get("partition") == values["@partition"]],
+    "analytics_rollups_since": lambda documents, values: [
+        {field: d.get(field) for field in ("kind", "hour", "model", "runs", "failed", "duration_count",
+                                           "duration_ms_sum", "statuses", "histogram", "messages",
+                                           "roles", "characters")}
+        for d in documents if d.get("partition") == values["@partition"]
+        and d.get("hour", "") >= values["@since"]],
+    "counted_logs": lambda documents, values: [
+        d["id"] for d in documents if d.get("partition") == values["@partition"] and d["id"] in values["@ids"]],
+}
+
+
+
+def _query_name(text, partition_key):
+    """Name of a registered query; same-text queries are told apart by scope."""
+    scope = PARTITION if partition_key is not None else CROSS_PARTITION
+    names = [query.name for query in QUERIES.values() if query.text == text]
+    return next((name for name in names if QUERIES[name].scope == scope), names[0] if names else None)
+
+
+# Azure AI Agents -------------------------------------------------------------
+
+
+class FakeProjectClient:
+    """Drop-in for `AIProjectClient` whose agent answers after a delay.
+
+    `run_latency` is the typical time a run takes, `api_latency` the time of
+    every other call, and `failure_rate` the share of runs that fail.
+    """
+
+    def __init__(self, run_latency=1.0, api_latency=0.02, failure_rate=0.0,
+                 answer="Meals are reimbursed up to $75 per day.", seed=None):
+        self.agents = _FakeAgentsClient(run_latency, api_latency, failure_rate, answer, seed)
+
+    def close(self):
+        pass
+
+
+class _FakeAgentsClient:
+    def __init__(self, run_latency, api_latency, failure_rate, answer, seed):
+        self.run_latency = run_latency
+        self.api_latency = api_latency
+        self.failure_rate = failure_rate
+        self.answer = answer
+        self.timer = _Latency(seed)
+        self.threads = _FakeThreads(self)
+        self.messages = _FakeMessages(self)
+        self.runs = _FakeRuns(self)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.thread_messages = {}
+        self.thread_runs = {}
+        self.stats = Counter()
+
+    def get_agent(self, agent_id):
+        self.call("get_agent")
+        return Agent({
+            "id": agent_id, "object": "assistant", "created_at": 1700000000, "name": "benchmark-agent",
+            "description": None, "model": "gpt-4o", "instructions": "Answer expense policy questions.",
+            "tools": [], "metadata": {}
+        })
+
+    def call(self, name, latency=None):
+        self.timer.sleep(self.api_latency if latency is None else latency)
+        with self._lock:
+            self.stats[name] += 1
+
+    def new_id(self, prefix):
+        with self._lock:
+            return f"{prefix}_{next(self._ids):08d}"
+
+    def add_message(self, thread_id, role, text):
+        message = ThreadMessage({
+            "id": self.new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "status": "completed", "role": role,
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "attachments": [], "metadata": {}
+        })
+        with self._lock:
+            self.thread_messages.setdefault(thread_id, []).append(message)
+        return message
+
+    def new_run(self, thread_id, agent_id, status):
+        run = ThreadRun({
+            "id": self.new_id("run"), "object": "thread.run", "created_at": int(time.time()),
+            "thread_id": thread_id, "agent_id": agent_id, "status": status, "model": "gpt-4o",
+            "instructions": "", "tools": [], "metadata": {}
+        })
+        with self._lock:
+            self.thread_runs.setdefault(thread_id, []).append(run)
+        return run
+
+    def finish_run(self, run):
+        """Complete or fail a run and, on success, post the answer."""
+        run.completed_at = int(time.time())
+        if self.timer.chance(self.failure_rate):
+            run.status = "failed"
+            run.last_error = {"code": "server_error", "message": "Simulated run failure"}
+            self.stats["runs_failed"] += 1
+        else:
+            run.status = "completed"
+            self.add_message(run.thread_id, "assistant", self.answer)
+            self.stats["runs_completed"] += 1
+        return run
+
+    def close(self):
+        pass
+
+
+class _FakeThreads:
+    def __init__(self, agents):
+        self.agents = agents
+
+    def create(self, messages=None, **kwargs):
+        self.agents.call("threads.create")
+        thread = AgentThread({"id": self.agents.new_id("thread"), "object": "thread",
+                              "created_at": int(time.time()), "metadata": {}})
+        for message in messages or []:
+            role = getattr(message.role, "value", message.role)
+            self.agents.add_message(thread.id, role, message.content)
+        return thread
+
+
+class _FakeMessages:
+    def __init__(self, agents):
+        self.agents = agents
+
+    def create(self, thread_id, role, content, **kwargs):
+        self.agents.call("messages.create")
+        return self.agents.add_message(thread_id, role, content)
+
+    def list(self, thread_id, order=None, limit=None, **kwargs):
+        with self.agents._lock:
+            messages = list(self.agents.thread_messages.get(thread_id, []))
+        return _agent_paged(self.agents, "messages.list", messages, order, limit)
+
+
+class _FakeRuns:
+    def __init__(self, agents):
+        self.agents = agents
+        self._ready_at = {}
+
+    def create_and_process(self, thread_id, agent_id, **kwargs):
+        self.agents.call("runs.create_and_process", self.agents.run_latency)
+        return self.agents.finish_run(self.agents.new_run(thread_id, agent_id, "in_progress"))
+
+    def create(self, thread_id, agent_id, **kwargs):
+        self.agents.call("runs.create")
+        run = self.agents.new_run(thread_id, agent_id, "queued")
+        self._ready_at[run.id] = time.monotonic() + self.agents.run_latency
+        return run
+
+    def get(self, thread_id, run_id, **kwargs):
+        self.agents.call("runs.get")
+        with self.agents._lock:
+            run = next((run for run in self.agents.thread_runs.get(thread_id, []) if run.id == run_id), None)
+        if run is None:
+            raise ResourceNotFoundError(f"No run {run_id} in thread {thread_id}")
+        if run.status in ("queued", "in_progress"):
+            if time.monotonic() >= self._ready_at.get(run_id, 0):
+                self._ready_at.pop(run_id, None)
+                self.agents.finish_run(run)
+            else:
+                run.status = "in_progress"
+        return run
+
+    def list(self, thread_id, order=None, limit=None, **kwargs):
+        with self.agents._lock:
+            runs = list(self.agents.thread_runs.get(thread_id, []))
+        return _agent_paged(self.agents, "runs.list", runs, order, limit)
+
+    def stream(self, thread_id, agent_id, **kwargs):
+        self.agents.call("runs.stream")
+        return contextlib.nullcontext(self._events(thread_id, agent_id))
+
+    def _events(self, thread_id, agent_id):
+        agents = self.agents
+        run = agents.new_run(thread_id, agent_id, "in_progress")
+        words = agents.answer.split(" ")
+        # Spend a third of the run before the first token, the rest streaming.
+        agents.timer.sleep(agents.run_latency / 3)
+        for index, word in enumerate(words):
+            agents.timer.sleep(agents.run_latency * 2 / 3 / len(words))
+            yield AgentStreamEvent.THREAD_MESSAGE_DELTA, MessageDeltaChunk({
+                "id": "msg_delta", "object": "thread.message.delta",
+                "delta": {"role": "assistant", "content": [
+                    {"index": 0, "type": "text", "text": {"value": word if index == 0 else f" {word}"}}]}
+            }), None
+        agents.finish_run(run)
+        if run.status == "completed":
+            yield AgentStreamEvent.THREAD_MESSAGE_COMPLETED, agents.thread_messages[thread_id][-1], None
+        yield AgentStreamEvent.THREAD_RUN_COMPLETED, run, None
+        yield AgentStreamEvent.DONE, "[DONE]", None
+
+
+def _agent_paged(agents, name, items, order, limit):
+    """Page agent objects the way the Agents API does, with an `after` ID cursor."""
+    if str(getattr(order, "value", order)).lower() == "desc":
+        items = list(reversed(items))
+    page_size = limit or 20
+
+    def get_next(after):
+        agents.call(name)
+        ids = [item.id for item in items]
+        start = ids.index(after) + 1 if after in ids else 0
+        return items[start:start + page_size]
+
+    def extract_data(page):
+        more = page and page[-1] is not items[-1]
+        return (page[-1].id if more else None), iter(page)
+
+    return ItemPaged(get_next, extract_data)
+
+
+# asyncio ---------------------------------------------------------------------
+#
+# The `aio` clients asgi_app.py uses, as wrappers around the fakes above.
+# Every call runs the synchronous fake on a worker thread, so its simulated
+# latency overlaps with other requests on the event loop like network I/O.
+
+
+class AsyncFakeCosmosClient:
+    """Drop-in for `azure.cosmos.aio.CosmosClient` over a `FakeCosmosClient`."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def create_database_if_not_exists(self, id, **kwargs):
+        return _AsyncFakeDatabase(self.client.create_database_if_not_exists(id, **kwargs))
+
+    def get_database_client(self, database):
+        return _AsyncFakeDatabase(self.client.get_database_client(database))
+
+    def snapshot(self):
+        return self.client.snapshot()
+
+    async def close(self):
+        pass
+
+
+class _AsyncFakeDatabase:
+    def __init__(self, database):
+        self.database = database
+
+    async def create_container_if_not_exists(self, id, partition_key, **kwargs):
+        return _AsyncFakeContainer(self.database.create_container_if_not_exists(id, partition_key, **kwargs))
+
+    def get_container_client(self, container):
+        return _AsyncFakeContainer(self.database.get_container_client(container))
+
+
+class _AsyncFakeContainer:
+    """Point operations are awaited; queries return async pages."""
+
+    _AWAITED = ("read", "read_item", "create_item", "upsert_item", "replace_item", "patch_item",
+                "delete_item", "execute_item_batch")
+
+    def __init__(self, container):
+        self.container = container
+
+    def __getattr__(self, name):
+        if name not in self._AWAITED:
+            raise AttributeError(name)
+        return _on_thread(getattr(self.container, name))
+
+    def query_items(self, query, **kwargs):
+        return _AsyncPaged(self.container.query_items(query, **kwargs))
+
+    def read_all_items(self, **kwargs):
+        return _AsyncPaged(self.container.read_all_items(**kwargs))
+
+
+class AsyncFakeProjectClient:
+    """Drop-in for `azure.ai.projects.aio.AIProjectClient` over a `FakeProjectClient`."""
+
+    def __init__(self, project):
+        self.project = project
+        self.agents = _AsyncFakeAgents(project.agents)
+
+    async def close(self):
+        pass
+
+
+class _AsyncFakeAgents:
+    def __init__(self, agents):
+        self.agents = agents
+        self.get_agent = _on_thread(agents.get_agent)
+        self.threads = _AsyncFakeOperations(agents.threads)
+        self.messages = _AsyncFakeOperations(agents.messages)
+        self.runs = _AsyncFakeOperations(agents.runs)
+
+
+class _AsyncFakeOperations:
+    """`list` returns async pages, `stream` an async event stream, the rest are awaited."""
+
+    def __init__(self, operations):
+        self.operations = operations
+
+    def __getattr__(self, name):
+        return _on_thread(getattr(self.operations, name))
+
+    def list(self, thread_id, **kwargs):
+        return _AsyncPaged(self.operations.list(thread_id, **kwargs))
+
+    async def stream(self, thread_id, agent_id, **kwargs):
+        return _AsyncEventStream(await asyncio.to_thread(self.operations.stream, thread_id, agent_id, **kwargs))
+
+
+class AsyncFakeCredential:
+    """Stands in for `azure.identity.aio.DefaultAzureCredential`."""
+
+    async def close(self):
+        pass
+
+
+class _AsyncPaged:
+    """Async view of an `ItemPaged`; each page is fetched on a worker thread."""
+
+    def __init__(self, paged):
+        self._paged = paged
+
+    def by_page(self, continuation_token=None):
+        return _AsyncPages(self._paged.by_page(continuation_token=continuation_token))
+
+    async def __aiter__(self):
+        async for page in self.by_page():
+            async for item in page:
+                yield item
+
+
+class _AsyncPages:
+    def __init__(self, pages):
+        self._pages = pages
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        page = await asyncio.to_thread(self._next_page)
+        if page is None:
+            raise StopAsyncIteration
+        return _async_items(page)
+
+    def _next_page(self):
+        page = next(self._pages, None)
+        return None if page is None else list(page)
+
+
+class _AsyncEventStream:
+    """Async context manager and iterator over a fake run's event stream."""
+
+    def __init__(self, context):
+        self._context = context
+        self._events = None
+
+    async def __aenter__(self):
+        self._events = self._context.__enter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return self._context.__exit__(*exc_info)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await asyncio.to_thread(next, self._events, None)
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+def _on_thread(method):
+    async def call(*args, **kwargs):
+        return await asyncio.to_thread(method, *args, **kwargs)
+    return call
+
+
+async def _async_items(items):
+    for item in items:
+        yield item
@@ -0,0 +1,330 @@
+"""Replay concurrent chat sessions against the app with fake Azure backends.
+
+Usage (from the repository root):
+
+    python -m benchmark.load_test --users 20 --turns 3 --run-latency 0.5
+    python -m benchmark.load_test --json bench_output.json
+    python -m benchmark.load_test --baseline bench_output.json --tolerance 0.15
+
+The app is imported in-process with the Azure AI Agents and Cosmos DB
+clients replaced by the fakes in fakes.py, so no Azure resource, network or
+credential is needed.  Every virtual user runs on its own thread (like a
+gunicorn thread worker would):
+
+1. `POST /api/new-session`;
+2. `--turns` times: `POST /api/chat`, then `POST /api/thread-logs` (from
+   Cosmos DB) the way the UI refreshes its log panel.  With `--async-runs`
+   the chat call starts the run in async mode and the answer is collected
+   by long-polling `GET /api/run-status`;
+3. with probability `--browse-rate` after each turn, the dashboard calls
+   `GET /api/all-threads` and `GET /api/cosmos-stats`.
+
+The report lists throughput and p50/p95/p99 latency per endpoint, plus the
+Cosmos DB request units, operations and throttles the fake container
+accounted for.  With `--baseline` the run is compared with an earlier
+`--json` report and the script exits with status 1 when any endpoint's p95
+got slower, or the overall throughput lower, by more than `--tolerance`.
+Keep the other options identical between the two runs.
+
+With `--analytics` the stored logs are then rolled up by run_analytics.py
+from the fake container's change feed (split into `--feed-ranges` key
+ranges), and the figures `/api/run-analytics` serves are checked against
+the runs the fake agent actually made.
+
+`load_asgi_app()` wires asgi_app.py to the same fakes behind their `aio`
+wrappers, for driving the ASGI variant offline (see tests/test_asgi_app.py).
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark.fakes import (
+    AsyncFakeCosmosClient,
+    AsyncFakeCredential,
+    AsyncFakeProjectClient,
+    FakeCosmosClient,
+    FakeProjectClient,
+)
+
+QUESTIONS = [
+    "What is the daily meal allowance?",
+    "Can I expense a taxi to the airport?",
+    "How do I submit receipts for a hotel stay?",
+    "Is business class allowed on long flights?",
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per user")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds between turns")
+    parser.add_argument("--browse-rate", type=float, default=0.3,
+                        help="Chance of a dashboard refresh after each turn")
+    parser.add_argument("--run-latency", type=float, default=0.5, help="Seconds per agent run")
+    parser.add_argument("--api-latency", type=float, default=0.02,
+                        help="Seconds per other agents API call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of failed agent runs")
+    parser.add_argument("--cosmos-latency", type=float, default=0.006,
+                        help="Seconds per Cosmos DB point operation (queries and batches ~1.5x)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Share of Cosmos DB calls answered with 429 first")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--async-runs", action="store_true",
+                        help="Send chats in async mode and long-poll /api/run-status for the answer")
+    parser.add_argument("--analytics", action="store_true",
+                        help="Afterwards roll the logs up from the change feed and check the totals")
+    parser.add_argument("--feed-ranges", type=int, default=4,
+                        help="Partition key ranges of the fake change feed")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed relative regression against the baseline")
+    return parser.parse_args(argv)
+
+
+def fake_backends(args):
+    """The fake Agents and Cosmos DB clients for the options, with the env the apps need."""
+    os.environ.setdefault("AZURE_ENDPOINT", "https://benchmark.invalid/api/projects/benchmark")
+    os.environ.setdefault("AZURE_AGENT_ID", "asst_benchmark")
+    os.environ.setdefault("COSMOS_ENDPOINT", "https://benchmark.invalid:443/")
+    os.environ.setdefault("COSMOS_KEY", "benchmark")
+    os.environ.setdefault("TOKEN_CACHE_ENABLED", "false")
+
+    project = FakeProjectClient(run_latency=args.run_latency, api_latency=args.api_latency,
+                                failure_rate=args.failure_rate, seed=args.seed)
+    cosmos = FakeCosmosClient(
+        latency={"read": args.cosmos_latency, "write": args.cosmos_latency,
+                 "batch": args.cosmos_latency * 1.5, "query": args.cosmos_latency * 1.5},
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+        feed_ranges=args.feed_ranges
+    )
+    return project, cosmos
+
+
+def load_app(args):
+    """Import app.py with the Azure clients replaced by fakes."""
+    import azure.identity
+    import client_factory
+
+    project, cosmos = fake_backends(args)
+    client_factory.create_project_client = lambda endpoint, credential, **kwargs: project
+    client_factory.create_cosmos_client = lambda endpoint, key, **kwargs: cosmos
+    azure.identity.DefaultAzureCredential = lambda **kwargs: None
+
+    import app as chat_app
+
+    for name in ("agent", "cosmos"):
+        if not chat_app.warmup.wait(name, timeout=30):
+            raise RuntimeError(f"Warm-up of {name} failed: {chat_app.warmup.snapshot()[name]['error']}")
+    return chat_app, project, cosmos
+
+
+def load_asgi_app(args):
+    """Import asgi_app.py with the `aio` Azure clients replaced by fakes.
+
+    The app creates its clients when it starts serving (e.g. inside
+    `app.test_app()`); the returned fakes are the synchronous ones behind
+    them, for their counters.
+    """
+    import azure.identity.aio
+    import client_factory
+
+    project, cosmos = fake_backends(args)
+    client_factory.create_async_project_client = (
+        lambda endpoint, credential, **kwargs: AsyncFakeProjectClient(project))
+    client_factory.create_async_cosmos_client = lambda endpoint, key, **kwargs: AsyncFakeCosmosClient(cosmos)
+    azure.identity.aio.DefaultAzureCredential = lambda **kwargs: AsyncFakeCredential()
+
+    import asgi_app
+
+    return asgi_app, project, cosmos
+
+
+class Recorder:
+    """Latency samples and error counts per endpoint."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, client, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        response = getattr(client, method)(path, **kwargs)
+        body = response.get_json(silent=True)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[endpoint].append(elapsed)
+            if response.status_code >= 400:
+                self.errors[endpoint] += 1
+        return body
+
+
+def virtual_user(flask_app, recorder, args, user):
+    """One browser session: new session, chat turns, log refreshes."""
+    import random
+
+    rng = random.Random(args.seed * 1000 + user)
+    client = flask_app.test_client()
+    session_id = recorder.call(client, "new-session", "post", "/api/new-session")["session_id"]
+    for turn in range(args.turns):
+        question = QUESTIONS[(user + turn) % len(QUESTIONS)]
+        if args.async_runs:
+            started = recorder.call(client, "chat-async", "post", "/api/chat",
+                                    json={"message": question, "session_id": session_id, "async": True})
+            while started and "run_id" in started:
+                status = recorder.call(client, "run-status", "get", "/api/run-status", query_string={
+                    "run_id": started["run_id"], "thread_id": started["thread_id"], "wait": 30})
+                if not status or status.get("done") or "error" in status:
+                    break
+        else:
+            recorder.call(client, "chat", "post", "/api/chat",
+                          json={"message": question, "session_id": session_id})
+        recorder.call(client, "thread-logs", "post", "/api/thread-logs",
+                      json={"session_id": session_id, "source": "cosmos"})
+        if rng.random() < args.browse_rate:
+            recorder.call(client, "all-threads", "get", "/api/all-threads?page_size=50")
+            recorder.call(client, "cosmos-stats", "get", "/api/cosmos-stats")
+        if args.think_time:
+            time.sleep(args.think_time)
+
+
+def build_report(recorder, elapsed, project, cosmos, chat_app, args):
+    from timing import percentile
+
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        samples = sorted(samples)
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "errors": recorder.errors[endpoint],
+            "throughput": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1),
+        }
+    total = sum(values["requests"] for values in endpoints.values())
+    return {
+        "options": {key: value for key, value in vars(args).items()
+                    if key not in ("json", "baseline", "tolerance")},
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput": round(total / elapsed, 2),
+        "endpoints": endpoints,
+        "cosmos": cosmos.snapshot(),
+        "agents": dict(project.agents.stats),
+        "log_writer": chat_app.log_writer.snapshot() if chat_app.log_writer else None,
+    }
+
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s "
+          f"({report['throughput']} req/s)\n")
+    print(f"{'endpoint':<14}{'requests':>9}{'errors':>8}{'req/s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, values in report["endpoints"].items():
+        print(f"{endpoint:<14}{values['requests']:>9}{values['errors']:>8}{values['throughput']:>9}"
+              f"{values['p50_ms']:>9}{values['p95_ms']:>9}{values['p99_ms']:>9}{values['max_ms']:>9}")
+
+    cosmos = report["cosmos"]
+    print(f"\nCosmos DB: {cosmos['total_request_charge']} RU, "
+          f"{sum(cosmos['operations'].values())} operations, {cosmos['throttled']} throttled")
+    for operation, charge in sorted(cosmos["request_charge"].items(), key=lambda item: -item[1]):
+        print(f"  {operation:<36}{cosmos['operations'][operation]:>7} ops{charge:>11} RU")
+    agents = report["agents"]
+    print(f"Agent runs: {agents.get('runs_completed', 0)} completed, {agents.get('runs_failed', 0)} failed")
+
+    analytics = report.get("analytics")
+    if analytics:
+        print(f"\nRun analytics: {analytics['documents']} logs rolled up in {analytics['elapsed_s']}s "
+              f"({analytics['batches']} batches)")
+        for model in analytics["models"]:
+            print(f"  {model['model']:<20}{model['runs']:>6} runs{model['failure_rate']:>8.1%} failed"
+                  f"   p50 <= {model['p50_ms']} ms   p95 <= {model['p95_ms']} ms")
+
+
+def roll_up(chat_app, project):
+    """Run the change feed processor once and check the served figures."""
+    from run_analytics import RunAnalytics
+
+    processor = RunAnalytics(chat_app.cosmos_container, chat_app.thread_summaries.container)
+    start = time.perf_counter()
+    processor.run_once()
+    elapsed = time.perf_counter() - start
+    processor.close()
+
+    served = chat_app.app.test_client().get("/api/run-analytics").get_json()
+    runs = sum(model["runs"] for model in served["models"])
+    failed = sum(model["failed"] for model in served["models"])
+    agents = project.agents.stats
+    if (runs, failed) != (agents.get("runs_completed", 0) + agents.get("runs_failed", 0),
+                          agents.get("runs_failed", 0)):
+        raise RuntimeError(f"Rollups count {runs} runs ({failed} failed), the agent made {dict(agents)}")
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "documents": processor.stats["documents"],
+        "batches": processor.stats["batches"],
+        "models": served["models"],
+        "messages": served["messages"]["total"]
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return the regressions of `report` against `baseline`, as messages."""
+    regressions = []
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput']} req/s < baseline {baseline['throughput']}")
+    for endpoint, values in report["endpoints"].items():
+        previous = baseline["endpoints"].get(endpoint)
+        if previous and values["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint} p95 {values['p95_ms']} ms > baseline {previous['p95_ms']} ms")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    chat_app, project, cosmos = load_app(args)
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for future in [pool.submit(virtual_user, chat_app.app, recorder, args, user)
+                       for user in range(args.users)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    if chat_app.log_writer:
+        # Count the RUs of the logs still queued, outside the timed window.
+        chat_app.log_writer.flush()
+
+    report = build_report(recorder, elapsed, project, cosmos, chat_app, args)
+    if args.analytics:
+        report["analytics"] = roll_up(chat_app, project)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"✓ Report written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            for message in regressions:
+                print(f"⚠ Regression: {message}")
+            return 1
+        print(f"✓ No regression beyond {args.tolerance:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Compare the full and compact log formats by RU and bytes per thread.
+
+Usage (from the repository root):
+
+    python -m benchmark.log_format_bench --threads 200 --turns 5 --answer-chars 1500
+    python -m benchmark.log_format_bench --compress-threshold 512 --json format_output.json
+
+For each format the same synthetic conversations (a `thread_created` log,
+then per turn the user message, the run with its timings and the
+assistant's answer) are written to a fresh fake Cosmos DB container through
+`CosmosLogWriter`, exactly as app.py stores them, and every thread is then
+read back with the thread log query the logs panel uses.  The report lists
+per thread the stored bytes (system properties left out), the write RUs and
+the read RUs of the fake container's RU model, and checks that the compact
+documents decode back to the same messages and runs.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from benchmark.fakes import FakeCosmosClient
+
+WORDS = ("the expense policy allows travel meals hotel receipts manager approval within days of "
+         "return economy class flights over six hours may be booked in premium economy taxi "
+         "rides to the airport are reimbursed when public transport is not available").split()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=100, help="Conversations to store")
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per conversation")
+    parser.add_argument("--answer-chars", type=int, default=1500, help="Typical assistant answer length")
+    parser.add_argument("--compress-threshold", type=int, default=1024,
+                        help="COSMOS_LOG_COMPRESS_THRESHOLD for the compact format")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def text(rng, characters):
+    """Policy-sounding prose of roughly `characters` characters."""
+    words = []
+    while sum(len(word) + 1 for word in words) < characters:
+        words.append(rng.choice(WORDS))
+    return " ".join(words).capitalize() + "."
+
+
+def conversations(args):
+    """Yield `(thread_id, log_type, data, timestamp)` of every synthetic log."""
+    from agent_logs import message_log_data, run_log_data
+
+    rng = random.Random(args.seed)
+    start = datetime(2025, 1, 31, 9, 0)
+    for index in range(args.threads):
+        thread_id = f"thread_{index:06d}"
+        now = start + timedelta(minutes=index)
+        yield thread_id, "thread_created", {"session_id": f"session-{index}",
+                                            "created_at": now.isoformat()}, now
+        for turn in range(args.turns):
+            now += timedelta(seconds=rng.uniform(5, 60))
+            yield thread_id, "message", message_log_data({
+                "id": f"msg_{index}_{turn}_u", "role": "user",
+                "content": [{"type": "text", "text": text(rng, rng.randint(40, 160))}],
+                "created_at": now.isoformat() + "+00:00"}), now
+            run_seconds = rng.uniform(1, 8)
+            run = run_log_data({
+                "id": f"run_{index}_{turn}", "status": "completed", "model": "gpt-4o",
+                "created_at": now.isoformat() + "+00:00",
+                "completed_at": (now + timedelta(seconds=run_seconds)).isoformat() + "+00:00"})
+            run["timings"] = [{"stage": "thread_lookup", "ms": round(rng.uniform(1, 5), 2)},
+                              {"stage": "agent_run", "ms": round(run_seconds * 1000, 2)}]
+            now += timedelta(seconds=run_seconds)
+            yield thread_id, "run", run, now
+            now += timedelta(milliseconds=rng.uniform(20, 200))
+            yield thread_id, "message", message_log_data({
+                "id": f"msg_{index}_{turn}_a", "role": "assistant",
+                "content": [{"type": "text", "text": text(
+                    rng, int(args.answer_chars * rng.uniform(0.3, 1.7)))}],
+                "created_at": now.isoformat() + "+00:00"}), now
+
+
+def measure(log_format, args):
+    """Store and read back the conversations in one format; returns the figures."""
+    os.environ["COSMOS_LOG_FORMAT"] = log_format
+    os.environ["COSMOS_LOG_COMPRESS_THRESHOLD"] = str(args.compress_threshold)
+    from agent_logs import log_document
+    from cosmos_provisioning import provision_log_container
+    from cosmos_queries import queries
+    from log_format import decode, log_query, store_format
+    from log_writer import CosmosLogWriter
+
+    cosmos = FakeCosmosClient(latency={"read": 0, "write": 0, "batch": 0, "query": 0}, seed=args.seed)
+    container = provision_log_container(cosmos.create_database_if_not_exists("AgentLogsDB"), "ThreadLogs")
+    writer = CosmosLogWriter(container, flush_size=20, flush_interval=0.05, encode=store_format)
+    thread_ids = []
+    for thread_id, log_type, data, timestamp in conversations(args):
+        document = log_document(thread_id, log_type, data)
+        document["timestamp"] = timestamp.isoformat(timespec="microseconds")
+        writer.submit(document)
+        if not thread_ids or thread_ids[-1] != thread_id:
+            thread_ids.append(thread_id)
+    writer.close()
+    written = cosmos.snapshot()["total_request_charge"]
+
+    threads = {}
+    for thread_id in thread_ids:
+        threads[thread_id] = [decode(log) for log in queries.iterate(
+            container, log_query("thread_logs"), {"@thread_id": thread_id}, partition_key=thread_id)]
+    read = cosmos.snapshot()["total_request_charge"] - written
+
+    stored = [{key: value for key, value in document.items() if not key.startswith("_")}
+              for document in container.read_all_items()]
+    count = max(1, len(thread_ids))
+    return {
+        "documents": len(stored),
+        "bytes_per_thread": round(sum(len(json.dumps(document)) for document in stored) / count),
+        "write_ru_per_thread": round(written / count, 2),
+        "read_ru_per_thread": round(read / count, 2),
+        "write_failures": writer.snapshot()["failed"],
+    }, threads
+
+
+def content_of(threads):
+    """What the logs panel shows of each thread, for comparing the formats."""
+    return {thread_id: [(log["log_type"], log["data"].get("message_id") or log["data"].get("run_id"),
+                         log["data"].get("role"), log["data"].get("content"), log["data"].get("status"))
+                        for log in logs]
+            for thread_id, logs in threads.items()}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    full, full_threads = measure("full", args)
+    compact, compact_threads = measure("compact", args)
+    if content_of(full_threads) != content_of(compact_threads):
+        print("⚠ Compact logs do not decode to the same conversations")
+        return 1
+
+    report = {"options": {key: value for key, value in vars(args).items() if key != "json"},
+              "full": full, "compact": compact}
+    print(f"\n{args.threads} threads x {args.turns} turns, ~{args.answer_chars} character answers\n")
+    print(f"{'format':<10}{'documents':>11}{'bytes/thread':>14}{'write RU/thread':>17}{'read RU/thread':>16}")
+    for name in ("full", "compact"):
+        values = report[name]
+        print(f"{name:<10}{values['documents']:>11}{values['bytes_per_thread']:>14}"
+              f"{values['write_ru_per_thread']:>17}{values['read_ru_per_thread']:>16}")
+    for field, label in (("bytes_per_thread", "bytes"), ("write_ru_per_thread", "write RU"),
+                         ("read_ru_per_thread", "read RU")):
+        print(f"  {label:<10}{1 - compact[field] / max(full[field], 1e-9):>8.1%} smaller")
+    print("✓ Compact logs decode to the same conversations")
+
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"✓ Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Change feed reading and leases shared by the export and analytics jobs.
+
+azure-cosmos 4.7 reads the change feed one physical partition key range at
+a time.  `ChangeFeedPages` reads one range and keeps its own continuation;
+`LeaseStore` hands out the ranges to processor instances through lease
+documents, so several instances can run without reading a range twice and
+a crashed instance's ranges are picked up once its leases expire.
+
+A lease document lives in the same logical partition as the documents the
+processor writes, so a checkpoint can be committed in the same
+transactional batch as the results it covers (see `checkpoint_operation`).
+
+azure-cosmos is pinned to 4.7.x (requirements.txt) because 4.7 has no
+public call to list the key ranges: `partition_key_range_ids` uses the
+client connection's internal `_ReadPartitionKeyRanges`.  Later releases
+add `read_feed_ranges()` and a `feed_range` argument to the change feed;
+moving to them changes the lease keys, so it means a fresh set of leases.
+"""
+
+import os
+import re
+import socket
+import time
+import uuid
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+from cosmos_provisioning import KEEP_FOREVER
+
+
+class ChangeFeedPages:
+    """Change feed pages of one partition key range, with a safe continuation.
+
+    The SDK takes a page's continuation from the client's last response
+    headers, which parallel streams overwrite, so the etag of this stream's
+    own responses is tracked instead.  Without a continuation the feed
+    starts at `start_time`, or at the beginning when that is None.  With an
+    `end_time` (epoch seconds) it stops after the first page that reaches
+    documents modified later; the feed of a range is in modification order.
+    """
+
+    def __init__(self, container, range_id, continuation, start_time, page_size, end_time=None):
+        self.continuation_token = continuation
+        self.end_time = end_time
+        if continuation:
+            options = {"continuation": continuation}
+        elif start_time:
+            options = {"start_time": start_time}
+        else:
+            options = {"is_start_from_beginning": True}
+        self._pages = container.query_items_change_feed(
+            partition_key_range_id=range_id,
+            max_item_count=page_size,
+            raw_response_hook=self._on_response,
+            **options
+        ).by_page()
+
+    def __iter__(self):
+        for page in self._pages:
+            page = list(page)
+            yield page
+            if self.end_time is not None and page and page[-1].get("_ts", 0) > self.end_time:
+                return
+
+    def _on_response(self, response):
+        etag = response.http_response.headers.get("etag")
+        if etag and response.http_response.status_code in (200, 304):
+            self.continuation_token = etag
+
+
+def partition_key_range_ids(container):
+    """IDs of the container's physical partition key ranges.
+
+    azure-cosmos 4.7 reads the change feed per key range but has no public
+    call to list them, so this goes through the client connection (see the
+    module docstring).
+    """
+    read_ranges = getattr(container.client_connection, "_ReadPartitionKeyRanges", None)
+    if read_ranges is None:
+        raise RuntimeError("This azure-cosmos version cannot list partition key ranges; "
+                           "change_feed.py needs azure-cosmos 4.7.x")
+    ranges = read_ranges(container.container_link)
+    return [key_range["id"] for key_range in ranges]
+
+
+# Lease owners are embedded in patch filter predicates, which take no
+# parameters, so they are restricted to characters that need no quoting.
+_OWNER_PATTERN = re.compile(r"[A-Za-z0-9._:@-]+")
+
+
+class LeaseLost(Exception):
+    """Another instance took over a lease this instance was using."""
+
+
+class LeaseStore:
+    """Leases on partition key ranges, one document per range.
+
+    A lease is held by `owner` until `expires_at`; every checkpoint or
+    `renew()` pushes the expiry out by `ttl` seconds.  Updates are
+    conditional on still being the owner, so an instance that stalled past
+    its expiry cannot overwrite the checkpoint of the one that took over.
+    """
+
+    def __init__(self, container, name, partition, owner=None, ttl=60.0):
+        self.container = container
+        self.name = name
+        self.partition = partition
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        if not _OWNER_PATTERN.fullmatch(self.owner):
+            raise ValueError(f"Lease owner {self.owner!r} may only contain letters, digits and . _ : @ -")
+        self.ttl = ttl
+
+    def acquire(self, range_id):
+        """Take the lease on a range if it is free or expired; returns it or None."""
+        lease_id = self._lease_id(range_id)
+        try:
+            lease = self.container.read_item(item=lease_id, partition_key=self.partition)
+        except exceptions.CosmosResourceNotFoundError:
+            lease = None
+
+        if lease is None:
+            lease = {
+                "id": lease_id,
+                "partition": self.partition,
+                "range_id": range_id,
+                "continuation": None,
+                "offset": 0,
+                "owner": self.owner,
+                "expires_at": time.time() + self.ttl,
+                "ttl": KEEP_FOREVER
+            }
+            try:
+                return self.container.create_item(body=lease)
+            except exceptions.CosmosResourceExistsError:
+                return None
+
+        if lease.get("owner") != self.owner and lease.get("expires_at", 0) > time.time():
+            return None
+        lease.update(owner=self.owner, expires_at=time.time() + self.ttl, ttl=KEEP_FOREVER)
+        try:
+            return self.container.replace_item(
+                item=lease_id, body=lease, etag=lease["_etag"],
+                match_condition=MatchConditions.IfNotModified)
+        except exceptions.CosmosAccessConditionFailedError:
+            return None
+
+    def renew(self, lease):
+        """Push out a held lease's expiry; raises `LeaseLost` if it was taken over."""
+        try:
+            self.container.patch_item(
+                item=lease["id"], partition_key=self.partition,
+                patch_operations=[{"op": "set", "path": "/expires_at", "value": time.time() + self.ttl}],
+                filter_predicate=self._owned_predicate())
+        except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceNotFoundError):
+            raise LeaseLost(lease["range_id"])
+
+    def release(self, lease):
+        """Give a lease up so another instance can take it at once."""
+        try:
+            self.container.patch_item(
+                item=lease["id"], partition_key=self.partition,
+                patch_operations=[{"op": "set", "path": "/expires_at", "value": 0}],
+                filter_predicate=self._owned_predicate())
+        except exceptions.CosmosHttpResponseError:
+            pass
+
+    def checkpoint_operation(self, lease, continuation, offset=0):
+        """Batch operation recording progress on a lease, only while still owned.
+
+        `offset` counts documents of the page after `continuation` that are
+        already processed, for checkpoints taken in the middle of a page.
+        """
+        return ("patch", (lease["id"], [
+            {"op": "set", "path": "/continuation", "value": continuation},
+            {"op": "set", "path": "/offset", "value": offset},
+            {"op": "set", "path": "/expires_at", "value": time.time() + self.ttl},
+            # Leases written before they opted out of the retention TTL.
+            {"op": "set", "path": "/ttl", "value": KEEP_FOREVER}
+        ]), {"filter_predicate": self._owned_predicate()})
+
+    def _lease_id(self, range_id):
+        return f"lease:{self.name}:{range_id}"
+
+    def _owned_predicate(self):
+        return f"FROM c WHERE c.owner = '{self.owner}'"
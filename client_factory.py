@@ -0,0 +1,204 @@
+"""Shared, tuned HTTP transports for the Azure AI and Cosmos DB clients.
+
+Both SDKs default to a `requests` session whose urllib3 pool keeps at most
+10 connections per host.  With more gunicorn threads than that, the extra
+requests open a fresh TLS connection and throw it away afterwards
+("Connection pool is full, discarding connection"), which shows up as
+connection churn and latency spikes under load.  This module builds the
+clients on one explicitly configured transport per service:
+
+* a pool sized for the worker's concurrency (`HTTP_POOL_SIZE`), optionally
+  blocking instead of overflowing (`HTTP_POOL_BLOCK`);
+* TCP keep-alive on pooled sockets, so idle connections survive load
+  balancers that silently drop quiet flows after a few minutes;
+* connect/read timeouts (`HTTP_CONNECT_TIMEOUT`, `HTTP_READ_TIMEOUT`);
+* retries with exponential backoff for 429/throttling and transient 5xx
+  responses.  The Azure AI pipeline honours `Retry-After`; Cosmos DB uses
+  its own throttle retry (`COSMOS_RETRY_TOTAL`, `COSMOS_RETRY_BACKOFF_MAX`).
+
+`pool_snapshot()` reports per-host pool utilization for `/api/pool-metrics`.
+The `create_async_*` functions build the same clients from the aio SDKs on
+an aiohttp transport with the same pool, timeout and retry settings.
+"""
+
+import os
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from azure.ai.projects import AIProjectClient
+from azure.core.pipeline.transport import RequestsTransport
+from azure.cosmos import CosmosClient
+
+# Named transports built so far, for metrics and shutdown.
+_transports = {}
+_lock = threading.Lock()
+
+
+def _env_bool(name, default):
+    return os.getenv(name, default).lower() == "true"
+
+
+def _keepalive_socket_options(idle=60, interval=15, count=4):
+    """Socket options that enable TCP keep-alive where the platform allows."""
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    for name, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """`HTTPAdapter` whose pooled connections use TCP keep-alive."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = _keepalive_socket_options()
+        super().init_poolmanager(*args, **kwargs)
+
+
+def build_transport(name, pool_size=None, pool_block=None,
+                    connect_timeout=None, read_timeout=None):
+    """Return the shared transport `name`, creating it on first use."""
+    with _lock:
+        if name in _transports:
+            return _transports[name]["transport"]
+
+        pool_size = pool_size or int(os.getenv("HTTP_POOL_SIZE", "32"))
+        if pool_block is None:
+            pool_block = _env_bool("HTTP_POOL_BLOCK", "false")
+        adapter = _KeepAliveAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=pool_block)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        # `session_owner=False`: several pipelines share this session, so
+        # none of them may close it when it is done.
+        transport = RequestsTransport(
+            session=session,
+            session_owner=False,
+            connection_timeout=connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+            read_timeout=read_timeout or float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+        )
+        _transports[name] = {"transport": transport, "session": session,
+                             "adapter": adapter, "pool_size": pool_size}
+        return transport
+
+
+def create_project_client(endpoint, credential, **kwargs):
+    """Build an `AIProjectClient` (and its agents client) on the shared transport."""
+    options = {
+        "transport": build_transport("agents"),
+        # azure-core retries 408/429/5xx and waits for `Retry-After` when
+        # the service sends it, else backs off exponentially.
+        "retry_total": int(os.getenv("HTTP_RETRY_TOTAL", "5")),
+        "retry_backoff_factor": float(os.getenv("HTTP_RETRY_BACKOFF_FACTOR", "0.8")),
+        "retry_backoff_max": float(os.getenv("HTTP_RETRY_BACKOFF_MAX", "60")),
+    }
+    options.update(kwargs)
+    return AIProjectClient(credential=credential, endpoint=endpoint, **options)
+
+
+def create_cosmos_client(endpoint, key, **kwargs):
+    """Build a `CosmosClient` on the shared transport with throttle retries."""
+    options = {
+        "transport": build_transport("cosmos"),
+        # Cosmos DB request timeout, in seconds.
+        "connection_timeout": float(os.getenv("COSMOS_REQUEST_TIMEOUT", "60")),
+        # Retries of 429 (request rate too large) responses, and the total
+        # time they may wait, on top of the connection retries.
+        "retry_total": int(os.getenv("COSMOS_RETRY_TOTAL", "9")),
+        "retry_backoff_max": int(os.getenv("COSMOS_RETRY_BACKOFF_MAX", "30")),
+    }
+    options.update(kwargs)
+    return CosmosClient(endpoint, key, **options)
+
+
+def build_async_transport(pool_size=None, connect_timeout=None, read_timeout=None):
+    """Return an aiohttp transport with a sized, keep-alive connection pool.
+
+    Must be called inside the running event loop (asgi_app.py start-up).
+    Each async client owns its transport and closes it with the client.
+    """
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    connector = aiohttp.TCPConnector(
+        limit=pool_size or int(os.getenv("HTTP_POOL_SIZE", "32")),
+        keepalive_timeout=60
+    )
+    return AioHttpTransport(
+        session=aiohttp.ClientSession(connector=connector),
+        session_owner=True,
+        connection_timeout=connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+        read_timeout=read_timeout or float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+    )
+
+
+def create_async_project_client(endpoint, credential, **kwargs):
+    """`create_project_client` for `azure.ai.projects.aio`."""
+    from azure.ai.projects.aio import AIProjectClient as AsyncAIProjectClient
+
+    options = {
+        "transport": build_async_transport(),
+        "retry_total": int(os.getenv("HTTP_RETRY_TOTAL", "5")),
+        "retry_backoff_factor": float(os.getenv("HTTP_RETRY_BACKOFF_FACTOR", "0.8")),
+        "retry_backoff_max": float(os.getenv("HTTP_RETRY_BACKOFF_MAX", "60")),
+    }
+    options.update(kwargs)
+    return AsyncAIProjectClient(credential=credential, endpoint=endpoint, **options)
+
+
+def create_async_cosmos_client(endpoint, key, **kwargs):
+    """`create_cosmos_client` for `azure.cosmos.aio`."""
+    from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+
+    options = {
+        "transport": build_async_transport(),
+        "connection_timeout": float(os.getenv("COSMOS_REQUEST_TIMEOUT", "60")),
+        "retry_total": int(os.getenv("COSMOS_RETRY_TOTAL", "9")),
+        "retry_backoff_max": int(os.getenv("COSMOS_RETRY_BACKOFF_MAX", "30")),
+    }
+    options.update(kwargs)
+    return AsyncCosmosClient(endpoint, key, **options)
+
+
+def pool_snapshot():
+    """Return connection pool utilization per transport and host."""
+    with _lock:
+        transports = dict(_transports)
+
+    snapshot = {}
+    for name, entry in transports.items():
+        hosts = {}
+        manager = entry["adapter"].poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            # The queue holds one slot per allowed connection: idle
+            # connections, plus `None` for slots never used; connections
+            # checked out by a request are missing from it.
+            slots = list(pool.pool.queue)
+            in_use = max(0, pool.pool.maxsize - len(slots))
+            hosts[f"{pool.scheme}://{pool.host}"] = {
+                "max_size": pool.pool.maxsize,
+                "in_use": in_use,
+                "idle_connections": sum(1 for conn in slots if conn is not None),
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "utilization": round(in_use / pool.pool.maxsize, 3)
+            }
+        snapshot[name] = {"pool_size": entry["pool_size"], "hosts": hosts}
+    return snapshot
+
+
+def close_transports():
+    """Close every shared session (registered as an `atexit` hook)."""
+    with _lock:
+        transports = list(_transports.values())
+        _transports.clear()
+    for entry in transports:
+        entry["session"].close()
@@ -0,0 +1,184 @@
+"""Container provisioning: indexing policies and log retention.
+
+By default Cosmos DB indexes every path of every document, which for the
+log container includes the whole free-text `data.content` payload.  Write
+RU cost grows with the number of indexed paths, yet the app only ever
+filters or sorts on `thread_id`, `log_type` and `timestamp`.  The policies
+here keep the index to what the queries in `cosmos_queries.py` need:
+
+* logs: everything under `/data/*` (`/d/*` in the compact format) is
+  excluded, and composite indexes cover `(thread_id, timestamp)`,
+  `(thread_id, ts)` and `(log_type, timestamp)` for the ordered thread and
+  log-type queries;
+* summaries/stats/rollups: only the partition, `last_activity` and the
+  rollups' `hour` are indexed.
+
+An optional default TTL (`COSMOS_LOG_RETENTION_DAYS`) lets Cosmos expire old
+logs by itself.  Thread summaries get the same TTL; every update refreshes a
+summary's `_ts`, so a summary expires only after its thread has been idle
+for the whole retention period.  The other documents of the summaries
+container set `ttl` to `KEEP_FOREVER`: an expired stats document would force
+a full recount, and expired change-feed leases would replay the feed into
+the analytics rollups and count it twice.  Without a retention TTL the
+summaries container still has TTL turned on (`KEEP_FOREVER` by default),
+because the analytics dedup markers expire by their own `ttl`.
+
+`create_container_if_not_exists` leaves existing containers untouched, so
+run `python cosmos_provisioning.py` (or set `COSMOS_APPLY_PROVISIONING=true`)
+to push the policies to containers created before this existed.  Ad-hoc
+queries that filter on `data.*` fields still work but have to scan.
+"""
+
+import os
+
+from azure.cosmos import PartitionKey
+
+# Per-document `ttl` that opts a document out of the container's default TTL.
+KEEP_FOREVER = -1
+
+LOG_INDEXING_POLICY = {
+    "indexingMode": "consistent",
+    "automatic": True,
+    "includedPaths": [{"path": "/*"}],
+    "excludedPaths": [
+        {"path": "/data/*"},
+        {"path": "/d/*"},
+        {"path": "/\"_etag\"/?"}
+    ],
+    "compositeIndexes": [
+        [
+            {"path": "/thread_id", "order": "ascending"},
+            {"path": "/timestamp", "order": "ascending"}
+        ],
+        [
+            {"path": "/thread_id", "order": "ascending"},
+            {"path": "/ts", "order": "ascending"}
+        ],
+        [
+            {"path": "/log_type", "order": "ascending"},
+            {"path": "/timestamp", "order": "descending"}
+        ]
+    ]
+}
+
+SUMMARY_INDEXING_POLICY = {
+    "indexingMode": "consistent",
+    "automatic": True,
+    "includedPaths": [
+        {"path": "/partition/?"},
+        {"path": "/thread_id/?"},
+        {"path": "/last_activity/?"},
+        {"path": "/hour/?"}
+    ],
+    "excludedPaths": [{"path": "/*"}],
+    # The summaries listing orders by activity with the thread ID as tie-break.
+    "compositeIndexes": [[
+        {"path": "/last_activity", "order": "descending"},
+        {"path": "/thread_id", "order": "descending"}
+    ]]
+}
+
+
+def retention_ttl():
+    """Return the configured default TTL in seconds, or None to keep forever."""
+    days = os.getenv("COSMOS_LOG_RETENTION_DAYS")
+    if not days:
+        return None
+    return int(float(days) * 86400)
+
+
+def provision_container(database, container_id, partition_key_path, indexing_policy,
+                        default_ttl=None, apply_to_existing=False):
+    """Create a container with the given policy, optionally updating an existing one.
+
+    `partition_key_path` may be a list of paths for a hierarchical
+    (MultiHash) partition key.
+    """
+    partition_key, options = _container_settings(partition_key_path, indexing_policy, default_ttl)
+    container = database.create_container_if_not_exists(
+        id=container_id,
+        partition_key=partition_key,
+        **options
+    )
+
+    if apply_to_existing:
+        properties = container.read()
+        if (_policy_key(properties.get("indexingPolicy", {})) != _policy_key(indexing_policy)
+                or properties.get("defaultTtl") != default_ttl):
+            # Re-indexing happens online in the background after a
+            # policy change; the container stays fully usable.
+            container = database.replace_container(
+                container,
+                partition_key=partition_key,
+                **options
+            )
+            print(f"✓ Updated indexing policy/TTL for container {container_id}")
+
+    return container
+
+
+async def provision_container_async(database, container_id, partition_key_path, indexing_policy,
+                                    default_ttl=None):
+    """Create a container on an `azure.cosmos.aio` database (asgi_app.py).
+
+    Existing containers are left as they are; apply policy changes with
+    `python cosmos_provisioning.py`.
+    """
+    partition_key, options = _container_settings(partition_key_path, indexing_policy, default_ttl)
+    return await database.create_container_if_not_exists(
+        id=container_id,
+        partition_key=partition_key,
+        **options
+    )
+
+
+def _container_settings(partition_key_path, indexing_policy, default_ttl):
+    if isinstance(partition_key_path, list):
+        partition_key = PartitionKey(path=partition_key_path, kind="MultiHash")
+    else:
+        partition_key = PartitionKey(path=partition_key_path)
+    options = {"indexing_policy": indexing_policy}
+    if default_ttl:
+        options["default_ttl"] = default_ttl
+    return partition_key, options
+
+
+def _policy_key(policy):
+    """Reduce an indexing policy to the parts we set, ignoring ordering."""
+    return (
+        sorted(path["path"] for path in policy.get("includedPaths", [])),
+        sorted(path["path"] for path in policy.get("excludedPaths", [])),
+        sorted(
+            tuple((index["path"], index.get("order", "ascending")) for index in composite)
+            for composite in policy.get("compositeIndexes", [])
+        )
+    )
+
+
+def provision_log_container(database, container_id, apply_to_existing=False):
+    """Create (or update) the thread log container."""
+    return provision_container(database, container_id, "/thread_id", LOG_INDEXING_POLICY,
+                               default_ttl=retention_ttl(), apply_to_existing=apply_to_existing)
+
+
+def provision_summaries_container(database, container_id, apply_to_existing=False):
+    """Create (or update) the thread summaries/stats container."""
+    # Without retention TTL stays on but never expires anything by default,
+    # so the per-document `ttl` of the analytics markers still applies.
+    return provision_container(database, container_id, "/partition", SUMMARY_INDEXING_POLICY,
+                               default_ttl=retention_ttl() or KEEP_FOREVER,
+                               apply_to_existing=apply_to_existing)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from azure.cosmos import CosmosClient
+
+    load_dotenv()
+    client = CosmosClient(os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY"))
+    database = client.create_database_if_not_exists(id=os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB"))
+    provision_log_container(
+        database, os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs"), apply_to_existing=True)
+    provision_summaries_container(
+        database, os.getenv("COSMOS_SUMMARIES_CONTAINER_NAME", "ThreadSummaries"), apply_to_existing=True)
+    print("✓ Provisioning complete")
@@ -0,0 +1,355 @@
+"""Every Cosmos DB query the app issues, defined once and metered.
+
+Queries used to be ad-hoc f-strings scattered through app.py, with
+`thread_id` interpolated straight into the SQL.  That is an injection risk
+and also gives the service a different query text for every thread, so it
+cannot reuse query plans.  Here each query is a named, parameterized
+statement with:
+
+* a fixed text, so identical statements are sent for every caller;
+* an explicit scope – `PARTITION` queries must be given a partition key and
+  never fan out, `CROSS_PARTITION` ones opt into fan-out deliberately;
+* a projection of just the fields its callers use, leaving out the system
+  properties (`_rid`, `_self`, `_etag`, ...) to keep responses small.
+
+`QueryRepository` runs them and records, per query name, the RU charge (from
+the `x-ms-request-charge` header of every page) and page latency.  The app
+exposes the numbers at `/api/query-metrics`.
+"""
+
+import re
+import threading
+import time
+
+PARTITION = "partition"
+CROSS_PARTITION = "cross_partition"
+
+# Fields the UI and the summaries need from a log document.
+LOG_FIELDS = "c.id, c.thread_id, c.log_type, c.timestamp, c.data"
+# The same for logs stored in the compact format (see log_format.py).
+COMPACT_LOG_FIELDS = "c.id, c.thread_id, c.t, c.ts, c.v, c.d"
+
+
+class CosmosQuery:
+    """A named, parameterized query statement."""
+
+    def __init__(self, name, text, scope, description):
+        self.name = name
+        self.text = text
+        self.scope = scope
+        self.description = description
+        self.parameters = frozenset(re.findall(r"@\w+", text))
+
+
+QUERIES = {query.name: query for query in [
+    CosmosQuery(
+        "thread_logs",
+        f"SELECT {LOG_FIELDS} FROM c WHERE c.thread_id = @thread_id ORDER BY c.timestamp ASC",
+        PARTITION,
+        "All logs of one thread, oldest first"
+    ),
+    CosmosQuery(
+        "thread_logs_since",
+        f"SELECT {LOG_FIELDS} FROM c WHERE c.thread_id = @thread_id AND c.timestamp > @since "
+        "ORDER BY c.timestamp ASC",
+        PARTITION,
+        "Logs of one thread stored after a timestamp cursor"
+    ),
+    CosmosQuery(
+        "logs_by_type",
+        f"SELECT {LOG_FIELDS} FROM c WHERE c.log_type = @log_type ORDER BY c.timestamp DESC",
+        CROSS_PARTITION,
+        "Newest logs of one type across all threads"
+    ),
+    CosmosQuery(
+        "distinct_threads",
+        "SELECT DISTINCT VALUE c.thread_id FROM c",
+        CROSS_PARTITION,
+        "Every thread ID with stored logs"
+    ),
+    CosmosQuery(
+        "count_logs",
+        "SELECT VALUE COUNT(1) FROM c",
+        CROSS_PARTITION,
+        "Total number of log documents"
+    ),
+    CosmosQuery(
+        "count_by_log_type",
+        "SELECT c.log_type, COUNT(1) AS count FROM c GROUP BY c.log_type",
+        CROSS_PARTITION,
+        "Number of log documents per log_type"
+    ),
+    CosmosQuery(
+        "summary_fields",
+        "SELECT c.thread_id, c.log_type, c.timestamp, c.data.status, c.data.session_id FROM c",
+        CROSS_PARTITION,
+        "Just the fields needed to rebuild thread summaries"
+    ),
+    CosmosQuery(
+        "thread_logs_compact",
+        f"SELECT {COMPACT_LOG_FIELDS} FROM c WHERE c.thread_id = @thread_id ORDER BY c.ts ASC",
+        PARTITION,
+        "All compact logs of one thread, oldest first"
+    ),
+    CosmosQuery(
+        "thread_logs_since_compact",
+        f"SELECT {COMPACT_LOG_FIELDS} FROM c WHERE c.thread_id = @thread_id AND c.ts > @since "
+        "ORDER BY c.ts ASC",
+        PARTITION,
+        "Compact logs of one thread stored after an epoch-millisecond cursor"
+    ),
+    CosmosQuery(
+        "count_by_log_type_compact",
+        "SELECT c.t AS log_type, COUNT(1) AS count FROM c GROUP BY c.t",
+        CROSS_PARTITION,
+        "Number of compact log documents per log type code"
+    ),
+    CosmosQuery(
+        "summary_fields_compact",
+        "SELECT c.thread_id, c.t AS log_type, c.ts AS timestamp, c.d.st AS status, "
+        "c.d.sid AS session_id FROM c",
+        CROSS_PARTITION,
+        "summary_fields of compact logs (codes and epoch milliseconds)"
+    ),
+    CosmosQuery(
+        "full_format_logs",
+        f"SELECT {LOG_FIELDS} FROM c WHERE NOT IS_DEFINED(c.v)",
+        CROSS_PARTITION,
+        "Logs still in the full format, for the compact migration"
+    ),
+    CosmosQuery(
+        "day_logs",
+        f"SELECT {LOG_FIELDS} FROM c ORDER BY c.timestamp ASC",
+        PARTITION,
+        "All logs of one day bucket (prefix partition key [day])"
+    ),
+    CosmosQuery(
+        "day_logs_by_type",
+        f"SELECT {LOG_FIELDS} FROM c WHERE c.log_type = @log_type ORDER BY c.timestamp ASC",
+        PARTITION,
+        "Logs of one type in one day bucket"
+    ),
+    CosmosQuery(
+        "day_counts_by_log_type",
+        "SELECT c.log_type, COUNT(1) AS count FROM c GROUP BY c.log_type",
+        PARTITION,
+        "Number of logs per log_type in one day bucket"
+    ),
+    CosmosQuery(
+        "thread_summaries_page",
+        "SELECT TOP @limit c.thread_id, c.message_count, c.total_logs, c.first_activity, "
+        "c.last_activity, c.last_run_status FROM c WHERE ARRAY_CONTAINS(@partitions, c.partition) "
+        "AND (c.last_activity < @before OR (c.last_activity = @before AND c.thread_id < @thread_id)) "
+        "ORDER BY c.last_activity DESC, c.thread_id DESC",
+        CROSS_PARTITION,
+        "Thread summaries active before a (last_activity, thread_id) cursor, most recent first"
+    ),
+    CosmosQuery(
+        "count_thread_summaries",
+        "SELECT VALUE COUNT(1) FROM c WHERE ARRAY_CONTAINS(@partitions, c.partition)",
+        CROSS_PARTITION,
+        "Number of thread summaries"
+    ),
+    CosmosQuery(
+        "summary_ids",
+        "SELECT c.id FROM c WHERE c.partition = @partition",
+        PARTITION,
+        "IDs of the documents in one summaries partition"
+    ),
+    CosmosQuery(
+        "analytics_rollups_since",
+        "SELECT c.kind, c.hour, c.model, c.runs, c.failed, c.duration_count, c.duration_ms_sum, "
+        "c.statuses, c.histogram, c.messages, c.roles, c.characters FROM c "
+        "WHERE c.partition = @partition AND c.hour >= @since",
+        PARTITION,
+        "Hourly run and message rollups from an hour on (run_analytics.py)"
+    ),
+    CosmosQuery(
+        "counted_logs",
+        "SELECT VALUE c.id FROM c WHERE c.partition = @partition AND ARRAY_CONTAINS(@ids, c.id)",
+        PARTITION,
+        "Which logs of a change feed page the rollups already counted (run_analytics.py)"
+    ),
+]}
+
+
+class QueryRepository:
+    """Run registered queries and keep per-query RU and latency metrics."""
+
+    def __init__(self, queries=None):
+        self.queries = queries or QUERIES
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def iterate(self, container, name, parameters=None, partition_key=None, page_size=None):
+        """Yield every result of a query, fetching pages lazily."""
+        for page in self._pages(container, name, parameters, partition_key, page_size):
+            yield from page
+
+    def page(self, container, name, parameters=None, partition_key=None,
+             page_size=50, continuation=None):
+        """Return one page of results and the continuation token for the next."""
+        pages = self._pages(container, name, parameters, partition_key, page_size, continuation)
+        page = next(pages, [])
+        return page, pages.continuation_token
+
+    def first(self, container, name, parameters=None, partition_key=None):
+        """Return the first result (e.g. of a `VALUE COUNT(1)`), or None."""
+        return next(self.iterate(container, name, parameters, partition_key), None)
+
+    def pages(self, container, name, parameters=None, partition_key=None,
+              page_size=None, continuation=None):
+        """Iterate result pages; `continuation_token` resumes after the last one."""
+        return self._pages(container, name, parameters, partition_key, page_size, continuation)
+
+    # The `_async` variants take an `azure.cosmos.aio` container and share
+    # the same metrics (used by asgi_app.py).
+
+    async def iterate_async(self, container, name, parameters=None, partition_key=None, page_size=None):
+        """Async version of `iterate`."""
+        async for page in self._pages_async(container, name, parameters, partition_key, page_size):
+            for item in page:
+                yield item
+
+    async def page_async(self, container, name, parameters=None, partition_key=None,
+                         page_size=50, continuation=None):
+        """Async version of `page`."""
+        pages = self._pages_async(container, name, parameters, partition_key, page_size, continuation)
+        page = await anext(pages, [])
+        return page, pages.continuation_token
+
+    async def first_async(self, container, name, parameters=None, partition_key=None):
+        """Async version of `first`."""
+        async for item in self.iterate_async(container, name, parameters, partition_key):
+            return item
+        return None
+
+    def snapshot(self):
+        """Return the metrics per query name, most expensive first."""
+        with self._lock:
+            metrics = {name: dict(values) for name, values in self._metrics.items()}
+        for values in metrics.values():
+            values["avg_request_charge"] = values["request_charge"] / max(1, values["calls"])
+            values["avg_page_ms"] = values["total_ms"] / max(1, values["pages"])
+        return dict(sorted(metrics.items(), key=lambda item: -item[1]["request_charge"]))
+
+    def _pages(self, container, name, parameters, partition_key, page_size, continuation=None):
+        charges = []
+        iterator = container.query_items(
+            **self._query_options(name, parameters, partition_key, page_size, charges)
+        ).by_page(continuation)
+        self._record(name, calls=1)
+        return _MeteredPages(iterator, self._page_recorder(name, charges))
+
+    def _pages_async(self, container, name, parameters, partition_key, page_size, continuation=None):
+        charges = []
+        options = self._query_options(name, parameters, partition_key, page_size, charges)
+        # The async client always fans out cross-partition queries.
+        options.pop("enable_cross_partition_query", None)
+        iterator = container.query_items(**options).by_page(continuation)
+        self._record(name, calls=1)
+        return _MeteredAsyncPages(iterator, self._page_recorder(name, charges))
+
+    def _query_options(self, name, parameters, partition_key, page_size, charges):
+        query = self.queries[name]
+        given = set(parameters or {})
+        if given != query.parameters:
+            raise ValueError(f"Query '{name}' takes {sorted(query.parameters)}, got {sorted(given)}")
+        options = {}
+        if query.scope == PARTITION:
+            if partition_key is None:
+                raise ValueError(f"Query '{name}' is partition-scoped and needs a partition key")
+            options["partition_key"] = partition_key
+        else:
+            options["enable_cross_partition_query"] = True
+
+        return dict(
+            query=query.text,
+            parameters=[{"name": key, "value": value} for key, value in (parameters or {}).items()],
+            max_item_count=page_size,
+            raw_response_hook=lambda response: charges.append(
+                response.http_response.headers.get("x-ms-request-charge", 0)),
+            **options
+        )
+
+    def _page_recorder(self, name, charges):
+        return lambda elapsed, items: self._record(
+            name,
+            pages=1,
+            items=items,
+            elapsed=elapsed,
+            request_charge=_drain_charges(charges)
+        )
+
+    def _record(self, name, calls=0, pages=0, items=0, elapsed=0.0, request_charge=0.0):
+        with self._lock:
+            values = self._metrics.setdefault(name, {
+                "calls": 0,
+                "pages": 0,
+                "items": 0,
+                "request_charge": 0.0,
+                "total_ms": 0.0,
+                "max_page_ms": 0.0
+            })
+            values["calls"] += calls
+            values["pages"] += pages
+            values["items"] += items
+            values["request_charge"] += request_charge
+            values["total_ms"] += elapsed * 1000
+            values["max_page_ms"] = max(values["max_page_ms"], elapsed * 1000)
+
+
+class _MeteredPages:
+    """Page iterator that times each page fetch and reports it."""
+
+    def __init__(self, pages, on_page):
+        self._pages = pages
+        self._on_page = on_page
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        page = list(next(self._pages))
+        self._on_page(time.perf_counter() - start, len(page))
+        return page
+
+
+class _MeteredAsyncPages:
+    """Async counterpart of `_MeteredPages`."""
+
+    def __init__(self, pages, on_page):
+        self._pages = pages
+        self._on_page = on_page
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        start = time.perf_counter()
+        page = [item async for item in await anext(self._pages)]
+        self._on_page(time.perf_counter() - start, len(page))
+        return page
+
+
+def _drain_charges(charges):
+    total = 0.0
+    while charges:
+        try:
+            total += float(charges.pop())
+        except (TypeError, ValueError):
+            pass
+    return total
+
+
+# Shared repository used by the app and its helper modules.
+queries = QueryRepository()
@@ -0,0 +1,418 @@
+"""Incrementally maintained log statistics for `/api/cosmos-stats`.
+
+The stats endpoint used to run three cross-partition queries on every call
+(COUNT, GROUP BY log_type and DISTINCT thread_id), so its RU cost grew with
+the container.  `CosmosStats` keeps the same numbers in a single stats
+document instead:
+
+* every log document the writer stores is counted in memory (it is a log
+  listener, just like the thread summaries);
+* the in-memory deltas are flushed every few seconds with one `patch_item`
+  `incr` per counter, which is safe with many workers writing at once;
+* reads are a single point read of the stats document, cached for a few
+  seconds, plus this process's not-yet-flushed deltas.
+
+The stats document is bootstrapped (and can be repaired) from the original
+full queries by `reconcile()`, in the background when `get()` finds no
+document; run `python cosmos_stats.py` to do that by hand.  Deltas flushed
+by other workers while a reconcile is scanning may be counted twice, so
+reconcile during quiet periods.
+
+If a flush fails part-way, only the patch chunks that were not applied are
+queued again, so a retry never counts the applied ones twice.  `record()`
+itself is not idempotent per `log_format.log_key`: a log that is written
+again (a retried upsert overwrites a compact document in place) is counted
+again, and only the next reconcile corrects that.
+
+The counters only ever go up, so with a retention TTL on the log container
+they drift above what is actually stored as old logs expire.  With
+`reconcile_interval` set (`COSMOS_STATS_RECONCILE_INTERVAL`, daily by
+default when `COSMOS_LOG_RETENTION_DAYS` is set) the flush loop recounts
+whenever the stats document is older than that.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+
+from azure.cosmos import exceptions
+
+from cosmos_provisioning import KEEP_FOREVER, retention_ttl
+from cosmos_queries import queries
+from log_format import log_query, log_type_name
+
+STATS_PARTITION = "stats"
+STATS_DOCUMENT_ID = "log_stats"
+
+# Cosmos DB accepts at most 10 operations per patch request.
+MAX_PATCH_OPERATIONS = 10
+# Longest wait between checks whether a periodic reconcile is due.
+RECONCILE_CHECK_INTERVAL = 3600
+
+
+def reconcile_interval():
+    """Seconds between periodic recounts; 0 turns them off."""
+    default = "86400" if retention_ttl() else "0"
+    return float(os.getenv("COSMOS_STATS_RECONCILE_INTERVAL", default))
+
+
+class CosmosStats:
+    """Aggregate log counts kept in one document and served from a cache."""
+
+    def __init__(self, container, log_container, flush_interval=5.0, cache_ttl=10.0,
+                 partition=STATS_PARTITION, reconcile_interval=0):
+        self.container = container
+        self.log_container = log_container
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.partition = partition
+        self.reconcile_interval = reconcile_interval
+        self._next_reconcile_check = 0.0
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._cached = None
+        self._cached_at = 0.0
+        self._reconciling = False
+        self._reconcile_thread = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cosmos-stats", daemon=True)
+        self._thread.start()
+
+    def record(self, documents):
+        """Count freshly written log documents (log writer listener)."""
+        with self._lock:
+            count_documents(self._pending, documents)
+
+    def get(self):
+        """Return `{total_logs, total_threads, log_types}` for the endpoint.
+
+        Until a missing stats document has been recounted in the background,
+        only this process's pending deltas are reported.
+        """
+        now = time.monotonic()
+        with self._lock:
+            stale = self._cached is None or now - self._cached_at > self.cache_ttl
+        if stale:
+            document = self._read()
+            if document is None:
+                self._start_reconcile()
+            else:
+                with self._lock:
+                    self._cached = document
+                    self._cached_at = now
+
+        with self._lock:
+            return combine_counts(self._cached or {}, self._pending)
+
+    def flush(self):
+        """Push pending deltas to the stats document."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+
+        batches = patch_batches(pending)
+        for index, operations in enumerate(batches):
+            try:
+                self.container.patch_item(
+                    item=STATS_DOCUMENT_ID,
+                    partition_key=self.partition,
+                    patch_operations=operations
+                )
+            except exceptions.CosmosResourceNotFoundError:
+                # No stats document yet: the full recount includes
+                # everything we had pending.  Every worker's flush lands
+                # here, so only one recount runs per process.
+                self._start_reconcile()
+                return
+            except Exception as e:
+                print(f"Error flushing log stats to Cosmos DB: {e}")
+                with self._lock:
+                    self._pending.update(batch_counts(batches[index:]))
+                return
+            # Keep the cached copy in step so the flushed deltas do not
+            # vanish from `get()` until the cache expires.
+            with self._lock:
+                if self._cached is not None:
+                    fold_counts(self._cached, batch_counts([operations]))
+
+    def reconcile(self):
+        """Recount everything with full queries and overwrite the document."""
+        # The recount includes every log written so far, so the deltas
+        # pending until now must not be added on top of it.
+        with self._lock:
+            self._pending = Counter()
+        total_logs = queries.first(self.log_container, "count_logs") or 0
+        log_types = list(queries.iterate(self.log_container, log_query("count_by_log_type")))
+        total_threads = sum(1 for _ in queries.iterate(self.log_container, "distinct_threads"))
+
+        document = stats_document(self.partition, total_logs, total_threads, log_types)
+        self.container.upsert_item(body=document)
+        with self._lock:
+            self._cached = document
+            self._cached_at = time.monotonic()
+        return document
+
+    def close(self):
+        """Stop the flush thread, push any remaining deltas and finish a recount."""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        if self._reconcile_thread:
+            self._reconcile_thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            self._reconcile_if_due()
+
+    def _reconcile_if_due(self):
+        """Recount when the stats document is older than `reconcile_interval`."""
+        if not self.reconcile_interval or time.monotonic() < self._next_reconcile_check:
+            return
+        self._next_reconcile_check = time.monotonic() + min(self.reconcile_interval, RECONCILE_CHECK_INTERVAL)
+        try:
+            document = self._read()
+            if document is None or time.time() - document.get("reconciled_at", 0) >= self.reconcile_interval:
+                self.reconcile()
+        except Exception as e:
+            print(f"Error reconciling log stats: {e}")
+
+    def _start_reconcile(self):
+        """Recount on a background thread, unless a recount is already running."""
+        with self._lock:
+            if self._reconciling:
+                return
+            self._reconciling = True
+            self._reconcile_thread = threading.Thread(target=self._reconcile_in_background,
+                                                      name="cosmos-stats-reconcile", daemon=True)
+        self._reconcile_thread.start()
+
+    def _reconcile_in_background(self):
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f"Error reconciling log stats: {e}")
+        finally:
+            with self._lock:
+                self._reconciling = False
+
+    def _read(self):
+        try:
+            return self.container.read_item(item=STATS_DOCUMENT_ID, partition_key=self.partition)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+
+class AsyncCosmosStats:
+    """`CosmosStats` for `azure.cosmos.aio` containers (asgi_app.py).
+
+    Flushes from an asyncio task instead of a thread; call `start()` from
+    within the running event loop.
+    """
+
+    def __init__(self, container, log_container, flush_interval=5.0, cache_ttl=10.0,
+                 partition=STATS_PARTITION, reconcile_interval=0):
+        self.container = container
+        self.log_container = log_container
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.partition = partition
+        self.reconcile_interval = reconcile_interval
+        self._next_reconcile_check = 0.0
+        self._pending = Counter()
+        self._cached = None
+        self._cached_at = 0.0
+        self._task = None
+        self._reconcile_task = None
+
+    def start(self):
+        """Start the periodic flush task."""
+        self._task = asyncio.create_task(self._run())
+
+    def record(self, documents):
+        """Count freshly written log documents (log writer listener)."""
+        count_documents(self._pending, documents)
+
+    async def get(self):
+        """Return `{total_logs, total_threads, log_types}` for the endpoint."""
+        now = time.monotonic()
+        if self._cached is None or now - self._cached_at > self.cache_ttl:
+            document = await self._read()
+            if document is not None:
+                self._cached = document
+                self._cached_at = now
+            else:
+                self._start_reconcile()
+        return combine_counts(self._cached or {}, self._pending)
+
+    async def flush(self):
+        """Push pending deltas to the stats document."""
+        pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+        batches = patch_batches(pending)
+        for index, operations in enumerate(batches):
+            try:
+                await self.container.patch_item(
+                    item=STATS_DOCUMENT_ID,
+                    partition_key=self.partition,
+                    patch_operations=operations
+                )
+            except exceptions.CosmosResourceNotFoundError:
+                self._start_reconcile()
+                return
+            except Exception as e:
+                print(f"Error flushing log stats to Cosmos DB: {e}")
+                self._pending.update(batch_counts(batches[index:]))
+                return
+            if self._cached is not None:
+                fold_counts(self._cached, batch_counts([operations]))
+
+    async def reconcile(self):
+        """Recount everything with full queries and overwrite the document."""
+        self._pending = Counter()
+        total_logs = await queries.first_async(self.log_container, "count_logs") or 0
+        log_types = [item async for item in queries.iterate_async(self.log_container, log_query("count_by_log_type"))]
+        total_threads = 0
+        async for _ in queries.iterate_async(self.log_container, "distinct_threads"):
+            total_threads += 1
+
+        document = stats_document(self.partition, total_logs, total_threads, log_types)
+        await self.container.upsert_item(body=document)
+        self._cached = document
+        self._cached_at = time.monotonic()
+        return document
+
+    async def close(self):
+        """Stop the flush task, push any remaining deltas and finish a recount."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._reconcile_task:
+            await self._reconcile_task
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            await self._reconcile_if_due()
+
+    async def _reconcile_if_due(self):
+        if not self.reconcile_interval or time.monotonic() < self._next_reconcile_check:
+            return
+        self._next_reconcile_check = time.monotonic() + min(self.reconcile_interval, RECONCILE_CHECK_INTERVAL)
+        try:
+            document = await self._read()
+            if document is None or time.time() - document.get("reconciled_at", 0) >= self.reconcile_interval:
+                await self.reconcile()
+        except Exception as e:
+            print(f"Error reconciling log stats: {e}")
+
+    def _start_reconcile(self):
+        if self._reconcile_task is None or self._reconcile_task.done():
+            self._reconcile_task = asyncio.create_task(self._reconcile_in_background())
+
+    async def _reconcile_in_background(self):
+        try:
+            await self.reconcile()
+        except Exception as e:
+            print(f"Error reconciling log stats: {e}")
+
+    async def _read(self):
+        try:
+            return await self.container.read_item(item=STATS_DOCUMENT_ID, partition_key=self.partition)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+
+def count_documents(pending, documents):
+    """Add log documents to a `Counter` of pending deltas."""
+    for document in documents:
+        if document.get("log_type") == "thread_summary":
+            continue
+        pending["total_logs"] += 1
+        pending[f"log_types/{document.get('log_type')}"] += 1
+        if document.get("log_type") == "thread_created":
+            pending["total_threads"] += 1
+
+
+def combine_counts(document, pending):
+    """Stats document plus not-yet-flushed deltas, in the endpoint's shape."""
+    log_types = Counter(document.get("log_types") or {})
+    for key, value in pending.items():
+        if key.startswith("log_types/"):
+            log_types[key[len("log_types/"):]] += value
+
+    return {
+        "total_logs": document.get("total_logs", 0) + pending["total_logs"],
+        "total_threads": document.get("total_threads", 0) + pending["total_threads"],
+        "log_types": [
+            {"log_type": log_type, "count": count}
+            for log_type, count in sorted(log_types.items())
+        ]
+    }
+
+
+def fold_counts(document, pending):
+    """Apply flushed deltas to a cached stats document in place."""
+    for key, value in pending.items():
+        if key.startswith("log_types/"):
+            log_types = document.setdefault("log_types", {})
+            log_type = key[len("log_types/"):]
+            log_types[log_type] = log_types.get(log_type, 0) + value
+        else:
+            document[key] = document.get(key, 0) + value
+
+
+def patch_batches(pending):
+    """`incr` operations for the pending deltas, in patch-sized chunks."""
+    operations = [
+        {"op": "incr", "path": f"/{key}", "value": value}
+        for key, value in pending.items()
+    ]
+    return [operations[start:start + MAX_PATCH_OPERATIONS]
+            for start in range(0, len(operations), MAX_PATCH_OPERATIONS)]
+
+
+def batch_counts(batches):
+    """The pending deltas that patch operation chunks would apply."""
+    counts = Counter()
+    for operations in batches:
+        for operation in operations:
+            counts[operation["path"][1:]] += operation["value"]
+    return counts
+
+
+def stats_document(partition, total_logs, total_threads, log_types):
+    """A freshly counted stats document."""
+    return {
+        "id": STATS_DOCUMENT_ID,
+        "partition": partition,
+        "total_logs": total_logs,
+        "total_threads": total_threads,
+        "log_types": {log_type_name(item["log_type"]): item["count"] for item in log_types},
+        "reconciled_at": time.time(),
+        "ttl": KEEP_FOREVER
+    }
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from azure.cosmos import CosmosClient
+
+    load_dotenv()
+    client = CosmosClient(os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY"))
+    database = client.get_database_client(os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB"))
+    stats = CosmosStats(
+        database.get_container_client(os.getenv("COSMOS_SUMMARIES_CONTAINER_NAME", "ThreadSummaries")),
+        database.get_container_client(os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs"))
+    )
+    document = stats.reconcile()
+    print(f"✓ Reconciled stats: {document['total_logs']} logs, {document['total_threads']} threads")
@@ -0,0 +1,237 @@
+"""Token cache with proactive refresh around an Azure credential.
+
+`DefaultAzureCredential` only fetches a token when a client asks for one.
+The SDK pipelines ask when their token is within five minutes of expiry, so
+roughly once an hour a chat request waits on the whole credential chain
+(managed identity endpoint, Azure CLI, ...) before it can even reach the
+agent.  Every gunicorn worker pays that separately.
+
+`CachingCredential` wraps any `TokenCredential`:
+
+* tokens are cached in memory per scope and handed out without a network
+  call;
+* a background thread re-acquires every cached token once it is within
+  `refresh_margin` seconds of expiry (default 10 minutes, i.e. before the
+  pipelines start asking), so requests normally never block on the
+  credential;
+* with `TOKEN_CACHE_FILE` set, tokens are also kept in a Fernet-encrypted
+  file (`TOKEN_CACHE_KEY`, generated with `Fernet.generate_key()`).  Workers
+  on one host read each other's tokens from it, and an exclusive lock file
+  makes sure only one of them acquires a new token at a time.
+
+Requests with `claims` (a CAE challenge) always go to the wrapped
+credential.  `snapshot()` counts how often a caller had to block on token
+acquisition and for how long.
+"""
+
+import json
+import os
+import threading
+import time
+
+from azure.core.credentials import AccessToken
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the file is still shared.
+    fcntl = None
+
+
+class _EncryptedTokenFile:
+    """Tokens of all scopes in one encrypted JSON file, guarded by a lock file."""
+
+    def __init__(self, path, key):
+        from cryptography.fernet import Fernet
+
+        self.path = path
+        self._fernet = Fernet(key)
+        self._lock_path = f"{path}.lock"
+
+    def read(self):
+        try:
+            with open(self.path, "rb") as handle:
+                return json.loads(self._fernet.decrypt(handle.read()))
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            # Corrupt file or a different key: start over.
+            print(f"⚠ Warning: Ignoring unreadable token cache file: {type(e).__name__} {e}")
+            return {}
+
+    def write(self, tokens):
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(self._fernet.encrypt(json.dumps(tokens).encode("utf-8")))
+        os.replace(temporary, self.path)
+
+    def locked(self):
+        return _FileLock(self._lock_path)
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._handle = None
+
+    def __enter__(self):
+        self._handle = open(self.path, "a")
+        if fcntl:
+            fcntl.flock(self._handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+        self._handle.close()
+
+
+class CachingCredential:
+    """`TokenCredential` wrapper that caches tokens and refreshes them early."""
+
+    def __init__(self, credential, refresh_margin=600, check_interval=30,
+                 cache_file=None, cache_key=None):
+        self.credential = credential
+        self.refresh_margin = refresh_margin
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._acquire_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {
+            "memory_hits": 0,
+            "file_hits": 0,
+            "blocking_acquisitions": 0,
+            "blocked_ms_total": 0.0,
+            "blocked_ms_max": 0.0,
+            "background_refreshes": 0,
+            "refresh_failures": 0,
+        }
+
+        self._file = None
+        if cache_file:
+            if not cache_key:
+                print("⚠ Warning: TOKEN_CACHE_FILE is set without TOKEN_CACHE_KEY; file cache disabled.")
+            else:
+                try:
+                    self._file = _EncryptedTokenFile(cache_file, cache_key)
+                except Exception as e:
+                    print(f"⚠ Warning: Token file cache disabled: {e}")
+
+        self._refresher = threading.Thread(target=self._refresh_loop, args=(check_interval,),
+                                           name="token-refresher", daemon=True)
+        self._refresher.start()
+
+    def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        """Return a cached token, acquiring one only when none is usable."""
+        if claims:
+            return self.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+
+        key = _cache_key(scopes, tenant_id)
+        token = self._cached(key, min_validity=60)
+        if token:
+            self._bump("memory_hits")
+            return token
+
+        start = time.perf_counter()
+        token = self._acquire(key, scopes, tenant_id, kwargs, min_validity=60)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.stats["blocking_acquisitions"] += 1
+            self.stats["blocked_ms_total"] += elapsed
+            self.stats["blocked_ms_max"] = max(self.stats["blocked_ms_max"], elapsed)
+        return token
+
+    def snapshot(self):
+        """Return the cache counters and the remaining lifetime of each token."""
+        now = time.time()
+        with self._lock:
+            stats = dict(self.stats)
+            stats["tokens"] = {
+                key: round(entry["expires_on"] - now) for key, entry in self._tokens.items()
+            }
+        stats["file_cache"] = self._file is not None
+        return stats
+
+    def close(self):
+        """Stop the background refresher and close the wrapped credential."""
+        self._stop.set()
+        if hasattr(self.credential, "close"):
+            self.credential.close()
+
+    # Internals ------------------------------------------------------------
+
+    def _cached(self, key, min_validity):
+        with self._lock:
+            entry = self._tokens.get(key)
+        if entry and entry["expires_on"] - time.time() > min_validity:
+            return AccessToken(entry["token"], entry["expires_on"])
+        return None
+
+    def _acquire(self, key, scopes, tenant_id, kwargs, min_validity):
+        """Get a token valid for `min_validity` more seconds, from file or credential."""
+        with self._acquire_lock:
+            # Another thread may have finished the same acquisition meanwhile.
+            token = self._cached(key, min_validity)
+            if token:
+                return token
+            if not self._file:
+                return self._fetch(key, scopes, tenant_id, kwargs)
+
+            with self._file.locked():
+                entry = self._file.read().get(key)
+                if entry and entry["expires_on"] - time.time() > min_validity:
+                    self._bump("file_hits")
+                    self._remember(key, entry, scopes, tenant_id)
+                    return AccessToken(entry["token"], entry["expires_on"])
+                token = self._fetch(key, scopes, tenant_id, kwargs)
+                tokens = self._file.read()
+                tokens[key] = {"token": token.token, "expires_on": token.expires_on}
+                self._file.write(tokens)
+                return token
+
+    def _fetch(self, key, scopes, tenant_id, kwargs):
+        token = self.credential.get_token(*scopes, tenant_id=tenant_id, **kwargs)
+        self._remember(key, {"token": token.token, "expires_on": token.expires_on}, scopes, tenant_id)
+        return token
+
+    def _remember(self, key, entry, scopes, tenant_id):
+        with self._lock:
+            self._tokens[key] = dict(entry, scopes=list(scopes), tenant_id=tenant_id)
+
+    def _refresh_loop(self, check_interval):
+        while not self._stop.wait(check_interval):
+            with self._lock:
+                due = [
+                    (key, entry) for key, entry in self._tokens.items()
+                    if entry["expires_on"] - time.time() < self.refresh_margin
+                ]
+            for key, entry in due:
+                try:
+                    # Requiring more validity than the margin forces a new
+                    # token unless another worker already put one in the file.
+                    self._acquire(key, entry["scopes"], entry["tenant_id"], {},
+                                  min_validity=self.refresh_margin)
+                    self._bump("background_refreshes")
+                except Exception as e:
+                    self._bump("refresh_failures")
+                    print(f"⚠ Warning: Background token refresh failed: {e}")
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+
+def credential_from_env(credential):
+    """Wrap `credential` in a `CachingCredential` unless `TOKEN_CACHE_ENABLED=false`."""
+    if os.getenv("TOKEN_CACHE_ENABLED", "true").lower() != "true":
+        return credential
+    return CachingCredential(
+        credential,
+        refresh_margin=float(os.getenv("TOKEN_REFRESH_MARGIN", "600")),
+        cache_file=os.getenv("TOKEN_CACHE_FILE"),
+        cache_key=os.getenv("TOKEN_CACHE_KEY")
+    )
+
+
+def _cache_key(scopes, tenant_id):
+    return " ".join(sorted(scopes)) + (f"|{tenant_id}" if tenant_id else "")
@@ -0,0 +1,344 @@
+"""Bulk export of thread logs to compressed Parquet files for auditing.
+
+Getting every log of a date range used to mean calling `/api/thread-logs`
+thread by thread.  `python log_export.py --start 2025-01-01 --end 2025-01-31`
+streams the documents straight out of Cosmos DB instead and writes them as
+Parquet, one directory per day:
+
+    exports/day=2025-01-01/part-00000.parquet
+    exports/day=2025-01-01/part-range-3-00002.parquet
+
+Two sources are supported:
+
+* `by-day` reads the by-day container (`COSMOS_BY_DAY_ENABLED`, see
+  logs_by_day.py): one partition-scoped query per day bucket, so only the
+  requested range is read.  Used by default when that container is enabled;
+* `change-feed` reads the change feed of the primary container, one stream
+  per physical partition key range, starting at `--start`, and keeps the
+  documents whose `timestamp` falls in the range (compact documents are
+  decoded first, see log_format.py).  A stream stops once it reaches
+  documents written more than `WRITE_DELAY_MARGIN` after `--end`.  The
+  change feed only has the latest version of each document, so logs
+  rewritten later (e.g. by `python log_format.py`) are past that point;
+  export those ranges with `by-day`.
+
+Streams run in parallel (`--workers`).  Each one buffers at most
+`--batch-rows` rows before writing them out as new part files, so memory
+is bounded by workers x batch rows whatever the size of the export.
+`data` is flattened into typed columns (role, run status, model, content
+length, timestamps, run duration); fields without a column of their own
+are kept as JSON in `extra`.  Message text is left out unless
+`--include-content` is given.
+
+After every written batch the stream's continuation token is saved in
+`_checkpoint.json` in the output directory, so an interrupted export picks
+up where it stopped when run again with the same options.  Part file names
+are derived from the batch number, so a batch that was written but not yet
+checkpointed is simply overwritten on resume.
+"""
+
+import argparse
+import json
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from change_feed import ChangeFeedPages, partition_key_range_ids
+from cosmos_queries import queries
+from log_format import decode
+from logs_by_day import days_between
+
+CHECKPOINT_FILE = "_checkpoint.json"
+
+# Logs are stamped when queued and written by background workers, so a log
+# of the last exported day can be stored a little after midnight.
+WRITE_DELAY_MARGIN = timedelta(hours=1)
+
+# Flattened columns and their Arrow types (see `export_schema`).
+COLUMNS = [
+    ("id", "string"),
+    ("thread_id", "string"),
+    ("log_type", "string"),
+    ("timestamp", "timestamp"),
+    ("message_id", "string"),
+    ("role", "string"),
+    ("content_length", "int64"),
+    ("content", "string"),
+    ("run_id", "string"),
+    ("run_status", "string"),
+    ("model", "string"),
+    ("created_at", "timestamp"),
+    ("completed_at", "timestamp"),
+    ("duration_ms", "float64"),
+    ("session_id", "string"),
+    ("cache_hit", "bool"),
+    ("extra", "string"),
+]
+
+# `data` fields that have a column of their own.
+_FLATTENED_FIELDS = {"message_id", "role", "content", "run_id", "status", "model",
+                     "created_at", "completed_at", "session_id", "cache_hit"}
+
+
+def export_schema(include_content=False):
+    """Arrow schema of the exported files."""
+    import pyarrow as pa
+
+    types = {
+        "string": pa.string(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in COLUMNS
+                      if include_content or name != "content"])
+
+
+def parse_timestamp(value):
+    """Parse a logged ISO timestamp as an aware UTC datetime, or None."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        # The app logs `datetime.utcnow()`, which is naive UTC.
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def flatten(document, include_content=False):
+    """Turn a log document into one row of typed columns."""
+    data = document.get("data") or {}
+    texts = [part.get("text") or "" for part in data.get("content") or []
+             if isinstance(part, dict) and part.get("type") == "text"]
+    created_at = parse_timestamp(data.get("created_at"))
+    completed_at = parse_timestamp(data.get("completed_at"))
+    extra = {key: value for key, value in data.items() if key not in _FLATTENED_FIELDS}
+
+    row = {
+        "id": document.get("id"),
+        "thread_id": document.get("thread_id"),
+        "log_type": document.get("log_type"),
+        "timestamp": parse_timestamp(document.get("timestamp")),
+        "message_id": data.get("message_id"),
+        "role": data.get("role"),
+        "content_length": sum(len(text) for text in texts) if "content" in data else None,
+        "run_id": data.get("run_id"),
+        "run_status": data.get("status"),
+        "model": data.get("model"),
+        "created_at": created_at,
+        "completed_at": completed_at,
+        "duration_ms": ((completed_at - created_at).total_seconds() * 1000
+                        if created_at and completed_at else None),
+        "session_id": data.get("session_id"),
+        "cache_hit": data.get("cache_hit"),
+        "extra": json.dumps(extra, default=str) if extra else None,
+    }
+    if include_content:
+        row["content"] = "\n".join(texts) if "content" in data else None
+    return row
+
+
+class Checkpoint:
+    """Per-stream progress of an export, saved atomically as JSON."""
+
+    def __init__(self, path, options):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {"options": options, "streams": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("options") != options:
+                raise ValueError(f"{path} belongs to an export with different options; "
+                                 "use another --out directory or --restart")
+            self.state = saved
+
+    def stream(self, key):
+        """Saved state of one stream: `{continuation, batches, rows, done}`."""
+        with self._lock:
+            return dict(self.state["streams"].get(key) or
+                        {"continuation": None, "batches": 0, "rows": 0, "done": False})
+
+    def save(self, key, progress):
+        """Record a stream's progress and write the checkpoint file."""
+        with self._lock:
+            self.state["streams"][key] = dict(progress)
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(temporary, self.path)
+
+
+class PartWriter:
+    """Write buffered rows as Parquet part files under `day=YYYY-MM-DD/`."""
+
+    def __init__(self, out_dir, schema, compression="zstd"):
+        self.out_dir = out_dir
+        self.schema = schema
+        self.compression = compression
+
+    def write(self, prefix, batch, rows_by_day):
+        """Write one part file per day of a batch; returns the files written."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        written = []
+        for day, rows in sorted(rows_by_day.items()):
+            directory = os.path.join(self.out_dir, f"day={day}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{prefix}{batch:05d}.parquet")
+            table = pa.Table.from_pylist(rows, schema=self.schema)
+            temporary = path + ".tmp"
+            pq.write_table(table, temporary, compression=self.compression)
+            os.replace(temporary, path)
+            written.append(path)
+        return written
+
+
+class LogExporter:
+    """Stream logs of a date range into Parquet part files."""
+
+    def __init__(self, part_writer, checkpoint, start, end, include_content=False,
+                 batch_rows=50000, page_size=1000):
+        self.part_writer = part_writer
+        self.checkpoint = checkpoint
+        self.start = start
+        self.end = end
+        self.include_content = include_content
+        self.batch_rows = batch_rows
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self.stats = {"streams": 0, "documents": 0, "rows": 0, "files": 0, "skipped": 0}
+
+    def export_days(self, container, workers=4):
+        """Export from the by-day container, one stream per day bucket."""
+        def read(day, continuation):
+            return queries.pages(container, "day_logs", partition_key=[day],
+                                 page_size=self.page_size, continuation=continuation)
+
+        streams = [(f"day:{day}", "", lambda continuation, day=day: read(day, continuation))
+                   for day in days_between(self.start, self.end)]
+        return self._run(streams, workers)
+
+    def export_change_feed(self, container, workers=4):
+        """Export from the primary container's change feed, one stream per key range."""
+        start_time = datetime.fromisoformat(self.start).replace(tzinfo=timezone.utc)
+        end_time = (datetime.fromisoformat(self.end).replace(tzinfo=timezone.utc)
+                    + timedelta(days=1) + WRITE_DELAY_MARGIN).timestamp()
+        streams = [(f"range:{range_id}", f"range-{range_id}-",
+                    lambda continuation, range_id=range_id: ChangeFeedPages(
+                        container, range_id, continuation, start_time, self.page_size, end_time))
+                   for range_id in partition_key_range_ids(container)]
+        return self._run(streams, workers)
+
+    def _run(self, streams, workers):
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="log-export") as pool:
+            for future in [pool.submit(self._export_stream, *stream) for stream in streams]:
+                future.result()
+        return dict(self.stats)
+
+    def _export_stream(self, key, prefix, open_pages):
+        progress = self.checkpoint.stream(key)
+        if progress["done"]:
+            return
+        pages = open_pages(progress["continuation"])
+        rows_by_day = defaultdict(list)
+        buffered = documents = skipped = 0
+
+        for page in pages:
+            for document in map(decode, page):
+                documents += 1
+                day = (document.get("timestamp") or "")[:10]
+                if not self.start <= day <= self.end or document.get("log_type") == "thread_summary":
+                    skipped += 1
+                    continue
+                rows_by_day[day].append(flatten(document, self.include_content))
+                buffered += 1
+            # Batches end on page boundaries so the continuation token
+            # points exactly past what has been written.
+            if buffered >= self.batch_rows:
+                self._write(key, prefix, progress, rows_by_day, buffered, pages.continuation_token)
+                rows_by_day, buffered = defaultdict(list), 0
+
+        self._write(key, prefix, progress, rows_by_day, buffered, pages.continuation_token, done=True)
+        with self._lock:
+            self.stats["streams"] += 1
+            self.stats["documents"] += documents
+            self.stats["skipped"] += skipped
+
+    def _write(self, key, prefix, progress, rows_by_day, buffered, continuation, done=False):
+        files = self.part_writer.write(prefix, progress["batches"], rows_by_day) if buffered else []
+        progress.update(
+            continuation=continuation,
+            batches=progress["batches"] + (1 if buffered else 0),
+            rows=progress["rows"] + buffered,
+            done=done
+        )
+        self.checkpoint.save(key, progress)
+        with self._lock:
+            self.stats["rows"] += buffered
+            self.stats["files"] += len(files)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export thread logs to Parquet files.")
+    parser.add_argument("--start", required=True, help="First day to export (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, help="Last day to export (YYYY-MM-DD)")
+    parser.add_argument("--out", default="exports", help="Output directory")
+    parser.add_argument("--source", choices=["by-day", "change-feed"],
+                        help="Read the by-day container or the primary container's change feed "
+                             "(default: by-day when COSMOS_BY_DAY_ENABLED=true)")
+    parser.add_argument("--workers", type=int, default=4, help="Streams exported in parallel")
+    parser.add_argument("--batch-rows", type=int, default=50000,
+                        help="Rows buffered per stream before a part file is written")
+    parser.add_argument("--page-size", type=int, default=1000, help="Documents per Cosmos DB page")
+    parser.add_argument("--compression", default="zstd",
+                        choices=["zstd", "snappy", "gzip", "brotli", "lz4", "none"])
+    parser.add_argument("--include-content", action="store_true", help="Also export message text")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from azure.cosmos import CosmosClient
+
+    load_dotenv()
+    args = parse_args()
+    days_between(args.start, args.end)
+    source = args.source or (
+        "by-day" if os.getenv("COSMOS_BY_DAY_ENABLED", "false").lower() == "true" else "change-feed")
+
+    client = CosmosClient(os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY"))
+    database = client.get_database_client(os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB"))
+
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint_path = os.path.join(args.out, CHECKPOINT_FILE)
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path, {
+        "start": args.start, "end": args.end, "source": source,
+        "include_content": args.include_content
+    })
+    exporter = LogExporter(
+        PartWriter(args.out, export_schema(args.include_content), args.compression),
+        checkpoint, args.start, args.end,
+        include_content=args.include_content,
+        batch_rows=args.batch_rows,
+        page_size=args.page_size
+    )
+
+    if source == "by-day":
+        stats = exporter.export_days(database.get_container_client(
+            os.getenv("COSMOS_BY_DAY_CONTAINER_NAME", "ThreadLogsByDay")), args.workers)
+    else:
+        stats = exporter.export_change_feed(database.get_container_client(
+            os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs")), args.workers)
+    print(f"✓ Exported {stats['rows']} logs from {stats['streams']} streams "
+          f"into {stats['files']} files under {args.out}")
@@ -0,0 +1,285 @@
+"""Compact storage format for log documents.
+
+A log document as the app builds it (`agent_logs.log_document`) spells out
+every field name, stamps an ISO timestamp string and a random UUID id, and
+keeps the whole message text inline:
+
+    {"id": "1b4e28ba-2fa1-11d2-883f-0016d3cca427", "thread_id": "thread_abc",
+     "log_type": "message", "timestamp": "2025-01-31T14:03:07.123456",
+     "data": {"message_id": "msg_123", "role": "assistant",
+              "content": [{"type": "text", "text": "..."}],
+              "created_at": "2025-01-31T14:03:05+00:00"}}
+
+Cosmos DB charges writes and reads by document size, so with
+`COSMOS_LOG_FORMAT=compact` the primary log writer stores the same document
+as
+
+    {"id": "msg_123", "thread_id": "thread_abc", "t": "m", "ts": 1738332187123,
+     "v": 2, "d": {"ro": "a", "c": "...", "ca": 1738332185000}}
+
+* short field names and type/role codes (`FIELD_CODES`, `LOG_TYPE_CODES`);
+* epoch-millisecond integers for `timestamp`, `created_at` and
+  `completed_at`;
+* a deterministic id: the message or run ID (unique within the thread's
+  partition), else a hash of the payload, so a retried write overwrites
+  instead of adding a duplicate;
+* text-only content as plain strings, and content of at least
+  `COSMOS_LOG_COMPRESS_THRESHOLD` bytes zlib-compressed into `cz` when that
+  is smaller.
+
+`decode()` turns either format back into the full one, so readers never
+care which one a document was stored in.  Decoded times are naive UTC ISO
+strings with millisecond precision.  Listeners of the log writer, and the
+by-day copy they fill, still get the full documents.
+
+Compact documents are only found by the `*_compact` queries (`log_query`),
+so after switching an existing container run `python log_format.py` to
+rewrite its logs in the compact format.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from cosmos_queries import QUERIES, queries
+
+COMPACT_VERSION = 2
+
+LOG_TYPE_CODES = {"message": "m", "run": "r", "thread_created": "tc"}
+ROLE_CODES = {"user": "u", "assistant": "a"}
+FIELD_CODES = {
+    "message_id": "mid",
+    "run_id": "rid",
+    "role": "ro",
+    "content": "c",
+    "status": "st",
+    "model": "mo",
+    "created_at": "ca",
+    "completed_at": "co",
+    "session_id": "sid",
+    "cache_hit": "ch",
+    "timings": "tm",
+}
+# The data field that doubles as the document id, per log type.
+ID_FIELDS = {"message": "message_id", "run": "run_id"}
+TIME_FIELDS = ("created_at", "completed_at")
+
+_LOG_TYPES = {code: name for name, code in LOG_TYPE_CODES.items()}
+_ROLES = {code: name for name, code in ROLE_CODES.items()}
+_FIELDS = {code: name for name, code in FIELD_CODES.items()}
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def compact_enabled():
+    """True when new logs are stored in the compact format."""
+    return os.getenv("COSMOS_LOG_FORMAT", "full").lower() == "compact"
+
+
+def compress_threshold():
+    """Content size in bytes from which compact documents compress it."""
+    return int(os.getenv("COSMOS_LOG_COMPRESS_THRESHOLD", "1024"))
+
+
+def epoch_ms(value):
+    """Milliseconds since the epoch of an ISO timestamp (naive = UTC), or None."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - _EPOCH) // timedelta(milliseconds=1)
+
+
+def iso_timestamp(value):
+    """Naive UTC ISO string of an epoch-millisecond value; strings pass through."""
+    if isinstance(value, bool) or not isinstance(value, int):
+        return value
+    return (_EPOCH + timedelta(milliseconds=value)).replace(tzinfo=None).isoformat(timespec="microseconds")
+
+
+def log_type_name(code):
+    """Full log type of a compact type code; full names pass through."""
+    return _LOG_TYPES.get(code, code)
+
+
+def store_format(document):
+    """The document to store for a new log, in the configured format."""
+    return encode(document) if compact_enabled() else document
+
+
+def log_query(name):
+    """Name of the registered query to run against logs in the configured format."""
+    if compact_enabled() and f"{name}_compact" in QUERIES:
+        return f"{name}_compact"
+    return name
+
+
+def cursor_value(since):
+    """A `since` cursor as the configured format's timestamp field compares it."""
+    if since and compact_enabled():
+        return epoch_ms(since) or 0
+    return since
+
+
+def thread_logs_query(thread_id, since=None):
+    """Name and parameters of the query for a thread's logs after a `since` cursor."""
+    if since:
+        return log_query("thread_logs_since"), {"@thread_id": thread_id, "@since": cursor_value(since)}
+    return log_query("thread_logs"), {"@thread_id": thread_id}
+
+
+def rewind_cursor(since, overlap):
+    """Move a `since` timestamp back by `overlap` seconds.
+
+    Logs are stamped when queued but written by background workers, so a log
+    can land shortly after a newer one was already read.  Re-reading a small
+    window catches those; clients drop the duplicates by `id`.
+    """
+    if not since:
+        return since
+    try:
+        return (datetime.fromisoformat(since) - timedelta(seconds=overlap)).isoformat()
+    except ValueError:
+        return since
+
+
+def encode(document, threshold=None):
+    """The compact form of a full log document."""
+    log_type = document.get("log_type")
+    data = dict(document.get("data") or {})
+    threshold = compress_threshold() if threshold is None else threshold
+
+    document_id = _compact_id(log_type, data)
+    id_field = ID_FIELDS.get(log_type)
+    if id_field and data.get(id_field):
+        data.pop(id_field)
+
+    compact_data = {}
+    for field, value in data.items():
+        if field in TIME_FIELDS and epoch_ms(value) is not None:
+            value = epoch_ms(value)
+        elif field == "role":
+            value = ROLE_CODES.get(value, value)
+        elif field == "content":
+            content, compressed = _encode_content(value, threshold)
+            compact_data["cz" if compressed else "c"] = content
+            continue
+        compact_data[FIELD_CODES.get(field, field)] = value
+
+    timestamp = document.get("timestamp")
+    return {
+        "id": document_id,
+        "thread_id": document.get("thread_id"),
+        "t": LOG_TYPE_CODES.get(log_type, log_type),
+        "ts": epoch_ms(timestamp) if epoch_ms(timestamp) is not None else timestamp,
+        "v": COMPACT_VERSION,
+        "d": compact_data,
+    }
+
+
+def log_key(document):
+    """An ID of a log that survives rewrites: its compact document id.
+
+    A full document and its compact copy (see `migrate`) get the same key,
+    so readers of the change feed can tell a rewritten log from a new one.
+    Unique within the thread.
+    """
+    if document.get("v") == COMPACT_VERSION:
+        return document.get("id")
+    return _compact_id(document.get("log_type"), document.get("data") or {})
+
+
+def decode(document):
+    """The full form of a log document stored in either format."""
+    if document.get("v") != COMPACT_VERSION:
+        return document
+
+    log_type = log_type_name(document.get("t"))
+    data = {}
+    id_field = ID_FIELDS.get(log_type)
+    if id_field and FIELD_CODES[id_field] not in (document.get("d") or {}):
+        data[id_field] = document.get("id")
+    for code, value in (document.get("d") or {}).items():
+        field = _FIELDS.get(code, code)
+        if code == "cz":
+            field, value = "content", _decode_content(json.loads(zlib.decompress(base64.b64decode(value))))
+        elif code == "c":
+            value = _decode_content(value)
+        elif code == "ro":
+            value = _ROLES.get(value, value)
+        elif field in TIME_FIELDS:
+            value = iso_timestamp(value)
+        data[field] = value
+
+    decoded = {key: value for key, value in document.items() if key not in ("t", "ts", "v", "d")}
+    decoded.update(log_type=log_type, timestamp=iso_timestamp(document.get("ts")), data=data)
+    return decoded
+
+
+def _compact_id(log_type, data):
+    """The message or run ID, else a hash of the payload."""
+    id_field = ID_FIELDS.get(log_type)
+    if id_field and data.get(id_field):
+        return data[id_field]
+    payload = json.dumps([log_type, data], sort_keys=True, default=str)
+    return "h" + hashlib.sha1(payload.encode()).hexdigest()[:20]
+
+
+def _encode_content(content, threshold):
+    """`(value, compressed)`: text parts become strings, large ones get zlib'd."""
+    if isinstance(content, list) and all(
+            isinstance(part, dict) and part.keys() == {"type", "text"} and part["type"] == "text"
+            and isinstance(part["text"], str) for part in content):
+        content = [part["text"] for part in content]
+        if len(content) == 1:
+            content = content[0]
+
+    serialized = json.dumps(content, separators=(",", ":"))
+    if len(serialized.encode()) >= threshold:
+        compressed = base64.b64encode(zlib.compress(serialized.encode(), 6)).decode()
+        if len(compressed) < len(serialized):
+            return compressed, True
+    return content, False
+
+
+def _decode_content(content):
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    if isinstance(content, list):
+        return [{"type": "text", "text": part} if isinstance(part, str) else part for part in content]
+    return content
+
+
+def migrate(container, progress_every=1000):
+    """Rewrite every full-format log of a container in the compact format.
+
+    The compact copy is written before the original is deleted, so an
+    interrupted migration loses nothing and can simply be re-run.
+    """
+    migrated = 0
+    for document in queries.iterate(container, "full_format_logs", page_size=500):
+        compact = encode(document)
+        container.upsert_item(body=compact)
+        if compact["id"] != document["id"]:
+            container.delete_item(item=document["id"], partition_key=document["thread_id"])
+        migrated += 1
+        if migrated % progress_every == 0:
+            print(f"  migrated {migrated} documents")
+    return migrated
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from azure.cosmos import CosmosClient
+
+    load_dotenv()
+    client = CosmosClient(os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY"))
+    database = client.get_database_client(os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB"))
+    total = migrate(database.get_container_client(os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs")))
+    print(f"✓ Rewrote {total} log documents in the compact format")
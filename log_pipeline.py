@@ -0,0 +1,118 @@
+"""Cosmos DB log writers and the derived data they keep up to date.
+
+app.py and run_agent.py log to Cosmos DB the same way, so the wiring lives
+here:
+
+* `provision_log_containers` creates (or opens) the log, summaries and,
+  with `COSMOS_BY_DAY_ENABLED`, by-day containers under their configured
+  names;
+* `LogPipeline` starts the background `CosmosLogWriter` in the configured
+  log format and passes every written document to the thread summaries,
+  the stats counters and the by-day copy, which has its own writer.
+
+Both writers take their queue, flush and enqueue settings from the
+`COSMOS_LOG_WRITER_*` variables (`writer_from_env`).
+"""
+
+import os
+
+from cosmos_provisioning import provision_log_container, provision_summaries_container
+from cosmos_stats import CosmosStats, reconcile_interval
+from log_format import store_format
+from log_writer import CosmosLogWriter
+from logs_by_day import DailyLogs, day_partition_key, provision_by_day_container
+from thread_summaries import ThreadSummaryStore
+
+
+def by_day_enabled():
+    """True when logs are also copied to the by-day container."""
+    return os.getenv("COSMOS_BY_DAY_ENABLED", "false").lower() == "true"
+
+
+def provision_log_containers(database, apply_to_existing=False):
+    """`(logs, summaries, by_day)` containers; `by_day` is None when disabled."""
+    container = provision_log_container(
+        database, os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs"), apply_to_existing=apply_to_existing)
+    # Per-thread summaries share a few logical partitions so they can be
+    # listed with a paginated, ordered query.
+    summaries_container = provision_summaries_container(
+        database, os.getenv("COSMOS_SUMMARIES_CONTAINER_NAME", "ThreadSummaries"),
+        apply_to_existing=apply_to_existing)
+    by_day_container = None
+    if by_day_enabled():
+        # Optional copy of the logs under a hierarchical [day, thread_id]
+        # key for date-range analytics (see logs_by_day.py).
+        by_day_container = provision_by_day_container(
+            database, os.getenv("COSMOS_BY_DAY_CONTAINER_NAME", "ThreadLogsByDay"),
+            apply_to_existing=apply_to_existing)
+    return container, summaries_container, by_day_container
+
+
+def writer_from_env(container, **overrides):
+    """A `CosmosLogWriter` configured by the `COSMOS_LOG_WRITER_*` variables."""
+    settings = {
+        "max_queue_size": int(os.getenv("COSMOS_LOG_WRITER_QUEUE_SIZE", "10000")),
+        "flush_size": int(os.getenv("COSMOS_LOG_WRITER_FLUSH_SIZE", "50")),
+        "flush_interval": float(os.getenv("COSMOS_LOG_WRITER_FLUSH_INTERVAL", "0.5")),
+        "worker_count": int(os.getenv("COSMOS_LOG_WRITER_WORKERS", "2")),
+        "enqueue_timeout": float(os.getenv("COSMOS_LOG_WRITER_ENQUEUE_TIMEOUT", "1.0")),
+    }
+    settings.update(overrides)
+    return CosmosLogWriter(container, **settings)
+
+
+class LogPipeline:
+    """The log writers plus the summaries, stats and by-day copy they feed.
+
+    With `background=False` no primary writer is started; whoever writes a
+    log inline passes it to `notify()` afterwards.  `close()` drains the
+    writers before the final stats flush.
+    """
+
+    def __init__(self, container, summaries_container, by_day_container=None, background=True):
+        self.summaries = ThreadSummaryStore(summaries_container)
+        # Aggregate counters live in one document in the summaries
+        # container, so reading them is a cached point read.
+        self.stats = CosmosStats(
+            summaries_container,
+            container,
+            flush_interval=float(os.getenv("COSMOS_STATS_FLUSH_INTERVAL", "5")),
+            cache_ttl=float(os.getenv("COSMOS_STATS_CACHE_TTL", "10")),
+            reconcile_interval=reconcile_interval()
+        )
+        self.listeners = [self.summaries.apply, self.stats.record]
+
+        # The by-day copy gets its own writer, so a slow or throttled
+        # analytics container never holds up the primary log writes.
+        self.daily_logs = None
+        self.by_day_writer = None
+        if by_day_container is not None:
+            self.by_day_writer = writer_from_env(by_day_container, worker_count=1,
+                                                 partition_key=day_partition_key)
+            self.daily_logs = DailyLogs(by_day_container, self.by_day_writer,
+                                        query_workers=int(os.getenv("COSMOS_BY_DAY_QUERY_WORKERS", "8")))
+            self.listeners.append(self.daily_logs.mirror)
+
+        self.writer = None
+        if background:
+            self.writer = writer_from_env(container, encode=store_format)
+            self.writer.add_listener(self.notify)
+
+    def notify(self, documents):
+        """Pass written log documents to every listener."""
+        for listener in self.listeners:
+            try:
+                listener(documents)
+            except Exception as e:
+                print(f"Error in log listener: {e}")
+
+    def close(self):
+        """Drain the writers, then flush the stats they fed."""
+        # In order: the primary writer's listeners feed the by-day writer
+        # and the stats.
+        if self.writer:
+            self.writer.close()
+        if self.by_day_writer:
+            self.by_day_writer.close()
+            self.daily_logs.close()
+        self.stats.close()
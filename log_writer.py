@@ -0,0 +1,333 @@
+"""Background, batched writer for Cosmos DB log documents.
+
+`store_log_to_cosmos` used to call `create_item` inline, so every chat request
+paid for several Cosmos round trips before it could answer the browser.  This
+module moves those writes off the request path: callers drop finished
+documents into a bounded in-process queue and a small pool of worker threads
+drains it, grouping documents by partition key (`thread_id` for the log
+container) and sending each group as a single transactional batch.
+
+The writer is deliberately simple—no persistence, no cross-process
+coordination.  If the queue fills up the caller blocks for a short while
+(backpressure) and, if it is still full, writes the document synchronously so
+nothing is silently dropped.  `close()` drains the queue and is registered as
+an `atexit` hook by the app so a graceful shutdown does not lose logs.
+"""
+
+import asyncio
+import inspect
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from azure.cosmos import exceptions
+
+from timing import span
+
+# Cosmos DB rejects transactional batches with more than 100 operations.
+MAX_BATCH_OPERATIONS = 100
+
+# Sentinel placed on the queue to wake up and stop a worker thread.
+_STOP = object()
+
+
+class CosmosLogWriter:
+    """Queue log documents and write them to Cosmos DB in the background."""
+
+    def __init__(self, container, max_queue_size=10000, flush_size=50,
+                 flush_interval=0.5, worker_count=2, enqueue_timeout=1.0,
+                 partition_key=None, encode=None):
+        self.container = container
+        # Maps a document to its partition key value; a list for containers
+        # with a hierarchical partition key.
+        self.partition_key = partition_key or (lambda document: document["thread_id"])
+        # Maps a document to the body stored (e.g. `log_format.store_format`);
+        # listeners still get the document as submitted.
+        self.encode = encode or (lambda document: document)
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._closed = False
+        # Submits between their `_closed` check and their `put`; `close()`
+        # waits for them so none lands behind the stop sentinels.
+        self._submitting = 0
+        self._submits_done = threading.Condition(self._lock)
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "inline_writes": 0,
+            "request_charge": 0.0,
+        }
+
+        self._workers = []
+        for index in range(max(1, worker_count)):
+            worker = threading.Thread(
+                target=self._run,
+                name=f"cosmos-log-writer-{index}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def add_listener(self, callback):
+        """Register a callback invoked with every list of documents written."""
+        self._listeners.append(callback)
+
+    def submit(self, document):
+        """Queue a document for writing; blocks briefly when the queue is full."""
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._submitting += 1
+        if closed:
+            return self._write_inline(document)
+
+        try:
+            self._queue.put(document, timeout=self.enqueue_timeout)
+        except queue.Full:
+            # Backpressure: the workers are not keeping up.  Rather than drop
+            # the log we pay for the round trip on the caller's thread.
+            return self._write_inline(document)
+        finally:
+            with self._lock:
+                self._submitting -= 1
+                self._submits_done.notify_all()
+
+        self._bump("enqueued")
+        return True
+
+    def flush(self):
+        """Block until every document queued so far has been processed."""
+        self._queue.join()
+
+    def close(self):
+        """Drain the queue and stop the worker threads."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            while self._submitting:
+                self._submits_done.wait()
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+    def snapshot(self):
+        """Return a copy of the writer counters plus the current queue depth."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["queue_depth"] = self._queue.qsize()
+        return stats
+
+    # Worker internals -----------------------------------------------------
+
+    def _run(self):
+        """Worker loop: collect up to `flush_size` documents, then write them."""
+        stopping = False
+        while not stopping:
+            pending = []
+            deadline = None
+            while len(pending) < self.flush_size:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if pending:
+                try:
+                    self._write_documents(pending)
+                except Exception as e:
+                    # Never let one bad flush kill the worker thread.
+                    print(f"Error writing logs to Cosmos DB: {e}")
+                finally:
+                    for _ in pending:
+                        self._queue.task_done()
+
+    def _write_documents(self, documents):
+        """Group documents by partition and write each group as a batch."""
+        by_partition = defaultdict(list)
+        for document in documents:
+            key = self.partition_key(document)
+            by_partition[tuple(key) if isinstance(key, list) else key].append(document)
+
+        for key, group in by_partition.items():
+            partition_key = list(key) if isinstance(key, tuple) else key
+            for start in range(0, len(group), MAX_BATCH_OPERATIONS):
+                chunk = group[start:start + MAX_BATCH_OPERATIONS]
+                written = self._write_chunk(partition_key, chunk)
+                if written:
+                    self._notify(written)
+
+    def _write_chunk(self, partition_key, chunk):
+        """Write one partition-scoped chunk, falling back to per-item upserts."""
+        if len(chunk) > 1:
+            try:
+                with span("cosmos_batch_write") as details:
+                    # `upsert` rather than `create` keeps retries idempotent.
+                    self.container.execute_item_batch(
+                        batch_operations=[("upsert", (self.encode(document),)) for document in chunk],
+                        partition_key=partition_key,
+                        response_hook=lambda headers, result: details.update(
+                            request_charge=self._record_charge(headers, result))
+                    )
+                self._bump("batches")
+                self._bump("written", len(chunk))
+                return chunk
+            except (exceptions.CosmosHttpResponseError, exceptions.CosmosBatchOperationError) as e:
+                print(f"Error writing log batch to Cosmos DB, retrying per item: {e}")
+
+        written = []
+        for document in chunk:
+            if self._upsert(document):
+                written.append(document)
+        return written
+
+    def _write_inline(self, document):
+        """Synchronously write a single document on the caller's thread."""
+        self._bump("inline_writes")
+        if self._upsert(document):
+            self._notify([document])
+            return True
+        return False
+
+    def _upsert(self, document):
+        try:
+            with span("cosmos_item_write") as details:
+                self.container.upsert_item(
+                    body=self.encode(document),
+                    response_hook=lambda headers, result: details.update(
+                        request_charge=self._record_charge(headers, result))
+                )
+            self._bump("written")
+            return True
+        except Exception as e:
+            print(f"Error storing log to Cosmos DB: {e}")
+            self._bump("failed")
+            return False
+
+    def _notify(self, documents):
+        for listener in self._listeners:
+            try:
+                listener(documents)
+            except Exception as e:
+                print(f"Error in log writer listener: {e}")
+
+    def _record_charge(self, headers, _result):
+        try:
+            charge = float(headers.get("x-ms-request-charge", 0))
+        except (TypeError, ValueError):
+            return 0.0
+        self._bump("request_charge", charge)
+        return charge
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+
+class AsyncCosmosLogWriter:
+    """Write log documents from asyncio tasks (for asgi_app.py).
+
+    On an event loop no worker threads are needed: `submit()` starts the
+    upsert as a task and returns at once, so the write overlaps with
+    whatever the request does next.  A semaphore caps the writes in flight.
+    Listeners may be plain functions or coroutine functions.
+
+    `submit()` cannot block, so the backpressure is up to the caller:
+    request handlers `await wait_for_room()` before they start writing, which
+    holds them while `max_pending` writes are still unfinished (e.g. while
+    Cosmos DB throttles) instead of piling up tasks without limit.
+    """
+
+    def __init__(self, container, max_concurrency=32, max_pending=1000, encode=None):
+        self.container = container
+        self.encode = encode or (lambda document: document)
+        self.max_pending = max(1, max_pending)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._tasks = set()
+        self._listeners = []
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "backpressure_waits": 0,
+            "request_charge": 0.0,
+        }
+
+    def add_listener(self, callback):
+        """Register a callback invoked with every list of documents written."""
+        self._listeners.append(callback)
+
+    def submit(self, document):
+        """Start writing a document in the background."""
+        task = asyncio.create_task(self._write(document))
+        # Keep a reference so the task is not garbage collected mid-write.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.stats["enqueued"] += 1
+        return True
+
+    async def wait_for_room(self):
+        """Wait until fewer than `max_pending` writes are unfinished."""
+        if len(self._tasks) >= self.max_pending:
+            self.stats["backpressure_waits"] += 1
+        while len(self._tasks) >= self.max_pending:
+            await asyncio.wait(list(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+
+    async def flush(self):
+        """Wait for every write started so far."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self):
+        """Wait for pending writes (called on server shutdown)."""
+        await self.flush()
+
+    def snapshot(self):
+        """Return a copy of the writer counters plus the writes in flight."""
+        stats = dict(self.stats)
+        stats["queue_depth"] = len(self._tasks)
+        return stats
+
+    async def _write(self, document):
+        async with self._semaphore:
+            try:
+                await self.container.upsert_item(
+                    body=self.encode(document),
+                    response_hook=self._record_charge
+                )
+            except Exception as e:
+                print(f"Error storing log to Cosmos DB: {e}")
+                self.stats["failed"] += 1
+                return
+        self.stats["written"] += 1
+        for listener in self._listeners:
+            try:
+                result = listener([document])
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"Error in log writer listener: {e}")
+
+    def _record_charge(self, headers, _result):
+        try:
+            self.stats["request_charge"] += float(headers.get("x-ms-request-charge", 0))
+        except (TypeError, ValueError):
+            pass
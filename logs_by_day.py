@@ -0,0 +1,154 @@
+"""Optional time-bucketed copy of the logs for date-range analytics.
+
+The primary container is partitioned on `/thread_id`, which is ideal for
+reading one conversation but turns every "by day" or "by log type across
+threads" query into a fan-out over all partitions.  When
+`COSMOS_BY_DAY_ENABLED=true` the app also writes every log document into a
+second container with a hierarchical partition key `[/day, /thread_id]`:
+
+* a date-range query only touches the day buckets in the range, using the
+  `[day]` prefix of the partition key;
+* bursts on a single thread still spread across one logical partition per
+  day instead of growing a single partition forever.
+
+Documents are copied in the full format (see log_format.py) plus a `day`
+field (`YYYY-MM-DD`, taken from `timestamp`).  The copy is filled by a
+second background log writer fed from the primary writer's listener, so it
+adds no latency to chat requests.
+
+`daily_counts` queries the day buckets of a range concurrently, so a
+month of activity takes about as long as a single day.
+
+Run `python logs_by_day.py` to backfill the by-day container from existing
+logs.  Writes are upserts, so the backfill can be re-run safely after an
+interruption.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from cosmos_provisioning import LOG_INDEXING_POLICY, provision_container, retention_ttl
+from cosmos_queries import queries
+from log_format import decode
+from log_writer import CosmosLogWriter
+
+BY_DAY_PARTITION_PATHS = ["/day", "/thread_id"]
+
+# The app's own cap on a date-range request (a year of day buckets); Cosmos
+# DB itself has no such limit.
+MAX_RANGE_DAYS = 366
+
+
+def to_day_document(document):
+    """Return a copy of a log document with its `day` bucket added."""
+    day_document = dict(document)
+    day_document["day"] = (document.get("timestamp") or "")[:10]
+    return day_document
+
+
+def day_partition_key(document):
+    """Hierarchical partition key value for a by-day document."""
+    return [document["day"], document["thread_id"]]
+
+
+def days_between(start, end):
+    """List the `YYYY-MM-DD` buckets from `start` to `end`, inclusive."""
+    first = date.fromisoformat(start)
+    last = date.fromisoformat(end)
+    if last < first:
+        raise ValueError("end must not be before start")
+    if (last - first).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"date range is limited to {MAX_RANGE_DAYS} days")
+    return [(first + timedelta(days=offset)).isoformat() for offset in range((last - first).days + 1)]
+
+
+def provision_by_day_container(database, container_id, apply_to_existing=False):
+    """Create (or update) the by-day container with its hierarchical key."""
+    return provision_container(database, container_id, BY_DAY_PARTITION_PATHS, LOG_INDEXING_POLICY,
+                               default_ttl=retention_ttl(), apply_to_existing=apply_to_existing)
+
+
+class DailyLogs:
+    """Write to and query the by-day container."""
+
+    def __init__(self, container, writer=None, query_workers=8):
+        self.container = container
+        self.writer = writer
+        self.query_workers = query_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def mirror(self, documents):
+        """Queue copies of freshly written log documents (log writer listener)."""
+        for document in documents:
+            self.writer.submit(to_day_document(document))
+
+    def iterate(self, start, end, log_type=None):
+        """Yield the logs between two days, bucket by bucket, oldest first."""
+        for day in days_between(start, end):
+            if log_type:
+                yield from queries.iterate(self.container, "day_logs_by_type",
+                                           {"@log_type": log_type}, partition_key=[day])
+            else:
+                yield from queries.iterate(self.container, "day_logs", partition_key=[day])
+
+    def daily_counts(self, start, end):
+        """Return `[{day, log_types: {log_type: count}, total}]` for a range."""
+        return list(self._query_pool().map(self._day_counts, days_between(start, end)))
+
+    def close(self):
+        """Shut down the query threads once their queries have finished."""
+        if self._pool:
+            self._pool.shutdown(wait=True)
+
+    def _day_counts(self, day):
+        counts = {
+            item["log_type"]: item["count"]
+            for item in queries.iterate(self.container, "day_counts_by_log_type", partition_key=[day])
+        }
+        return {"day": day, "log_types": counts, "total": sum(counts.values())}
+
+    def _query_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.query_workers,
+                                                thread_name_prefix="daily-counts")
+            return self._pool
+
+
+def backfill(source_container, writer, progress_every=1000):
+    """Copy every document of the primary container into the by-day layout.
+
+    Items are streamed page by page, so memory stays bounded regardless of
+    container size.
+    """
+    copied = 0
+    for document in source_container.read_all_items(max_item_count=500):
+        writer.submit(to_day_document(decode({
+            key: value for key, value in document.items() if not key.startswith("_")
+        })))
+        copied += 1
+        if copied % progress_every == 0:
+            print(f"  copied {copied} documents")
+
+    writer.flush()
+    return copied
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from azure.cosmos import CosmosClient
+
+    load_dotenv()
+    client = CosmosClient(os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY"))
+    database = client.get_database_client(os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB"))
+    target = provision_by_day_container(
+        database, os.getenv("COSMOS_BY_DAY_CONTAINER_NAME", "ThreadLogsByDay"))
+    backfill_writer = CosmosLogWriter(target, flush_size=100, worker_count=4,
+                                      partition_key=day_partition_key)
+    total = backfill(database.get_container_client(os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs")),
+                     backfill_writer)
+    backfill_writer.close()
+    print(f"✓ Backfilled {total} documents ({backfill_writer.snapshot()['failed']} failed)")
@@ -0,0 +1,125 @@
+"""Answer cache for repeated first-turn questions.
+
+A handful of questions ("What's the maximum I can claim for meals?") make up
+most of the traffic, and each one used to pay for a full agent run.  When
+`RESPONSE_CACHE_ENABLED=true` the app answers the *first* message of a
+conversation from this cache if the same agent has already answered the
+same question.  Follow-up messages always go to the agent, because their
+answer depends on the conversation so far.
+
+Entries are keyed by:
+
+* the agent ID;
+* the agent version – a fingerprint of the agent definition (model,
+  instructions, tools, sampling settings, ...), so editing the agent in the
+  portal makes every older answer unreachable.  The app re-reads the agent
+  periodically and reports its version with `set_agent_version`, which
+  also drops the stale entries;
+* the normalized message text – case-folded, with Unicode compatibility
+  forms, whitespace runs and trailing punctuation collapsed, so "What's the
+  max?" and "what's the max" share an entry.
+
+The cache is an in-process LRU with a TTL, so answers also age out on their
+own and each worker keeps its own copy.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Trailing characters that do not change what is being asked.
+_TRAILING_PUNCTUATION = " ?!.。？！"
+
+# Agent properties that change how it answers.  `created_at` and `object`
+# are deliberately left out.
+_VERSION_FIELDS = ("model", "instructions", "tools", "tool_resources", "temperature",
+                   "top_p", "response_format", "metadata")
+
+
+def normalize_prompt(message):
+    """Reduce a message to the form used in cache keys."""
+    text = unicodedata.normalize("NFKC", message or "").casefold()
+    return _WHITESPACE.sub(" ", text).strip().rstrip(_TRAILING_PUNCTUATION)
+
+
+def agent_fingerprint(agent):
+    """Return a short hash of the parts of an agent definition that affect answers."""
+    definition = agent.as_dict() if hasattr(agent, "as_dict") else dict(agent)
+    relevant = {field: definition.get(field) for field in _VERSION_FIELDS}
+    encoded = json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class ResponseCache:
+    """LRU cache with TTL for agent answers to first-turn messages."""
+
+    def __init__(self, max_entries=1000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def lookup(self, agent_id, agent_version, message):
+        """Return the cached answer, or None."""
+        key = (agent_id, agent_version, normalize_prompt(message))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def store(self, agent_id, agent_version, message, answer):
+        """Remember the agent's answer to a first-turn message."""
+        if not answer:
+            return
+        key = (agent_id, agent_version, normalize_prompt(message))
+        with self._lock:
+            if self._versions.get(agent_id, agent_version) != agent_version:
+                # The answer came from an agent definition that has since
+                # been replaced; do not cache it.
+                return
+            self._entries[key] = (answer, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set_agent_version(self, agent_id, agent_version):
+        """Record the current agent version, dropping entries of older ones."""
+        with self._lock:
+            current = self._versions.get(agent_id)
+            if current is not None and current != agent_version:
+                self._drop(agent_id)
+            self._versions[agent_id] = agent_version
+
+    def invalidate(self, agent_id=None):
+        """Drop the entries of one agent, or of every agent."""
+        with self._lock:
+            self._drop(agent_id)
+
+    def snapshot(self):
+        """Return the cache counters plus the current entry count."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _drop(self, agent_id):
+        stale = [key for key in self._entries if agent_id is None or key[0] == agent_id]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self.stats["invalidations"] += 1
@@ -1,84 +1,454 @@
 """
 Azure AI Agent Interaction Script
 
-This script demonstrates how to interact with Azure AI Agents using the Azure AI Projects SDK.
-It creates a conversation thread, sends a message to an AI agent, and retrieves the response.
+This script talks to the pre-configured Azure AI Agent (the expense policy
+assistant) outside the web app.  Run without arguments it asks the agent the
+one demo question and prints the conversation.
 
-The script is designed to work with a pre-configured Azure AI Agent that can handle
-expense-related queries, specifically about meal claim maximums.
+It is also a batch runner for regression-testing the agent against a prompt
+set:
+
+    python run_agent.py --prompts prompts.jsonl --concurrency 8 --rate 2 --results results.jsonl
+
+* Prompts are read from a JSONL file, one conversation per line.  A line's ID
+  is its `id` (or `request_id`) field, else its line number; its turns are the
+  `turns` list, else the single text in `prompt`, `message`, `question` or
+  `body` (`--prompt-field` picks another field).  Every conversation gets its
+  own agent thread and its turns are sent one after another.
+* Conversations run on a pool of `--concurrency` worker threads.  `--rate`
+  caps the agent runs started per second across the pool.
+* Rate limiting by the service is retried with exponential backoff and
+  jitter, honouring the suggested wait: HTTP 429 responses that outlast the
+  SDK's own retries, and runs that fail with `rate_limit_exceeded`.  The
+  wait also holds back the runs of the other workers, so the pool does not
+  keep hitting the limit.  A run is started with `runs.create` and polled
+  with `runs.get`, each retried on its own, so a throttled poll never
+  starts the run again.
+* Threads, messages and runs are logged to Cosmos DB through the same path as
+  app.py (background log writer, log format, thread summaries and stats), so
+  batch conversations show up in the dashboard.  `--no-cosmos` skips that.
+* Each finished conversation is appended to `--results` (JSONL) at once.  A
+  re-run with the same results file skips the prompts already completed, so
+  an interrupted batch resumes where it stopped; failed ones are retried.
+
+The report gives throughput and p50/p95/p99 latency per turn and per
+conversation.
 """
 
 # Standard library imports
+import argparse
+import json
 import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 
 # Third-party imports
 from dotenv import load_dotenv  # For loading environment variables from .env file
-from azure.ai.projects import AIProjectClient  # Main client for Azure AI Projects
+from azure.core.exceptions import HttpResponseError
 from azure.identity import DefaultAzureCredential  # Authentication handler for Azure
 from azure.ai.agents.models import ListSortOrder  # Enum for message ordering
 
-# Load environment variables from .env file
-# This allows us to keep sensitive configuration data out of the source code
-load_dotenv()
-
-# Retrieve required environment variables
-# These should be set in the .env file or environment
-azure_endpoint = os.getenv("AZURE_ENDPOINT")  # The Azure AI Project endpoint URL
-azure_agent_id = os.getenv("AZURE_AGENT_ID")  # The unique identifier for the AI agent
-
-# Validate that required environment variables are present
-# Without these, the script cannot function properly
-if not azure_endpoint or not azure_agent_id:
-    raise ValueError("Please set AZURE_ENDPOINT and AZURE_AGENT_ID environment variables")
-
-# Initialize the Azure AI Project client
-# This client handles all communication with the Azure AI service
-# DefaultAzureCredential automatically handles authentication using various methods:
-# - Environment variables, managed identity, Azure CLI, Visual Studio, etc.
-project = AIProjectClient(
-    credential=DefaultAzureCredential(),
-    endpoint=azure_endpoint)
-
-# Retrieve the specific AI agent by its ID
-# This validates that the agent exists and is accessible
-agent = project.agents.get_agent(azure_agent_id)
-
-# Create a new conversation thread
-# A thread represents a conversation session between user and agent
-# Each thread maintains context and conversation history
-thread = project.agents.threads.create()
-print(f"Created thread, ID: {thread.id}")
-
-# Create and send a message to the agent
-# This message will be processed by the AI agent within the context of the thread
-message = project.agents.messages.create(
-    thread_id=thread.id,  # Associate message with the conversation thread
-    role="user",  # Specify that this message is from the user (not the assistant)
-    content="What's the maximum I can claim for meals?"  # The actual question/query
+# Local imports
+from agent_logs import (  # Log documents shared with app.py
+    assistant_message_data,
+    log_document,
+    message_log_data,
+    run_data,
+    run_log_data,
+    user_message_data,
 )
+from client_factory import create_project_client  # Pooled, retrying client setup shared with app.py
+from credential_cache import credential_from_env  # Token cache shared with app.py
+from run_scheduler import TERMINAL_STATUSES, run_status_value
+from timing import percentile  # Nearest-rank percentiles shared with app.py
+
+DEMO_PROMPT = "What's the maximum I can claim for meals?"
+PROMPT_FIELDS = ("prompt", "message", "question", "body")
+
+# "Rate limit is exceeded. Try again in 20 seconds."
+_RETRY_IN = re.compile(r"try again in (\d+(?:\.\d+)?) seconds?", re.IGNORECASE)
+
+
+def load_prompts(path, prompt_field=None):
+    """Read `[{"id", "turns"}]` from a JSONL prompt file."""
+    prompts = []
+    with open(path, encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if prompt_field:
+                turns = entry.get(prompt_field)
+            else:
+                turns = entry.get("turns") or next(
+                    (entry[field] for field in PROMPT_FIELDS if entry.get(field)), None)
+            if isinstance(turns, str):
+                turns = [turns]
+            if not turns:
+                raise ValueError(f"{path}:{number}: no prompt text")
+            prompts.append({"id": str(entry.get("id") or entry.get("request_id") or number), "turns": turns})
+    return prompts
+
+
+def completed_ids(results_path):
+    """IDs of the prompts with a completed result in a results file."""
+    done = set()
+    if not results_path or not os.path.exists(results_path):
+        return done
+    with open(results_path, encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run.
+                continue
+            if result.get("status") == "completed":
+                done.add(result["id"])
+            else:
+                done.discard(result.get("id"))
+    return done
+
+
+def suggested_wait(error):
+    """Seconds the service asked us to wait before retrying, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header in ("retry-after-ms", "x-ms-retry-after-ms"):
+        if headers.get(header):
+            return float(headers[header]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    match = _RETRY_IN.search(str(getattr(error, "message", None) or error))
+    return float(match.group(1)) if match else None
+
+
+def run_error_code(run):
+    """The `last_error.code` of a failed run, if any."""
+    error = getattr(run, "last_error", None)
+    if isinstance(error, dict):
+        return error.get("code")
+    return getattr(error, "code", None)
+
+
+class RateLimiter:
+    """Spread calls to at most `rate` per second across threads.
+
+    `pause()` holds every caller back for a while, used after a 429 so the
+    other workers do not keep hitting the limit.  A `rate` of 0 only pauses.
+    """
+
+    def __init__(self, rate=0.0):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+class BatchRunner:
+    """Run prompt conversations against the agent on a pool of threads."""
+
+    def __init__(self, project, agent_id, log=None, concurrency=4, rate=0.0,
+                 max_retries=6, backoff_base=2.0, backoff_max=60.0, results_path=None,
+                 poll_interval=1.0):
+        self.project = project
+        self.agent_id = agent_id
+        # Called as `log(thread_id, log_type, data)`; None logs nothing.
+        self.log = log or (lambda thread_id, log_type, data: None)
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.results_path = results_path
+        self.poll_interval = poll_interval
+        self.stats = {"completed": 0, "failed": 0, "skipped": 0, "retries": 0, "throttled": 0}
+        self.results = []
+        self._lock = threading.Lock()
+
+    def run(self, prompts):
+        """Run every prompt not completed yet; returns the report."""
+        done = completed_ids(self.results_path)
+        pending = [prompt for prompt in prompts if prompt["id"] not in done]
+        self.stats["skipped"] = len(prompts) - len(pending)
+        if self.stats["skipped"]:
+            print(f"✓ Skipping {self.stats['skipped']} prompts already completed in {self.results_path}")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-runner") as pool:
+            futures = [pool.submit(self.run_conversation, prompt) for prompt in pending]
+            for future in as_completed(futures):
+                self._record(future.result(), len(pending))
+        return self.report(time.perf_counter() - start)
+
+    def run_conversation(self, prompt):
+        """Send a prompt's turns on a new thread; returns its result record."""
+        result = {"id": prompt["id"], "thread_id": None, "status": "completed", "turns": [], "error": None}
+        start = time.perf_counter()
+        try:
+            thread = self._call(self.project.agents.threads.create)
+            result["thread_id"] = thread.id
+            self.log(thread.id, "thread_created", {
+                "session_id": f"batch-{prompt['id']}",
+                "created_at": datetime.utcnow().isoformat()
+            })
+            for text in prompt["turns"]:
+                turn = self._run_turn(thread.id, text)
+                result["turns"].append(turn)
+                if turn["status"] != "completed":
+                    # Later turns build on this answer, so stop here.
+                    result["status"] = "failed"
+                    result["error"] = turn["error"]
+                    break
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def report(self, elapsed):
+        """Throughput and latency percentiles of the results of this run."""
+        turns = sorted(turn["latency_ms"] for result in self.results for turn in result["turns"]
+                       if turn["status"] == "completed")
+        conversations = sorted(result["latency_ms"] for result in self.results
+                               if result["status"] == "completed")
+        return {
+            "elapsed_s": round(elapsed, 2),
+            **self.stats,
+            "conversations_per_s": round(len(self.results) / elapsed, 3) if elapsed else None,
+            "turns_per_s": round(sum(len(result["turns"]) for result in self.results) / elapsed, 3)
+            if elapsed else None,
+            "turn_latency_ms": {name: percentile(turns, fraction)
+                                for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))},
+            "conversation_latency_ms": {name: percentile(conversations, fraction)
+                                        for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))},
+        }
+
+    def _run_turn(self, thread_id, text):
+        """Post one user message, run the agent and collect the answer."""
+        start = time.perf_counter()
+        message = self._call(self.project.agents.messages.create,
+                             thread_id=thread_id, role="user", content=text)
+        self.log(thread_id, "message", message_log_data(user_message_data(message, text)))
+
+        attempts = 0
+        while True:
+            attempts += 1
+            self.limiter.acquire()
+            run = self._process(thread_id)
+            self.log(thread_id, "run", run_log_data(run_data(run)))
+            # A run the model's token or request quota turned down fails with
+            # `rate_limit_exceeded`; the message is still on the thread, so
+            # running again after a pause answers it.
+            if (run_status_value(run) != "failed" or run_error_code(run) != "rate_limit_exceeded"
+                    or attempts > self.max_retries):
+                break
+            self._back_off(attempts, suggested_wait(run.last_error))
+
+        turn = {"prompt": text, "run_id": run.id, "status": run_status_value(run), "attempts": attempts,
+                "answer": None, "error": None}
+        if turn["status"] == "completed":
+            answer = self._answer(thread_id)
+            if answer:
+                self.log(thread_id, "message", message_log_data(assistant_message_data(answer)))
+                turn["answer"] = answer.text_messages[-1].text.value
+        else:
+            turn["error"] = f"Agent run {turn['status']}: {run.last_error}"
+        turn["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return turn
+
+    def _process(self, thread_id):
+        """Start a run and poll it until it finishes.
+
+        Unlike `runs.create_and_process`, a 429 on a poll only retries that
+        poll instead of starting another run on the thread.
+        """
+        run = self._call(self.project.agents.runs.create, thread_id=thread_id, agent_id=self.agent_id)
+        while run_status_value(run) not in TERMINAL_STATUSES:
+            time.sleep(self.poll_interval)
+            run = self._call(self.project.agents.runs.get, thread_id=thread_id, run_id=run.id)
+        return run
+
+    def _answer(self, thread_id):
+        """The newest assistant message of a thread, or None."""
+        messages = self._call(self.project.agents.messages.list, thread_id=thread_id,
+                              order=ListSortOrder.DESCENDING, limit=1)
+        message = next(iter(messages), None)
+        if message and message.role.value.lower() == "assistant" and message.text_messages:
+            return message
+        return None
+
+    def _call(self, operation, *args, **kwargs):
+        """Call the Agents API, backing off on 429s the SDK gave up on."""
+        attempts = 0
+        while True:
+            try:
+                return operation(*args, **kwargs)
+            except HttpResponseError as e:
+                attempts += 1
+                if e.status_code != 429 or attempts > self.max_retries:
+                    raise
+                with self._lock:
+                    self.stats["throttled"] += 1
+                self._back_off(attempts, suggested_wait(e))
+
+    def _back_off(self, attempt, wait=None):
+        """Sleep before retry `attempt`: the suggested wait, else jittered backoff."""
+        if wait is None:
+            wait = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        with self._lock:
+            self.stats["retries"] += 1
+        self.limiter.pause(wait)
+        time.sleep(wait)
+
+    def _record(self, result, total):
+        with self._lock:
+            self.results.append(result)
+            self.stats[result["status"]] += 1
+            count = len(self.results)
+        if self.results_path:
+            with open(self.results_path, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps(result) + "\n")
+        if result["status"] != "completed":
+            print(f"⚠ Prompt {result['id']} failed: {result['error']}")
+        if count % 10 == 0 or count == total:
+            print(f"  {count}/{total} conversations done")
+
+
+def create_cosmos_log():
+    """Log to Cosmos DB the way app.py does; returns `(log, close)`.
+
+    Documents go through the same `LogPipeline` as in app.py: a background
+    writer in the configured log format whose listeners keep the thread
+    summaries, the stats document and (with `COSMOS_BY_DAY_ENABLED`) the
+    by-day copy up to date.  Returns `(None, None)` when Cosmos DB is not
+    configured.
+    """
+    if not os.getenv("COSMOS_ENDPOINT") or not os.getenv("COSMOS_KEY"):
+        return None, None
+
+    from client_factory import create_cosmos_client
+    from log_pipeline import LogPipeline, provision_log_containers
+
+    client = create_cosmos_client(os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY"))
+    database = client.create_database_if_not_exists(id=os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB"))
+    pipeline = LogPipeline(*provision_log_containers(database))
+
+    def close():
+        pipeline.close()
+        stats = pipeline.writer.snapshot()
+        print(f"✓ Logged to Cosmos DB: {stats['written']} documents ({stats['failed']} failed)")
+
+    return (lambda thread_id, log_type, data: pipeline.writer.submit(log_document(thread_id, log_type, data))), close
+
+
+def print_report(report):
+    print(f"\n{report['completed']} completed, {report['failed']} failed, {report['skipped']} skipped "
+          f"in {report['elapsed_s']}s ({report['conversations_per_s']} conversations/s, "
+          f"{report['turns_per_s']} turns/s)")
+    print(f"Retries: {report['retries']} ({report['throttled']} throttled API calls)")
+    for name in ("turn_latency_ms", "conversation_latency_ms"):
+        values = report[name]
+        print(f"  {name.replace('_ms', '').replace('_', ' '):<22}"
+              + "".join(f"{key} {value} ms   " for key, value in values.items() if value is not None))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ask the agent the demo question, or run a prompt set.")
+    parser.add_argument("--prompts", metavar="PATH", help="JSONL file of prompts to run as a batch")
+    parser.add_argument("--prompt-field", help="Field holding the prompt text (default: auto)")
+    parser.add_argument("--results", metavar="PATH", help="JSONL file to append results to and resume from")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")),
+                        help="Conversations in flight at once")
+    parser.add_argument("--rate", type=float, default=float(os.getenv("BATCH_RUNS_PER_SECOND", "0")),
+                        help="Agent runs started per second at most (0: no limit)")
+    parser.add_argument("--max-retries", type=int, default=int(os.getenv("BATCH_MAX_RETRIES", "6")),
+                        help="Retries of a rate-limited call or run")
+    parser.add_argument("--no-cosmos", action="store_true", help="Do not log to Cosmos DB")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Load environment variables from .env file
+    # This allows us to keep sensitive configuration data out of the source code
+    load_dotenv()
+    args = parse_args(argv)
+
+    # Retrieve required environment variables
+    # These should be set in the .env file or environment
+    azure_endpoint = os.getenv("AZURE_ENDPOINT")  # The Azure AI Project endpoint URL
+    azure_agent_id = os.getenv("AZURE_AGENT_ID")  # The unique identifier for the AI agent
+    if not azure_endpoint or not azure_agent_id:
+        raise ValueError("Please set AZURE_ENDPOINT and AZURE_AGENT_ID environment variables")
+
+    # The client is built on the same tuned transport as app.py (pool size,
+    # keep-alive, timeouts and 429 retries are configured through environment
+    # variables; see client_factory.py).  DefaultAzureCredential handles
+    # authentication through environment variables, managed identity, the
+    # Azure CLI, etc.; it is wrapped in the same token cache as in app.py, so
+    # a long batch never stalls on an expiring token (see credential_cache.py).
+    credential = credential_from_env(DefaultAzureCredential())
+    project = create_project_client(azure_endpoint, credential)
+    # Validates that the agent exists and is accessible
+    agent = project.agents.get_agent(azure_agent_id)
+
+    log, close_log = (None, None) if args.no_cosmos else create_cosmos_log()
+    runner = BatchRunner(
+        project,
+        agent.id,
+        log=log,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        max_retries=args.max_retries,
+        results_path=args.results
+    )
+    try:
+        if not args.prompts:
+            # The demo: one question on a new thread, conversation printed.
+            result = runner.run_conversation({"id": "demo", "turns": [DEMO_PROMPT]})
+            print(f"Created thread, ID: {result['thread_id']}")
+            for turn in result["turns"]:
+                print(f"user: {turn['prompt']}")
+                print(f"assistant: {turn['answer']}" if turn["answer"] else f"Run failed: {turn['error']}")
+            if result["error"] and not result["turns"]:
+                print(f"Run failed: {result['error']}")
+            return 0 if result["status"] == "completed" else 1
+
+        prompts = load_prompts(args.prompts, args.prompt_field)
+        print(f"Running {len(prompts)} prompts with {runner.concurrency} concurrent conversations")
+        report = runner.run(prompts)
+    finally:
+        if close_log:
+            close_log()
+        # Stops the token refresher along with the wrapped credential.
+        credential.close()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"✓ Report written to {args.json}")
+    return 0 if not report["failed"] else 1
+
 
-# Execute the agent run to process the message
-# This triggers the AI agent to analyze the message and generate a response
-# create_and_process() is a convenience method that creates and waits for completion
-run = project.agents.runs.create_and_process(
-    thread_id=thread.id,  # Process within the context of our thread
-    agent_id=agent.id)  # Use the specified agent for processing
-
-# Check if the run completed successfully
-# If there was an error, display it; otherwise, retrieve and display the conversation
-if run.status == "failed":
-    # Display error information if the agent run failed
-    print(f"Run failed: {run.last_error}")
-else:
-    # Retrieve all messages in the thread, ordered chronologically (oldest first)
-    # This includes both the user's original message and the agent's response(s)
-    messages = project.agents.messages.list(thread_id=thread.id, order=ListSortOrder.ASCENDING)
-
-    # Iterate through all messages in the conversation
-    for message in messages:
-        # Check if the message contains text content
-        # Messages can have different types of content (text, images, etc.)
-        if message.text_messages:
-            # Display the message role (user/assistant) and the actual text content
-            # text_messages[-1] gets the last text message (in case there are multiple)
-            print(f"{message.role}: {message.text_messages[-1].text.value}")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+"""Change feed processor that rolls run and message logs up per hour.
+
+The run documents written by `ThreadLogger.run` carry the model, final
+status and `created_at`/`completed_at`, but nothing aggregated them, so any
+latency or failure figure meant scanning raw logs.  This processor reads
+the log container's change feed and keeps rollup documents in the
+summaries container (partition `analytics`):
+
+* `runs:<hour>:<model>` – run count, failures, count per status and a
+  histogram of run durations (`DURATION_BUCKETS_MS`, cumulative upper
+  bounds like Prometheus' `le`);
+* `messages:<hour>` – message count and characters per role.
+
+`<hour>` is the UTC hour of the log's `timestamp` (`2025-01-31T14`).
+
+Progress is kept in one lease document per partition key range, in the
+same partition as the rollups (see change_feed.py).  Each page's counter
+increments and the lease checkpoint are committed together in one
+transactional batch, so a crash or restart neither loses nor double
+counts a change.  Several instances can run at once: each range is
+processed by the instance holding its lease, the others take over ranges
+whose leases expire.
+
+    python run_analytics.py            # follow the change feed
+    python run_analytics.py --once     # catch up and exit
+
+`/api/run-analytics` reads the rollups for the dashboard; the rollups are
+only as fresh as the last processed change.
+
+A log document that is written again shows up in the change feed again:
+a retried upsert, or the copy `python log_format.py` writes when it moves
+a log to the compact format.  Only the first version of a log is counted,
+with state bounded by a dedup window (`RUN_ANALYTICS_DEDUP_WINDOW`, one day
+by default):
+
+* a document stored (`_ts`) more than the window after its log
+  `timestamp` is a late rewrite of a log that was counted when it was
+  first written, and is skipped;
+* every counted log leaves a small marker document
+  (`counted:<thread>:<log key>`, see `log_format.log_key`) in the same
+  batch as its increments, and logs whose marker exists are skipped.
+  Markers must share the batch's partition, so they carry a `ttl` of
+  twice the window instead, which covers a rewrite inside the window even
+  when the processor lags by up to a window.
+
+So start the processor before migrating a container to the compact
+format: logs whose only version is a late rewrite are never counted.
+"""
+
+import argparse
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from azure.cosmos import exceptions
+
+from change_feed import ChangeFeedPages, LeaseLost, LeaseStore, partition_key_range_ids
+from cosmos_provisioning import KEEP_FOREVER
+from cosmos_queries import queries
+from log_format import decode, epoch_ms, log_key
+
+ANALYTICS_PARTITION = "analytics"
+
+# Upper bounds of the run duration histogram, in milliseconds.
+DURATION_BUCKETS_MS = [250, 500, 1000, 2000, 5000, 10000, 20000, 30000, 60000, 120000, 300000]
+
+# Cosmos DB limits: operations per transactional batch and per patch.
+MAX_BATCH_OPERATIONS = 100
+MAX_PATCH_OPERATIONS = 10
+
+
+def dedup_window():
+    """Seconds after its timestamp in which a rewritten log is recognised."""
+    return float(os.getenv("RUN_ANALYTICS_DEDUP_WINDOW", "86400"))
+
+
+def late_rewrite(document, window):
+    """True when a log was stored more than `window` seconds after its timestamp."""
+    logged = epoch_ms(decode(document).get("timestamp"))
+    stored = document.get("_ts")
+    return logged is not None and stored is not None and stored - logged / 1000 > window
+
+
+def hour_bucket(timestamp):
+    """`YYYY-MM-DDTHH` of an ISO timestamp."""
+    return (timestamp or "")[:13]
+
+
+def bucket_label(duration_ms):
+    """Histogram bucket of a run duration."""
+    for bound in DURATION_BUCKETS_MS:
+        if duration_ms <= bound:
+            return f"le_{bound}"
+    return "le_inf"
+
+
+def run_duration_ms(data):
+    """Duration of a logged run in milliseconds, or None if unfinished."""
+    try:
+        created = datetime.fromisoformat(data["created_at"])
+        completed = datetime.fromisoformat(data["completed_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if (created.tzinfo is None) != (completed.tzinfo is None):
+        created = created.replace(tzinfo=None)
+        completed = completed.replace(tzinfo=None)
+    return max(0.0, (completed - created).total_seconds() * 1000)
+
+
+def rollup_deltas(document):
+    """Counter increments for one log document: `{(rollup id, path): value}`."""
+    document = decode(document)
+    hour = hour_bucket(document.get("timestamp"))
+    data = document.get("data") or {}
+    deltas = Counter()
+    if not hour:
+        return deltas
+
+    if document.get("log_type") == "run":
+        rollup_id = f"runs:{hour}:{data.get('model') or 'unknown'}"
+        status = (data.get("status") or "unknown").lower()
+        deltas[(rollup_id, "/runs")] += 1
+        deltas[(rollup_id, f"/statuses/{status}")] += 1
+        if status == "failed":
+            deltas[(rollup_id, "/failed")] += 1
+        duration = run_duration_ms(data)
+        if duration is not None:
+            deltas[(rollup_id, "/duration_count")] += 1
+            deltas[(rollup_id, "/duration_ms_sum")] += round(duration)
+            deltas[(rollup_id, f"/histogram/{bucket_label(duration)}")] += 1
+    elif document.get("log_type") == "message":
+        rollup_id = f"messages:{hour}"
+        role = data.get("role") or "unknown"
+        characters = sum(len(part.get("text") or "") for part in data.get("content") or []
+                         if isinstance(part, dict))
+        deltas[(rollup_id, "/messages")] += 1
+        deltas[(rollup_id, f"/roles/{role}")] += 1
+        deltas[(rollup_id, f"/characters/{role}")] += characters
+    return deltas
+
+
+def new_rollup(rollup_id, partition=ANALYTICS_PARTITION):
+    """An empty rollup document, created before its first increment."""
+    kind, hour, *model = rollup_id.split(":", 2)
+    if kind == "runs":
+        return {"id": rollup_id, "partition": partition, "kind": "run_rollup", "hour": hour,
+                "model": model[0], "runs": 0, "failed": 0, "duration_count": 0,
+                "duration_ms_sum": 0, "statuses": {}, "histogram": {}, "ttl": KEEP_FOREVER}
+    return {"id": rollup_id, "partition": partition, "kind": "message_rollup", "hour": hour,
+            "messages": 0, "roles": {}, "characters": {}, "ttl": KEEP_FOREVER}
+
+
+def counted_marker(document, partition=ANALYTICS_PARTITION, ttl=2 * 86400):
+    """The document recording that a log is in the rollups."""
+    return {"id": f"counted:{document.get('thread_id')}:{log_key(document)}",
+            "partition": partition, "kind": "counted_log", "ttl": int(ttl)}
+
+
+def patch_operations(deltas):
+    """`patch` batch operations applying the deltas, grouped per rollup."""
+    by_rollup = defaultdict(list)
+    for (rollup_id, path), value in deltas.items():
+        by_rollup[rollup_id].append({"op": "incr", "path": path, "value": value})
+    return [("patch", (rollup_id, increments[start:start + MAX_PATCH_OPERATIONS]))
+            for rollup_id, increments in by_rollup.items()
+            for start in range(0, len(increments), MAX_PATCH_OPERATIONS)]
+
+
+class RunAnalytics:
+    """Fold the log container's change feed into hourly rollup documents."""
+
+    def __init__(self, log_container, rollup_container, owner=None, page_size=100,
+                 lease_ttl=60.0, partition=ANALYTICS_PARTITION, name="run-analytics",
+                 dedup_window=86400):
+        self.log_container = log_container
+        self.rollup_container = rollup_container
+        self.page_size = page_size
+        self.partition = partition
+        self.dedup_window = dedup_window
+        self.leases = LeaseStore(rollup_container, name, partition, owner=owner, ttl=lease_ttl)
+        self._held = {}
+        # Rollups known to exist, so they are only created once per process.
+        self._created = set()
+        self.stats = {"documents": 0, "duplicates": 0, "late_rewrites": 0, "batches": 0,
+                      "leases_lost": 0}
+
+    def run_once(self):
+        """Process every change available on the ranges this instance can lease."""
+        processed = 0
+        for range_id in partition_key_range_ids(self.log_container):
+            lease = self._held.get(range_id) or self.leases.acquire(range_id)
+            if lease is None:
+                continue
+            self._held[range_id] = lease
+            try:
+                processed += self._drain(lease)
+                self.leases.renew(lease)
+            except LeaseLost:
+                self.stats["leases_lost"] += 1
+                self._held.pop(range_id, None)
+        return processed
+
+    def run_forever(self, poll_interval=5.0, stop=None):
+        """Poll the change feed until `stop` (a `threading.Event`) is set."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                processed = self.run_once()
+                if processed:
+                    print(f"✓ Rolled up {processed} log documents")
+            except Exception as e:
+                print(f"⚠ Error processing the change feed: {e}")
+            stop.wait(poll_interval)
+
+    def close(self):
+        """Release held leases so other instances can take over at once."""
+        for lease in self._held.values():
+            self.leases.release(lease)
+        self._held = {}
+
+    def _drain(self, lease):
+        pages = ChangeFeedPages(self.log_container, lease["range_id"], lease.get("continuation"),
+                                None, self.page_size)
+        page_start = lease.get("continuation")
+        skip = lease.get("offset") or 0
+        processed = 0
+
+        for page in pages:
+            documents = list(enumerate(page))[skip:]
+            counted = self._counted([document for _, document in documents])
+            pending, markers = Counter(), []
+            for index, document in documents:
+                processed += 1
+                deltas = rollup_deltas(document)
+                if not deltas:
+                    continue
+                if late_rewrite(document, self.dedup_window):
+                    self.stats["late_rewrites"] += 1
+                    continue
+                marker = self._marker(document)
+                if marker["id"] in counted:
+                    # Written again (see the module docstring): only the
+                    # marker is refreshed.
+                    self.stats["duplicates"] += 1
+                    deltas = Counter()
+                counted.add(marker["id"])
+                if len(patch_operations(pending + deltas)) + len(markers) + 1 >= MAX_BATCH_OPERATIONS:
+                    # Too much for one batch: commit up to here and resume
+                    # mid-page from the same continuation after a restart.
+                    self._commit(lease, pending, markers, page_start, index)
+                    pending, markers = Counter(), []
+                pending.update(deltas)
+                markers.append(marker)
+            skip = 0
+            page_start = pages.continuation_token
+            self._commit(lease, pending, markers, page_start, 0)
+        return processed
+
+    def _marker(self, document):
+        return counted_marker(document, self.partition, ttl=2 * self.dedup_window)
+
+    def _counted(self, documents):
+        """Marker IDs of the documents whose logs are already counted."""
+        ids = sorted({self._marker(document)["id"] for document in documents})
+        if not ids:
+            return set()
+        return set(queries.iterate(self.rollup_container, "counted_logs",
+                                   {"@partition": self.partition, "@ids": ids}, partition_key=self.partition))
+
+    def _commit(self, lease, deltas, markers, continuation, offset):
+        operations = patch_operations(deltas) + [("upsert", (marker,)) for marker in markers]
+        for rollup_id in {rollup_id for rollup_id, _ in deltas} - self._created:
+            try:
+                self.rollup_container.create_item(body=new_rollup(rollup_id, self.partition))
+            except exceptions.CosmosResourceExistsError:
+                pass
+            if len(self._created) >= 10000:
+                self._created.clear()
+            self._created.add(rollup_id)
+
+        operations.append(self.leases.checkpoint_operation(lease, continuation, offset))
+        try:
+            self.rollup_container.execute_item_batch(
+                batch_operations=operations, partition_key=self.partition)
+        except exceptions.CosmosBatchOperationError as e:
+            if e.error_index == len(operations) - 1:
+                raise LeaseLost(lease["range_id"])
+            raise
+        lease.update(continuation=continuation, offset=offset)
+        self.stats["batches"] += 1
+        self.stats["documents"] += sum(value for (_, path), value in deltas.items()
+                                       if path in ("/runs", "/messages"))
+
+
+def histogram_percentile(histogram, count, quantile):
+    """Upper bound (ms) of the bucket holding a quantile, or None."""
+    if not count:
+        return None
+    rank = math.ceil(quantile * count)
+    seen = 0
+    for bound in DURATION_BUCKETS_MS:
+        seen += histogram.get(f"le_{bound}", 0)
+        if seen >= rank:
+            return bound
+    return None
+
+
+def summarize_rollups(rollups):
+    """Per-model and per-hour figures for `/api/run-analytics`."""
+    models = defaultdict(lambda: {"runs": 0, "failed": 0, "duration_count": 0,
+                                  "duration_ms_sum": 0, "statuses": Counter(), "histogram": Counter()})
+    hours = defaultdict(lambda: {"runs": 0, "failed": 0, "messages": 0})
+    roles = Counter()
+
+    for rollup in rollups:
+        hour = hours[rollup["hour"]]
+        if rollup.get("kind") == "run_rollup":
+            model = models[rollup.get("model")]
+            for field in ("runs", "failed", "duration_count", "duration_ms_sum"):
+                model[field] += rollup.get(field) or 0
+            model["statuses"].update(rollup.get("statuses") or {})
+            model["histogram"].update(rollup.get("histogram") or {})
+            hour["runs"] += rollup.get("runs") or 0
+            hour["failed"] += rollup.get("failed") or 0
+        elif rollup.get("kind") == "message_rollup":
+            hour["messages"] += rollup.get("messages") or 0
+            roles.update(rollup.get("roles") or {})
+
+    return {
+        "models": [
+            {
+                "model": name,
+                "runs": model["runs"],
+                "failed": model["failed"],
+                "failure_rate": model["failed"] / model["runs"] if model["runs"] else 0.0,
+                "avg_ms": model["duration_ms_sum"] / model["duration_count"] if model["duration_count"] else None,
+                "p50_ms": histogram_percentile(model["histogram"], model["duration_count"], 0.5),
+                "p95_ms": histogram_percentile(model["histogram"], model["duration_count"], 0.95),
+                "statuses": dict(model["statuses"]),
+                "histogram": {label: model["histogram"].get(label, 0) for label in
+                              [f"le_{bound}" for bound in DURATION_BUCKETS_MS] + ["le_inf"]}
+            }
+            for name, model in sorted(models.items(), key=lambda item: -item[1]["runs"])
+        ],
+        "hours": [dict(hour=name, **values) for name, values in sorted(hours.items())],
+        "messages": {"total": sum(roles.values()), "roles": dict(roles)}
+    }
+
+
+def read_rollups(container, hours=24, partition=ANALYTICS_PARTITION):
+    """Rollup documents of the last `hours` hours."""
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%dT%H")
+    return list(queries.iterate(container, "analytics_rollups_since",
+                                {"@partition": partition, "@since": since}, partition_key=partition))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Roll run and message logs up from the change feed.")
+    parser.add_argument("--once", action="store_true", help="Process what is available and exit")
+    parser.add_argument("--poll-interval", type=float,
+                        default=float(os.getenv("RUN_ANALYTICS_POLL_INTERVAL", "5")))
+    parser.add_argument("--lease-ttl", type=float, default=float(os.getenv("RUN_ANALYTICS_LEASE_TTL", "60")))
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--dedup-window", type=float, default=dedup_window())
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from azure.cosmos import CosmosClient
+
+    from cosmos_provisioning import provision_summaries_container
+
+    load_dotenv()
+    args = parse_args()
+    client = CosmosClient(os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY"))
+    database = client.get_database_client(os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB"))
+    processor = RunAnalytics(
+        database.get_container_client(os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs")),
+        provision_summaries_container(database, os.getenv("COSMOS_SUMMARIES_CONTAINER_NAME", "ThreadSummaries")),
+        page_size=args.page_size,
+        lease_ttl=args.lease_ttl,
+        dedup_window=args.dedup_window
+    )
+    try:
+        if args.once:
+            print(f"✓ Rolled up {processor.run_once()} log documents")
+        else:
+            processor.run_forever(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processor.close()
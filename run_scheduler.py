@@ -0,0 +1,208 @@
+"""Shared, non-blocking polling of Azure AI Agent runs.
+
+`runs.create_and_process` blocks the calling Flask worker for the whole agent
+run.  In async mode the chat endpoint only *starts* the run and hands it to a
+`RunScheduler`, which owns a single poller thread for every in-flight run.
+
+Each run is polled on its own adaptive schedule: the first check happens
+quickly (short answers finish fast), then the interval grows geometrically up
+to a ceiling so long runs do not burn requests.  The actual `runs.get` calls
+and the completion callback execute on a small thread pool, so a slow poll
+never delays the others.  Finished runs are kept for `result_ttl` seconds so
+clients can collect the answer from the status endpoint.
+
+A run is given up on, and its handle marked failed, after `max_errors`
+consecutive failed polls (a deleted thread or revoked credentials never
+recover) or once it has been tracked for `deadline` seconds, so no handle
+stays in flight forever.
+
+The scheduler only needs `project.agents.runs.get(thread_id=..., run_id=...)`,
+which keeps it easy to drive with a fake project client.
+"""
+
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Run states after which the agent will not make further progress on its own.
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired", "requires_action"}
+
+
+def run_status_value(run):
+    """Return the run status as a plain lowercase string."""
+    status = run.status.value if hasattr(run.status, 'value') else str(run.status)
+    return status.lower()
+
+
+class RunHandle:
+    """Tracks one in-flight run and, once finished, its result."""
+
+    def __init__(self, run_id, thread_id, context=None):
+        self.run_id = run_id
+        self.thread_id = thread_id
+        self.context = context or {}
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.polls = 0
+        self.errors = 0
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the run finishes or `timeout` seconds elapse."""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        """Serialize the handle for the status endpoint."""
+        payload = {
+            'run_id': self.run_id,
+            'thread_id': self.thread_id,
+            'status': self.status,
+            'done': self.done,
+            'polls': self.polls
+        }
+        if self.error:
+            payload['error'] = self.error
+        if self.result is not None:
+            payload.update(self.result)
+        return payload
+
+
+class RunScheduler:
+    """Poll many agent runs from one scheduler thread with adaptive backoff."""
+
+    def __init__(self, project, on_complete=None, min_interval=0.25,
+                 max_interval=2.0, backoff=1.5, max_workers=8, result_ttl=600,
+                 max_errors=10, deadline=1800):
+        self.project = project
+        self.on_complete = on_complete
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.result_ttl = result_ttl
+        self.max_errors = max_errors
+        self.deadline = deadline
+        self._handles = {}
+        self._intervals = {}
+        self._schedule = []
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="run-poller")
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="run-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, thread_id, run_id, context=None):
+        """Start tracking a run that has already been created."""
+        handle = RunHandle(run_id, thread_id, context)
+        with self._cond:
+            self._handles[run_id] = handle
+            self._intervals[run_id] = self.min_interval
+            heapq.heappush(self._schedule, (time.monotonic() + self.min_interval, run_id))
+            self._cond.notify()
+        return handle
+
+    def get(self, run_id):
+        """Return the handle for `run_id`, or None if unknown or expired."""
+        with self._cond:
+            return self._handles.get(run_id)
+
+    def in_flight(self):
+        """Number of runs that have not finished yet."""
+        with self._cond:
+            return sum(1 for handle in self._handles.values() if not handle.done)
+
+    def close(self):
+        """Stop polling; runs still in flight are abandoned."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    # Scheduler internals --------------------------------------------------
+
+    def _loop(self):
+        while True:
+            due = []
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    if self._schedule and self._schedule[0][0] <= now:
+                        break
+                    timeout = self._schedule[0][0] - now if self._schedule else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                now = time.monotonic()
+                while self._schedule and self._schedule[0][0] <= now:
+                    _, run_id = heapq.heappop(self._schedule)
+                    handle = self._handles.get(run_id)
+                    if handle and not handle.done:
+                        due.append(handle)
+                self._expire_finished()
+
+            for handle in due:
+                self._executor.submit(self._poll, handle)
+
+    def _poll(self, handle):
+        try:
+            run = self.project.agents.runs.get(thread_id=handle.thread_id, run_id=handle.run_id)
+        except Exception as e:
+            print(f"Error polling run {handle.run_id}: {e}")
+            handle.errors += 1
+            if handle.errors >= self.max_errors:
+                self._give_up(handle, f"Polling failed {handle.errors} times in a row: {e}")
+            else:
+                self._reschedule(handle)
+            return
+
+        handle.polls += 1
+        handle.errors = 0
+        handle.status = run_status_value(run)
+        if handle.status not in TERMINAL_STATUSES:
+            if time.time() - handle.submitted_at >= self.deadline:
+                self._give_up(handle, f"Run still {handle.status} after {self.deadline} seconds")
+            else:
+                self._reschedule(handle)
+            return
+
+        try:
+            if self.on_complete:
+                handle.result = self.on_complete(handle, run)
+        except Exception as e:
+            handle.error = str(e)
+        finally:
+            handle.finished_at = time.time()
+            handle._done.set()
+
+    def _give_up(self, handle, error):
+        """Stop polling a run and mark its handle failed."""
+        print(f"⚠ Giving up on run {handle.run_id}: {error}")
+        handle.status = "failed"
+        handle.error = error
+        handle.finished_at = time.time()
+        handle._done.set()
+
+    def _reschedule(self, handle):
+        with self._cond:
+            interval = self._intervals.get(handle.run_id, self.min_interval)
+            self._intervals[handle.run_id] = min(interval * self.backoff, self.max_interval)
+            heapq.heappush(self._schedule, (time.monotonic() + interval, handle.run_id))
+            self._cond.notify()
+
+    def _expire_finished(self):
+        """Forget finished runs older than `result_ttl`; caller holds the lock."""
+        cutoff = time.time() - self.result_ttl
+        expired = [run_id for run_id, handle in self._handles.items()
+                   if handle.done and handle.finished_at < cutoff]
+        for run_id in expired:
+            del self._handles[run_id]
+            self._intervals.pop(run_id, None)
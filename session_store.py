@@ -0,0 +1,425 @@
+"""Session → agent thread mappings that survive restarts and scale-out.
+
+The browser keeps a `session_id` and the backend maps it to an Azure AI agent
+thread.  Keeping that map in a module-level dict meant every gunicorn worker
+(and every replica) had its own copy, so a request landing on a different
+worker silently started a fresh thread.  This module offers three
+interchangeable stores with the same small interface:
+
+* `InMemorySessionStore` – the original per-process dict, for local runs.
+* `CosmosSessionStore` – one document per session in a container partitioned
+  by `/session_id`, so every lookup is a single point read.
+* `CachedSessionStore` – an LRU cache with TTL placed in front of either of
+  the above, so hot sessions need no network round trip at all.
+
+`get_or_create(session_id, create_thread)` guarantees that concurrent first
+messages for a session only create one thread: in-process callers serialize
+on a per-session lock, and across processes the Cosmos store claims the
+session document with `create_item` before creating the thread.  Callers that
+have just seen `get()` return None pass `known_new=True` so the Cosmos store
+goes straight to the claim instead of reading the document a second time.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+
+class _KeyedLocks:
+    """Hand out one lock per key and forget it once nobody holds it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def acquire(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+
+    def release(self, key):
+        with self._lock:
+            entry = self._locks[key]
+            entry[0].release()
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+
+class InMemorySessionStore:
+    """Per-process session map; lost on restart and not shared by workers."""
+
+    def __init__(self):
+        self._threads = {}
+        self._locks = _KeyedLocks()
+
+    def get(self, session_id):
+        """Return the thread ID for a session, or None."""
+        return self._threads.get(session_id)
+
+    def get_or_create(self, session_id, create_thread, known_new=False):
+        """Return the session's thread ID, calling `create_thread()` if new."""
+        thread_id = self._threads.get(session_id)
+        if thread_id:
+            return thread_id
+
+        self._locks.acquire(session_id)
+        try:
+            thread_id = self._threads.get(session_id)
+            if not thread_id:
+                thread_id = create_thread()
+                self._threads[session_id] = thread_id
+            return thread_id
+        finally:
+            self._locks.release(session_id)
+
+
+class CosmosSessionStore:
+    """Session map stored in Cosmos DB, keyed and partitioned by session ID.
+
+    Each session is a document `{id, session_id, thread_id, ...}`.  Creating a
+    session first writes a claim document with no `thread_id`; only the writer
+    whose `create_item` succeeds creates the agent thread.  Other workers poll
+    the claim until the thread ID appears, and take over claims older than
+    `claim_timeout` seconds (e.g. the owner crashed mid-way).  When creating
+    the thread or recording it fails, the owner deletes its claim again so
+    the next request can retry right away instead of waiting it out.
+    """
+
+    def __init__(self, container, claim_timeout=30.0, poll_interval=0.2):
+        self.container = container
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        self._locks = _KeyedLocks()
+
+    def get(self, session_id):
+        """Return the thread ID for a session with one point read, or None."""
+        document = self._read(session_id)
+        return document.get("thread_id") if document else None
+
+    def get_or_create(self, session_id, create_thread, known_new=False):
+        """Return the session's thread ID, creating the thread exactly once."""
+        if not session_id:
+            raise ValueError("session_id is required")
+        self._locks.acquire(session_id)
+        try:
+            document = None if known_new else self._read(session_id)
+            if document and document.get("thread_id"):
+                return document["thread_id"]
+
+            if document is None:
+                claim = {
+                    "id": session_id,
+                    "session_id": session_id,
+                    "thread_id": None,
+                    "claimed_at": time.time()
+                }
+                try:
+                    claimed = self.container.create_item(body=claim)
+                    return self._fill_claim(claimed, create_thread)
+                except exceptions.CosmosAccessConditionFailedError:
+                    # Our claim was taken over while the thread was being
+                    # created; the session keeps the winner's thread.
+                    document = self._read(session_id)
+                except exceptions.CosmosResourceExistsError:
+                    # Another worker claimed the session first.
+                    document = self._read(session_id)
+
+            return self._wait_for_claim(session_id, document, create_thread)
+        finally:
+            self._locks.release(session_id)
+
+    def _wait_for_claim(self, session_id, document, create_thread):
+        deadline = time.monotonic() + self.claim_timeout
+        while document is not None and not document.get("thread_id"):
+            if time.time() - document.get("claimed_at", 0) > self.claim_timeout:
+                try:
+                    return self._fill_claim(document, create_thread)
+                except exceptions.CosmosAccessConditionFailedError:
+                    pass  # Someone else took over or finished; re-read.
+            elif time.monotonic() > deadline:
+                break
+            else:
+                time.sleep(self.poll_interval)
+            document = self._read(session_id)
+
+        if document and document.get("thread_id"):
+            return document["thread_id"]
+        raise RuntimeError(f"Timed out waiting for session {session_id} to get a thread")
+
+    def _fill_claim(self, claim, create_thread):
+        """Create the thread and record it on the claim we own."""
+        try:
+            thread_id = create_thread()
+            document = {
+                "id": claim["id"],
+                "session_id": claim["session_id"],
+                "thread_id": thread_id,
+                "created_at": datetime.utcnow().isoformat()
+            }
+            self.container.replace_item(
+                item=claim["id"],
+                body=document,
+                etag=claim.get("_etag"),
+                match_condition=MatchConditions.IfNotModified if claim.get("_etag") else None
+            )
+        except exceptions.CosmosAccessConditionFailedError:
+            print(f"⚠ Session {claim['id']} was taken over; thread {thread_id} is left unused")
+            raise
+        except Exception:
+            self._release_claim(claim)
+            raise
+        return thread_id
+
+    def _release_claim(self, claim):
+        """Delete a claim we own, unless someone else has taken it over."""
+        try:
+            self.container.delete_item(
+                item=claim["id"],
+                partition_key=claim["session_id"],
+                etag=claim.get("_etag"),
+                match_condition=MatchConditions.IfNotModified if claim.get("_etag") else None
+            )
+        except exceptions.CosmosHttpResponseError as e:
+            print(f"⚠ Could not release session claim {claim['id']}: {e}")
+
+    def _read(self, session_id):
+        try:
+            return self.container.read_item(item=session_id, partition_key=session_id)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+
+class CachedSessionStore:
+    """LRU cache with TTL in front of another session store."""
+
+    def __init__(self, backend, max_entries=10000, ttl=300):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the thread ID from cache, else from the backend."""
+        thread_id = self._cached(session_id)
+        if thread_id:
+            return thread_id
+
+        thread_id = self.backend.get(session_id)
+        if thread_id:
+            self._remember(session_id, thread_id)
+        return thread_id
+
+    def get_or_create(self, session_id, create_thread, known_new=False):
+        """Return the thread ID from cache, else let the backend resolve it."""
+        thread_id = self._cached(session_id)
+        if thread_id:
+            return thread_id
+
+        thread_id = self.backend.get_or_create(session_id, create_thread, known_new)
+        self._remember(session_id, thread_id)
+        return thread_id
+
+    def _cached(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            thread_id, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return thread_id
+
+    def _remember(self, session_id, thread_id):
+        with self._lock:
+            self._entries[session_id] = (thread_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Asyncio variants for asgi_app.py: same behaviour, with `create_thread` a
+# coroutine function and an `azure.cosmos.aio` container.
+
+
+class _AsyncKeyedLocks:
+    """`_KeyedLocks` for coroutines on one event loop."""
+
+    def __init__(self):
+        self._locks = {}
+
+    async def acquire(self, key):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        await entry[0].acquire()
+
+    def release(self, key):
+        entry = self._locks[key]
+        entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+
+class AsyncInMemorySessionStore:
+    """Async `InMemorySessionStore`."""
+
+    def __init__(self):
+        self._threads = {}
+        self._locks = _AsyncKeyedLocks()
+
+    async def get(self, session_id):
+        """Return the thread ID for a session, or None."""
+        return self._threads.get(session_id)
+
+    async def get_or_create(self, session_id, create_thread, known_new=False):
+        """Return the session's thread ID, awaiting `create_thread()` if new."""
+        thread_id = self._threads.get(session_id)
+        if thread_id:
+            return thread_id
+
+        await self._locks.acquire(session_id)
+        try:
+            thread_id = self._threads.get(session_id)
+            if not thread_id:
+                thread_id = await create_thread()
+                self._threads[session_id] = thread_id
+            return thread_id
+        finally:
+            self._locks.release(session_id)
+
+
+class AsyncCosmosSessionStore(CosmosSessionStore):
+    """Async `CosmosSessionStore`, with the same claim protocol and documents."""
+
+    def __init__(self, container, claim_timeout=30.0, poll_interval=0.2):
+        super().__init__(container, claim_timeout, poll_interval)
+        self._locks = _AsyncKeyedLocks()
+
+    async def get(self, session_id):
+        """Return the thread ID for a session with one point read, or None."""
+        document = await self._read(session_id)
+        return document.get("thread_id") if document else None
+
+    async def get_or_create(self, session_id, create_thread, known_new=False):
+        """Return the session's thread ID, creating the thread exactly once."""
+        if not session_id:
+            raise ValueError("session_id is required")
+        await self._locks.acquire(session_id)
+        try:
+            document = None if known_new else await self._read(session_id)
+            if document and document.get("thread_id"):
+                return document["thread_id"]
+
+            if document is None:
+                claim = {
+                    "id": session_id,
+                    "session_id": session_id,
+                    "thread_id": None,
+                    "claimed_at": time.time()
+                }
+                try:
+                    claimed = await self.container.create_item(body=claim)
+                    return await self._fill_claim(claimed, create_thread)
+                except exceptions.CosmosAccessConditionFailedError:
+                    # Our claim was taken over while the thread was being
+                    # created; the session keeps the winner's thread.
+                    document = await self._read(session_id)
+                except exceptions.CosmosResourceExistsError:
+                    document = await self._read(session_id)
+
+            return await self._wait_for_claim(session_id, document, create_thread)
+        finally:
+            self._locks.release(session_id)
+
+    async def _wait_for_claim(self, session_id, document, create_thread):
+        deadline = time.monotonic() + self.claim_timeout
+        while document is not None and not document.get("thread_id"):
+            if time.time() - document.get("claimed_at", 0) > self.claim_timeout:
+                try:
+                    return await self._fill_claim(document, create_thread)
+                except exceptions.CosmosAccessConditionFailedError:
+                    pass
+            elif time.monotonic() > deadline:
+                break
+            else:
+                await asyncio.sleep(self.poll_interval)
+            document = await self._read(session_id)
+
+        if document and document.get("thread_id"):
+            return document["thread_id"]
+        raise RuntimeError(f"Timed out waiting for session {session_id} to get a thread")
+
+    async def _fill_claim(self, claim, create_thread):
+        try:
+            thread_id = await create_thread()
+            document = {
+                "id": claim["id"],
+                "session_id": claim["session_id"],
+                "thread_id": thread_id,
+                "created_at": datetime.utcnow().isoformat()
+            }
+            await self.container.replace_item(
+                item=claim["id"],
+                body=document,
+                etag=claim.get("_etag"),
+                match_condition=MatchConditions.IfNotModified if claim.get("_etag") else None
+            )
+        except exceptions.CosmosAccessConditionFailedError:
+            print(f"⚠ Session {claim['id']} was taken over; thread {thread_id} is left unused")
+            raise
+        except Exception:
+            await self._release_claim(claim)
+            raise
+        return thread_id
+
+    async def _release_claim(self, claim):
+        try:
+            await self.container.delete_item(
+                item=claim["id"],
+                partition_key=claim["session_id"],
+                etag=claim.get("_etag"),
+                match_condition=MatchConditions.IfNotModified if claim.get("_etag") else None
+            )
+        except exceptions.CosmosHttpResponseError as e:
+            print(f"⚠ Could not release session claim {claim['id']}: {e}")
+
+    async def _read(self, session_id):
+        try:
+            return await self.container.read_item(item=session_id, partition_key=session_id)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+
+class AsyncCachedSessionStore(CachedSessionStore):
+    """`CachedSessionStore` in front of an async session store."""
+
+    async def get(self, session_id):
+        """Return the thread ID from cache, else from the backend."""
+        thread_id = self._cached(session_id)
+        if thread_id:
+            return thread_id
+
+        thread_id = await self.backend.get(session_id)
+        if thread_id:
+            self._remember(session_id, thread_id)
+        return thread_id
+
+    async def get_or_create(self, session_id, create_thread, known_new=False):
+        """Return the thread ID from cache, else let the backend resolve it."""
+        thread_id = self._cached(session_id)
+        if thread_id:
+            return thread_id
+
+        thread_id = await self.backend.get_or_create(session_id, create_thread, known_new)
+        self._remember(session_id, thread_id)
+        return thread_id
@@ -0,0 +1,168 @@
+"""Background warm-up and the cached agent definition.
+
+Importing app.py used to connect to Cosmos DB, provision its containers and
+fetch the agent definition synchronously.  A cold instance therefore took
+seconds before it could answer anything, and a slow Azure dependency could
+keep a worker from booting at all.  Instead the app now:
+
+* starts every network-bound initialization step as a named `Warmup` task on
+  a background thread, retried with exponential backoff until it succeeds;
+* serves routes that need no Azure service (`/`, `/api/new-session`,
+  `/api/ready`) immediately, while other routes wait a bounded time for the
+  first warm-up attempt to finish;
+* keeps the agent definition in a `CachedAgent` that a timer thread
+  refreshes every `AGENT_REFRESH_INTERVAL` seconds instead of on the
+  request path.
+
+`/api/ready` reports the state of every task, so a load balancer or an
+orchestrator's readiness probe only routes traffic to warm instances.
+"""
+
+import threading
+import time
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class _Task:
+    def __init__(self, name):
+        self.name = name
+        self.status = PENDING
+        self.error = None
+        self.attempts = 0
+        self.started_at = time.monotonic()
+        self.elapsed = None
+        # Set once the first attempt has finished, whatever its outcome.
+        self.attempted = threading.Event()
+
+
+class Warmup:
+    """Run named start-up tasks in the background and track their state."""
+
+    def __init__(self, retry_interval=1.0, max_retry_interval=60.0):
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def start(self, name, func):
+        """Run `func` on a daemon thread, retrying until it succeeds."""
+        task = _Task(name)
+        with self._lock:
+            self._tasks[name] = task
+        threading.Thread(target=self._run, args=(task, func),
+                         name=f"warmup-{name}", daemon=True).start()
+        return task
+
+    def wait(self, name, timeout=None):
+        """Wait for the first attempt of a task; return True if it is ready.
+
+        Unknown tasks (e.g. a service that is not configured) count as
+        ready so callers need not special-case them.
+        """
+        task = self._tasks.get(name)
+        if task is None:
+            return True
+        task.attempted.wait(timeout)
+        return task.status == READY
+
+    def is_ready(self, name):
+        task = self._tasks.get(name)
+        return task is None or task.status == READY
+
+    def is_settled(self, name):
+        """True once the first attempt has finished, successfully or not."""
+        task = self._tasks.get(name)
+        return task is None or task.attempted.is_set()
+
+    def snapshot(self):
+        """Return the state of every task."""
+        with self._lock:
+            tasks = list(self._tasks.values())
+        return {
+            task.name: {
+                "status": task.status,
+                "attempts": task.attempts,
+                "error": task.error,
+                "elapsed_ms": round(task.elapsed * 1000, 1) if task.elapsed is not None else None
+            }
+            for task in tasks
+        }
+
+    def _run(self, task, func):
+        delay = self.retry_interval
+        while True:
+            task.attempts += 1
+            try:
+                func()
+            except Exception as e:
+                task.status = FAILED
+                task.error = str(e)
+                task.attempted.set()
+                print(f"⚠ Warning: Warm-up of {task.name} failed (attempt {task.attempts}): {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+                continue
+
+            task.status = READY
+            task.error = None
+            task.elapsed = time.monotonic() - task.started_at
+            task.attempted.set()
+            print(f"✓ Warm-up of {task.name} finished in {task.elapsed:.2f}s")
+            return
+
+
+class CachedAgent:
+    """The agent definition, fetched once and refreshed in the background.
+
+    `get()` never touches the network.  After `start()` a daemon thread
+    refetches the definition every `refresh_interval` seconds once the
+    first fetch (the warm-up task) has succeeded; on failure the previous
+    copy is kept.  `on_refresh(agent)` is called after every successful
+    fetch.
+    """
+
+    def __init__(self, load, refresh_interval=60, on_refresh=None):
+        self.load = load
+        self.refresh_interval = refresh_interval
+        self.on_refresh = on_refresh
+        self.agent = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def get(self):
+        """Return the cached agent (None until the first fetch succeeded)."""
+        return self.agent
+
+    def refresh(self):
+        """Fetch the agent definition now (also the warm-up task)."""
+        agent = self.load()
+        self.agent = agent
+        if self.on_refresh:
+            self.on_refresh(agent)
+        return agent
+
+    def start(self):
+        """Start the periodic refresh thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop,
+                                            name="agent-refresh", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.refresh_interval):
+            if self.agent is None:
+                # The warm-up task is still retrying the first fetch.
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the previous definition; retry at the next interval.
+                print(f"⚠ Warning: Could not refresh agent definition: {e}")
@@ -4,6 +4,7 @@ class ChatInterface {
         this.sessionId = null;
         this.isLoading = false;
         this.logsVisible = false;
+        this.resetLogState();
         this.initializeElements();
         this.initializeEventListeners();
         this.initializeSession();
@@ -101,7 +102,7 @@ class ChatInterface {
         this.setLoading(true);
         
         try {
-            const response = await fetch('/api/chat', {
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -113,9 +114,7 @@ class ChatInterface {
             });
 
             if (response.ok) {
-                const data = await response.json();
-                this.addMessage(data.response, 'agent');
-                this.sessionId = data.session_id; // Update session ID if needed
+                await this.readResponseStream(response);
             } else {
                 const errorData = await response.json();
                 this.addMessage(
@@ -136,6 +135,66 @@ class ChatInterface {
         }
     }
 
+    async readResponseStream(response) {
+        // The server sends server-sent events: `delta` frames carry new text,
+        // `done` carries the final answer and `error` ends the stream early.
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let paragraph = null;
+        let text = '';
+
+        const handleEvent = (event, data) => {
+            if (event === 'delta') {
+                if (!paragraph) {
+                    // First token: swap the spinner for the growing answer.
+                    this.loadingOverlay.style.display = 'none';
+                    paragraph = this.addMessage('', 'agent');
+                }
+                text += data.text;
+                paragraph.textContent = text;
+                this.scrollToBottom();
+            } else if (event === 'done') {
+                if (!paragraph) {
+                    paragraph = this.addMessage('', 'agent');
+                }
+                paragraph.textContent = data.response;
+                this.sessionId = data.session_id; // Update session ID if needed
+            } else if (event === 'error') {
+                this.addMessage(
+                    `Sorry, I encountered an error: ${data.error || 'Unknown error'}`, 
+                    'agent', 
+                    true
+                );
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                if (data) {
+                    handleEvent(event, JSON.parse(data));
+                }
+            }
+        }
+    }
+
     addMessage(content, sender, isError = false) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${sender}-message${isError ? ' error-message' : ''}`;
@@ -156,6 +215,7 @@ class ChatInterface {
         
         this.chatMessages.appendChild(messageDiv);
         this.scrollToBottom();
+        return messageParagraph;
     }
 
     setLoading(loading) {
@@ -199,6 +259,7 @@ class ChatInterface {
         
         // Create new session
         await this.initializeSession();
+        this.resetLogState();
         
         // Clear logs panel
         this.logsContent.innerHTML = `
@@ -229,6 +290,15 @@ class ChatInterface {
         }
     }
 
+    resetLogState() {
+        // Logs already shown for each source, plus the cursors that let a
+        // refresh ask the server only for entries added since.
+        this.logState = {
+            agent: { threadId: null, logs: [], runs: [], cursor: null, runCursor: null },
+            cosmos: { threadId: null, logs: [], cursor: null }
+        };
+    }
+
     async loadThreadLogs() {
         if (!this.sessionId) {
             this.showLogsError('No active session');
@@ -241,27 +311,60 @@ class ChatInterface {
             this.refreshLogsBtn.innerHTML = '<i class="fas fa-sync-alt fa-spin"></i> Loading...';
             
             const source = this.logSource.value;
-            const response = await fetch('/api/thread-logs', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    session_id: this.sessionId,
-                    source: source
-                })
-            });
+            const state = this.logState[source];
+            const querySince = state.cursor;
+            let continuation = null;
+            let data;
+
+            while (true) {
+                const response = await fetch('/api/thread-logs', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({
+                        session_id: this.sessionId,
+                        source: source,
+                        page_size: 100,
+                        // A Cosmos continuation token is tied to the query it
+                        // came from, so keep the original cursor while paging.
+                        since: continuation ? querySince : state.cursor,
+                        continuation: continuation,
+                        run_since: state.runCursor
+                    })
+                });
+
+                if (!response.ok) {
+                    const errorData = await response.json();
+                    this.showLogsError(errorData.error || 'Failed to load logs');
+                    return;
+                }
 
-            if (response.ok) {
-                const data = await response.json();
-                if (source === 'cosmos') {
-                    this.displayCosmosLogs(data);
-                } else {
-                    this.displayThreadLogs(data);
+                data = await response.json();
+                if (state.threadId && data.thread_id !== state.threadId) {
+                    // New thread for this session: start over.
+                    this.resetLogState();
+                    return this.loadThreadLogs();
                 }
+                state.threadId = data.thread_id;
+
+                this.mergeLogs(source, data);
+                continuation = data.continuation || null;
+                if (!continuation && !data.has_more) break;
+            }
+
+            const merged = {
+                thread_id: state.threadId,
+                logs: state.logs,
+                run_info: state.runs,
+                total_messages: source === 'cosmos'
+                    ? state.logs.filter(log => log.log_type === 'message').length
+                    : state.logs.length
+            };
+            if (source === 'cosmos') {
+                this.displayCosmosLogs(merged);
             } else {
-                const errorData = await response.json();
-                this.showLogsError(errorData.error || 'Failed to load logs');
+                this.displayThreadLogs(merged);
             }
         } catch (error) {
             console.error('Error loading thread logs:', error);
@@ -272,6 +375,32 @@ class ChatInterface {
         }
     }
 
+    mergeLogs(source, data) {
+        const state = this.logState[source];
+        const seen = new Set(state.logs.map(log => log.id));
+        (data.logs || []).forEach(log => {
+            if (!seen.has(log.id)) {
+                state.logs.push(log);
+            }
+        });
+        if (data.cursor) {
+            state.cursor = data.cursor;
+        }
+
+        if (source === 'agent') {
+            // Runs that were still in progress come back again; replace them.
+            (data.run_info || []).forEach(run => {
+                const index = state.runs.findIndex(existing => existing.id === run.id);
+                if (index === -1) {
+                    state.runs.push(run);
+                } else {
+                    state.runs[index] = run;
+                }
+            });
+            state.runCursor = data.run_cursor || state.runCursor;
+        }
+    }
+
     async toggleCosmosStats() {
         const isVisible = this.statsContent.style.display !== 'none';
         
@@ -292,7 +421,7 @@ class ChatInterface {
             const response = await fetch('/api/cosmos-stats');
             if (response.ok) {
                 const data = await response.json();
-                this.displayCosmosStats(data);
+                await this.displayCosmosStats(data);
             } else {
                 this.statsContent.innerHTML = '<div class="stats-error">Failed to load stats</div>';
             }
@@ -302,7 +431,7 @@ class ChatInterface {
         }
     }
 
-    displayCosmosStats(data) {
+    async displayCosmosStats(data) {
         if (!data.enabled) {
             this.statsContent.innerHTML = `
                 <div class="stats-disabled">
@@ -361,6 +490,47 @@ class ChatInterface {
                 </div>
             ` : ''}
         `;
+        await this.loadRunAnalytics();
+    }
+
+    async loadRunAnalytics() {
+        // Hourly rollups kept by run_analytics.py; nothing is shown until
+        // the processor has produced some.
+        try {
+            const response = await fetch('/api/run-analytics?hours=24');
+            if (!response.ok) {
+                return;
+            }
+            const data = await response.json();
+            if (!data.enabled || !data.models || data.models.length === 0) {
+                return;
+            }
+
+            const formatMs = (ms) => ms === null || ms === undefined ? 'n/a' : `${(ms / 1000).toFixed(1)}s`;
+            const modelsHtml = data.models.map(model => `
+                <div class="stat-row">
+                    <span class="stat-label">${model.model}:</span>
+                    <span class="stat-value">
+                        ${model.runs} runs, ${(model.failure_rate * 100).toFixed(1)}% failed,
+                        avg ${formatMs(model.avg_ms)}, p95 &le; ${formatMs(model.p95_ms)}
+                    </span>
+                </div>
+            `).join('');
+
+            const section = document.createElement('div');
+            section.className = 'log-types-section';
+            section.innerHTML = `
+                <h4>Runs (last 24h)</h4>
+                ${modelsHtml}
+                <div class="stat-row">
+                    <span class="stat-label">Messages:</span>
+                    <span class="stat-value">${data.messages.total}</span>
+                </div>
+            `;
+            this.statsContent.appendChild(section);
+        } catch (error) {
+            console.error('Error loading run analytics:', error);
+        }
     }
 
     displayCosmosLogs(data) {
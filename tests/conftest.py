@@ -0,0 +1,47 @@
+"""Shared fixtures: the in-memory Cosmos DB fakes of the load-test harness."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.fakes import FakeCosmosClient  # noqa: E402
+
+
+@pytest.fixture
+def cosmos():
+    """A fake Cosmos DB client without latency."""
+    return FakeCosmosClient(latency={"read": 0, "write": 0, "batch": 0, "query": 0}, seed=1)
+
+
+@pytest.fixture
+def database(cosmos):
+    return cosmos.create_database_if_not_exists("AgentLogsDB")
+
+
+@pytest.fixture
+def log_container(database):
+    from cosmos_provisioning import provision_log_container
+
+    return provision_log_container(database, "ThreadLogs")
+
+
+@pytest.fixture
+def summaries_container(database):
+    from cosmos_provisioning import provision_summaries_container
+
+    return provision_summaries_container(database, "ThreadSummaries")
+
+
+@pytest.fixture(scope="session")
+def chat_app():
+    """app.py wired to the fakes, as `(app module, fake project, fake cosmos)`.
+
+    The app module is imported once per test run, so tests share its state.
+    """
+    from benchmark.load_test import load_app, parse_args
+
+    return load_app(parse_args(["--run-latency", "0.02", "--api-latency", "0",
+                                "--cosmos-latency", "0", "--seed", "1"]))
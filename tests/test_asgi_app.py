@@ -0,0 +1,70 @@
+"""asgi_app.py end to end on the `aio` wrappers of the fakes."""
+
+import asyncio
+import json
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def asgi():
+    """asgi_app.py wired to the fakes, as `(app module, fake project, fake cosmos)`."""
+    from benchmark.load_test import load_asgi_app, parse_args
+
+    return load_asgi_app(parse_args(["--run-latency", "0.02", "--api-latency", "0",
+                                     "--cosmos-latency", "0", "--seed", "1"]))
+
+
+def serve(module, scenario):
+    """Run `scenario(client)` against the started app and return its result."""
+    async def run():
+        async with module.app.test_app() as test_app:
+            result = await scenario(test_app.test_client())
+            await module.log_writer.flush()
+            return result, await logs(test_app.test_client(), result["session_id"])
+    return asyncio.run(run())
+
+
+async def new_session(client):
+    return (await (await client.post("/api/new-session")).get_json())["session_id"]
+
+
+async def logs(client, session_id):
+    response = await client.post("/api/thread-logs", json={"session_id": session_id, "source": "cosmos"})
+    return [log["log_type"] for log in json.loads(await response.get_data(as_text=True))["logs"]]
+
+
+def sse_events(body):
+    return [(frame.split("\n")[0][len("event: "):], json.loads(frame.split("\n")[1][len("data: "):]))
+            for frame in body.strip().split("\n\n")]
+
+
+def test_chat_answers_and_logs_the_turn(asgi):
+    module, project, _ = asgi
+
+    async def chat(client):
+        session_id = await new_session(client)
+        response = await client.post("/api/chat", json={"message": "Taxi?", "session_id": session_id})
+        return await response.get_json()
+
+    payload, log_types = serve(module, chat)
+
+    assert payload["response"] == project.agents.answer
+    assert sorted(log_types) == ["message", "message", "run", "thread_created"]
+
+
+def test_stream_sends_deltas_then_done(asgi):
+    module, project, _ = asgi
+
+    async def stream(client):
+        session_id = await new_session(client)
+        response = await client.post("/api/chat/stream", json={"message": "Hotel?", "session_id": session_id})
+        return {"session_id": session_id, "events": sse_events(await response.get_data(as_text=True))}
+
+    result, log_types = serve(module, stream)
+    events = result["events"]
+
+    assert events[0][0] == "start" and events[-1][0] == "done"
+    assert "".join(data["text"] for event, data in events if event == "delta") == project.agents.answer
+    assert events[-1][1]["response"] == project.agents.answer
+    assert sorted(log_types) == ["message", "message", "run", "thread_created"]
@@ -0,0 +1,27 @@
+"""Change feed pages and leases (change_feed.py) against the fake container."""
+
+import time
+
+import pytest
+
+from agent_logs import log_document
+from change_feed import ChangeFeedPages, LeaseStore
+
+
+def test_pages_stop_past_the_end_time(log_container):
+    for index in range(6):
+        log_container.upsert_item(body=log_document("thread_1", "message", {"message_id": f"msg_{index}"}))
+    range_id = log_container._feed_range(("thread_1",))
+
+    unbounded = ChangeFeedPages(log_container, range_id, None, None, page_size=2)
+    bounded = ChangeFeedPages(log_container, range_id, None, None, page_size=2, end_time=time.time() - 60)
+
+    assert sum(len(page) for page in unbounded) == 6
+    assert [len(page) for page in bounded] == [2]
+
+
+def test_lease_owner_must_not_need_quoting(summaries_container):
+    assert LeaseStore(summaries_container, "export", "leases", owner="worker-1.example:42").owner
+
+    with pytest.raises(ValueError):
+        LeaseStore(summaries_container, "export", "leases", owner="x' OR '1' = '1")
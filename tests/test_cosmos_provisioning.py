@@ -0,0 +1,38 @@
+"""Indexing policies and retention of provisioned containers (cosmos_provisioning.py)."""
+
+from azure.cosmos import PartitionKey
+
+from cosmos_provisioning import LOG_INDEXING_POLICY, provision_log_container, retention_ttl
+
+
+def test_existing_container_gets_the_policy_and_ttl_once(database, monkeypatch):
+    monkeypatch.setenv("COSMOS_LOG_RETENTION_DAYS", "30")
+    database.create_container_if_not_exists(id="ThreadLogs", partition_key=PartitionKey(path="/thread_id"))
+    replaced = []
+    replace_container = database.replace_container
+
+    def recording_replace(container, **kwargs):
+        replaced.append(container.id)
+        return replace_container(container, **kwargs)
+
+    monkeypatch.setattr(database, "replace_container", recording_replace)
+    container = provision_log_container(database, "ThreadLogs", apply_to_existing=True)
+    provision_log_container(database, "ThreadLogs", apply_to_existing=True)
+
+    assert replaced == ["ThreadLogs"]
+    assert container.read() == {"indexingPolicy": LOG_INDEXING_POLICY, "defaultTtl": 30 * 86400}
+
+
+def test_existing_container_is_left_alone_by_default(database):
+    database.create_container_if_not_exists(id="ThreadLogs", partition_key=PartitionKey(path="/thread_id"))
+
+    container = provision_log_container(database, "ThreadLogs")
+
+    assert container.read()["indexingPolicy"] == {}
+
+
+def test_retention_is_off_unless_configured(monkeypatch):
+    monkeypatch.delenv("COSMOS_LOG_RETENTION_DAYS", raising=False)
+    assert retention_ttl() is None
+    monkeypatch.setenv("COSMOS_LOG_RETENTION_DAYS", "0.5")
+    assert retention_ttl() == 43200
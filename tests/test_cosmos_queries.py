@@ -0,0 +1,32 @@
+"""The parameterized query registry (cosmos_queries.py) against the fake container."""
+
+import re
+
+import pytest
+
+from cosmos_queries import PARTITION, QUERIES, QueryRepository
+
+
+def test_parameters_must_match_the_statement(log_container):
+    repository = QueryRepository()
+
+    with pytest.raises(ValueError, match="@thread_id"):
+        repository.first(log_container, "thread_logs", partition_key="thread_1")
+    with pytest.raises(ValueError, match="@extra"):
+        repository.first(log_container, "thread_logs", {"@thread_id": "thread_1", "@extra": 1},
+                         partition_key="thread_1")
+    assert repository.first(log_container, "thread_logs", {"@thread_id": "thread_1"},
+                            partition_key="thread_1") is None
+
+
+def test_partition_queries_need_a_partition_key(log_container, cosmos):
+    with pytest.raises(ValueError, match="partition key"):
+        QueryRepository().first(log_container, "thread_logs", {"@thread_id": "thread_1"})
+    assert not any(operation.startswith("query") for operation in cosmos.snapshot()["operations"])
+
+
+def test_registered_statements_are_parameterized():
+    for query in QUERIES.values():
+        # Values only ever arrive as parameters, never spliced into the text.
+        assert not re.search(r"=\s*'", query.text), query.name
+    assert all(query.scope == PARTITION for name, query in QUERIES.items() if name.startswith("thread_logs"))
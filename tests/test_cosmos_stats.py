@@ -0,0 +1,136 @@
+"""Flushing and reconciling the log stats counters (cosmos_stats.py)."""
+
+import threading
+import time
+
+import pytest
+from azure.cosmos import exceptions
+
+from agent_logs import log_document
+from cosmos_stats import STATS_DOCUMENT_ID, STATS_PARTITION, CosmosStats
+
+
+@pytest.fixture
+def stats(summaries_container, log_container):
+    stats = CosmosStats(summaries_container, log_container, flush_interval=60, cache_ttl=0)
+    yield stats
+    stats.close()
+
+
+def logs(*log_types):
+    return [log_document(f"thread_{index}", log_type, {}) for index, log_type in enumerate(log_types)]
+
+
+def stored(container):
+    return container.read_item(item=STATS_DOCUMENT_ID, partition_key=STATS_PARTITION)
+
+
+def test_partly_failed_flush_only_retries_unapplied_chunks(stats, summaries_container, monkeypatch):
+    stats.reconcile()
+    # Twelve log types plus the totals need two patch requests.
+    stats.record(logs(*[f"type_{index:02d}" for index in range(12)], "thread_created"))
+
+    patch_item = summaries_container.patch_item
+    calls = []
+
+    def flaky_patch(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise exceptions.CosmosHttpResponseError(status_code=503, message="unavailable")
+        return patch_item(**kwargs)
+
+    monkeypatch.setattr(summaries_container, "patch_item", flaky_patch)
+    stats.flush()
+    stats.flush()
+
+    document = stored(summaries_container)
+    assert document["total_logs"] == 13
+    assert document["total_threads"] == 1
+    assert document["log_types"] == {**{f"type_{index:02d}": 1 for index in range(12)}, "thread_created": 1}
+    assert stats.get()["total_logs"] == 13
+
+
+def test_missing_document_is_recounted_in_the_background(stats, summaries_container, log_container,
+                                                         monkeypatch):
+    for document in logs("thread_created", "message", "message"):
+        log_container.upsert_item(body=document)
+    stats.record(logs("message"))
+    release = threading.Event()
+    reconcile = stats.reconcile
+
+    def slow_reconcile():
+        release.wait(5)
+        return reconcile()
+
+    monkeypatch.setattr(stats, "reconcile", slow_reconcile)
+
+    # The first call answers from the pending deltas without blocking.
+    assert stats.get()["total_logs"] == 1
+    release.set()
+    for _ in range(100):
+        if stats._cached is not None:
+            break
+        time.sleep(0.01)
+
+    assert stored(summaries_container)["total_logs"] == 3
+    assert stats.get()["total_logs"] == 3
+    assert stats.get()["total_threads"] == 3
+
+
+def test_flush_survives_a_failed_reconcile(stats, log_container, monkeypatch):
+    def failing_query(**kwargs):
+        raise exceptions.CosmosHttpResponseError(status_code=503, message="unavailable")
+
+    monkeypatch.setattr(log_container, "query_items", failing_query)
+    stats.record(logs("message"))
+    # No stats document yet, so the flush recounts, and that fails too.
+    stats.flush()
+
+
+def test_stale_counters_are_recounted_when_due(summaries_container, log_container):
+    stats = CosmosStats(summaries_container, log_container, flush_interval=60, reconcile_interval=3600)
+    try:
+        stats.reconcile()
+        # Logs expired by the retention TTL leave the counters too high.
+        summaries_container.patch_item(item=STATS_DOCUMENT_ID, partition_key=STATS_PARTITION, patch_operations=[
+            {"op": "incr", "path": "/total_logs", "value": 5},
+            {"op": "set", "path": "/reconciled_at", "value": time.time() - 7200}])
+        stats._reconcile_if_due()
+    finally:
+        stats.close()
+
+    document = stored(summaries_container)
+    assert document["total_logs"] == 0
+    assert document["ttl"] == -1
+
+
+def test_concurrent_flushes_without_a_document_recount_once(stats, summaries_container, log_container,
+                                                            monkeypatch):
+    log_container.upsert_item(body=logs("thread_created")[0])
+    release = threading.Event()
+    recounts = []
+    reconcile = stats.reconcile
+
+    def slow_reconcile():
+        recounts.append(threading.current_thread().name)
+        release.wait(5)
+        return reconcile()
+
+    monkeypatch.setattr(stats, "reconcile", slow_reconcile)
+    flushes = []
+    for _ in range(4):
+        stats.record(logs("message"))
+        flushes.append(threading.Thread(target=stats.flush))
+        flushes[-1].start()
+    for flush in flushes:
+        flush.join(5)
+
+    # The flushes return at once, leaving the recount to one background thread.
+    for _ in range(100):
+        if recounts:
+            break
+        time.sleep(0.01)
+    assert recounts == ["cosmos-stats-reconcile"]
+    release.set()
+    stats._reconcile_thread.join(5)
+    assert stored(summaries_container)["total_logs"] == 1
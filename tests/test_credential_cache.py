@@ -0,0 +1,91 @@
+"""Token cache with proactive refresh (credential_cache.py)."""
+
+import time
+
+from azure.core.credentials import AccessToken
+
+from credential_cache import CachingCredential
+
+SCOPE = "https://ai.azure.com/.default"
+
+
+class FakeCredential:
+    """Hands out numbered tokens that expire `lifetime` seconds from now."""
+
+    def __init__(self, lifetime=3600):
+        self.lifetime = lifetime
+        self.calls = []
+
+    def get_token(self, *scopes, claims=None, tenant_id=None, **kwargs):
+        self.calls.append((scopes, claims))
+        return AccessToken(f"token-{len(self.calls)}", int(time.time() + self.lifetime))
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_cached_token_is_served_without_a_second_fetch():
+    credential = FakeCredential()
+    cache = CachingCredential(credential)
+    try:
+        first = cache.get_token(SCOPE)
+        assert cache.get_token(SCOPE) == first
+        assert cache.get_token("https://cosmos.azure.com/.default") != first
+    finally:
+        cache.close()
+
+    assert len(credential.calls) == 2
+    stats = cache.snapshot()
+    assert (stats["memory_hits"], stats["blocking_acquisitions"]) == (1, 2)
+
+
+def test_token_near_expiry_is_refreshed_in_the_background():
+    # Every token is inside the refresh margin, so each check renews it.
+    credential = FakeCredential(lifetime=300)
+    cache = CachingCredential(credential, refresh_margin=600, check_interval=0.01)
+    try:
+        first = cache.get_token(SCOPE)
+        assert wait_for(lambda: cache.snapshot()["background_refreshes"] >= 1)
+        refreshed = cache.get_token(SCOPE)
+    finally:
+        cache.close()
+
+    assert refreshed.token != first.token
+    assert cache.snapshot()["blocking_acquisitions"] == 1
+
+
+def test_claims_challenge_bypasses_the_cache():
+    credential = FakeCredential()
+    cache = CachingCredential(credential)
+    try:
+        cache.get_token(SCOPE)
+        challenged = cache.get_token(SCOPE, claims='{"access_token": {}}')
+        assert cache.get_token(SCOPE).token == "token-1"
+    finally:
+        cache.close()
+
+    assert challenged.token == "token-2"
+    assert credential.calls[1] == ((SCOPE,), '{"access_token": {}}')
+
+
+def test_workers_share_tokens_through_the_encrypted_file(tmp_path):
+    from cryptography.fernet import Fernet
+
+    key = Fernet.generate_key()
+    path = str(tmp_path / "tokens.bin")
+    credential = FakeCredential()
+    workers = [CachingCredential(credential, cache_file=path, cache_key=key) for _ in range(2)]
+    try:
+        tokens = [worker.get_token(SCOPE) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.close()
+
+    assert tokens[0] == tokens[1]
+    assert len(credential.calls) == 1
+    assert workers[1].snapshot()["file_hits"] == 1
+    assert b"token-1" not in (tmp_path / "tokens.bin").read_bytes()
@@ -0,0 +1,72 @@
+"""Compact storage format of log documents (log_format.py)."""
+
+from agent_logs import log_document
+from log_format import decode, encode, log_key, migrate
+
+
+def message_log(text, message_id="msg_1", thread_id="thread_1"):
+    document = log_document(thread_id, "message", {
+        "message_id": message_id, "role": "assistant",
+        "content": [{"type": "text", "text": text}],
+        "created_at": "2025-01-31T14:03:05.000000"})
+    document["timestamp"] = "2025-01-31T14:03:07.123000"
+    return document
+
+
+def run_log(status="completed"):
+    document = log_document("thread_1", "run", {
+        "run_id": "run_1", "status": status, "model": "gpt-4o", "last_error": None,
+        "created_at": "2025-01-31T14:03:05.000000", "completed_at": "2025-01-31T14:03:09.500000"})
+    document["timestamp"] = "2025-01-31T14:03:10.000000"
+    return document
+
+
+def without_id(document):
+    """The log fields but the id, which the compact format replaces."""
+    return {key: value for key, value in document.items() if key != "id" and not key.startswith("_")}
+
+
+def test_compact_round_trip():
+    for document in (message_log("Yes."), run_log("failed")):
+        compact = encode(document)
+        assert "data" not in compact and compact["id"] in ("msg_1", "run_1")
+        assert without_id(decode(compact)) == without_id(document)
+
+
+def test_large_content_is_compressed_and_restored():
+    document = message_log("Per diem rates apply. " * 200)
+    compact = encode(document, threshold=1024)
+
+    assert "cz" in compact["d"] and "c" not in compact["d"]
+    assert len(compact["d"]["cz"]) < len(document["data"]["content"][0]["text"])
+    assert decode(compact)["data"]["content"] == document["data"]["content"]
+    assert "c" in encode(document, threshold=10 ** 6)["d"]
+
+
+def test_full_document_and_its_compact_copy_share_a_log_key():
+    document = message_log("Yes.")
+    assert log_key(document) == log_key(encode(document)) == "msg_1"
+
+    # Logs without a message or run ID are keyed by a hash of their payload.
+    created = log_document("thread_1", "thread_created", {"session_id": "s1"})
+    assert log_key(created) == log_key(encode(created)) == encode(created)["id"]
+    assert log_key(created) != log_key(log_document("thread_1", "thread_created", {"session_id": "s2"}))
+
+
+def test_migration_rewrites_full_documents_in_place(log_container):
+    # A retried full-format write left the same message twice, under two UUIDs.
+    duplicates = [message_log("Yes."), message_log("Yes.")]
+    logs = duplicates + [message_log("No.", message_id="msg_2"), run_log()]
+    for document in logs:
+        log_container.upsert_item(body=document)
+    compact = encode(message_log("Already compact.", message_id="msg_3"))
+    log_container.upsert_item(body=compact)
+
+    assert migrate(log_container) == 4
+    assert migrate(log_container) == 0
+
+    stored = list(log_container.read_all_items())
+    assert sorted(document["id"] for document in stored) == ["msg_1", "msg_2", "msg_3", "run_1"]
+    assert all(document["v"] == compact["v"] for document in stored)
+    by_id = {document["id"]: decode(document) for document in stored}
+    assert without_id(by_id["msg_1"]) == without_id(duplicates[0])
@@ -0,0 +1,36 @@
+"""Wiring of the log writers and what they feed (log_pipeline.py)."""
+
+from agent_logs import log_document
+from cosmos_stats import STATS_DOCUMENT_ID, STATS_PARTITION
+from log_pipeline import LogPipeline, provision_log_containers
+from thread_summaries import summary_partition
+
+
+def test_written_logs_reach_every_listener(database, monkeypatch):
+    monkeypatch.setenv("COSMOS_BY_DAY_ENABLED", "true")
+    container, summaries_container, by_day_container = provision_log_containers(database)
+    pipeline = LogPipeline(container, summaries_container, by_day_container)
+
+    pipeline.writer.submit(log_document("thread_1", "message", {"role": "user"}))
+    pipeline.close()
+
+    assert len(list(container.read_all_items())) == 1
+    assert len(list(by_day_container.read_all_items())) == 1
+    assert summaries_container.read_item(item="thread_1", partition_key=summary_partition("thread_1"))
+    stats = summaries_container.read_item(item=STATS_DOCUMENT_ID, partition_key=STATS_PARTITION)
+    assert stats["total_logs"] == 1
+
+
+def test_by_day_writer_honours_the_writer_settings(database, monkeypatch):
+    monkeypatch.setenv("COSMOS_BY_DAY_ENABLED", "true")
+    monkeypatch.setenv("COSMOS_LOG_WRITER_QUEUE_SIZE", "20")
+    monkeypatch.setenv("COSMOS_LOG_WRITER_FLUSH_SIZE", "7")
+    monkeypatch.setenv("COSMOS_LOG_WRITER_FLUSH_INTERVAL", "0.1")
+    pipeline = LogPipeline(*provision_log_containers(database), background=False)
+    try:
+        assert pipeline.writer is None
+        assert pipeline.by_day_writer._queue.maxsize == 20
+        assert pipeline.by_day_writer.flush_size == 7
+        assert pipeline.by_day_writer.flush_interval == 0.1
+    finally:
+        pipeline.close()
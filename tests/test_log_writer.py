@@ -0,0 +1,126 @@
+"""Failure paths of the background log writer (log_writer.py)."""
+
+import asyncio
+import threading
+import time
+
+from azure.cosmos import exceptions
+
+from agent_logs import log_document
+from benchmark.fakes import AsyncFakeCosmosClient
+from log_writer import AsyncCosmosLogWriter, CosmosLogWriter
+
+
+def documents(count, thread_id="thread_1"):
+    return [log_document(thread_id, "message", {"message_id": f"msg_{index}"}) for index in range(count)]
+
+
+def stored_ids(container):
+    return {document["id"] for document in container.read_all_items()}
+
+
+def test_failed_batch_falls_back_to_item_upserts(log_container, monkeypatch):
+    def failing_batch(batch_operations, partition_key, **kwargs):
+        raise exceptions.CosmosBatchOperationError(
+            error_index=0, headers={}, status_code=409, message="conflict", operation_responses=[])
+
+    monkeypatch.setattr(log_container, "execute_item_batch", failing_batch)
+    written = []
+    writer = CosmosLogWriter(log_container, flush_size=10, flush_interval=0.01, worker_count=1)
+    writer.add_listener(written.extend)
+    batch = documents(5)
+    for document in batch:
+        writer.submit(document)
+    writer.close()
+
+    assert stored_ids(log_container) == {document["id"] for document in batch}
+    assert len(written) == 5
+    assert writer.snapshot()["written"] == 5
+
+
+def test_worker_survives_unexpected_errors(log_container, monkeypatch):
+    calls = []
+
+    def broken_once(batch_operations, partition_key, **kwargs):
+        calls.append(partition_key)
+        if len(calls) == 1:
+            raise RuntimeError("connection reset")
+        return original(batch_operations=batch_operations, partition_key=partition_key, **kwargs)
+
+    original = log_container.execute_item_batch
+    monkeypatch.setattr(log_container, "execute_item_batch", broken_once)
+    writer = CosmosLogWriter(log_container, flush_size=3, flush_interval=0.01, worker_count=1)
+    first, second = documents(3, "thread_1"), documents(3, "thread_2")
+    for document in first:
+        writer.submit(document)
+    writer.flush()
+    for document in second:
+        writer.submit(document)
+    writer.close()
+
+    # The worker kept going after the failed flush.
+    assert {document["id"] for document in second} <= stored_ids(log_container)
+
+
+def test_failed_item_upserts_are_counted(log_container, monkeypatch):
+    def failing_upsert(body, **kwargs):
+        raise exceptions.CosmosHttpResponseError(status_code=503, message="unavailable")
+
+    monkeypatch.setattr(log_container, "upsert_item", failing_upsert)
+    writer = CosmosLogWriter(log_container, flush_size=1, flush_interval=0.01, worker_count=1)
+    writer.submit(documents(1)[0])
+    writer.close()
+
+    assert writer.snapshot()["failed"] == 1
+    assert stored_ids(log_container) == set()
+
+
+def test_closed_writer_writes_inline(log_container):
+    writer = CosmosLogWriter(log_container, worker_count=1)
+    writer.close()
+    document = documents(1)[0]
+
+    assert writer.submit(document)
+    assert writer.snapshot()["inline_writes"] == 1
+    assert stored_ids(log_container) == {document["id"]}
+
+
+def test_close_waits_for_a_submit_in_progress(log_container, monkeypatch):
+    writer = CosmosLogWriter(log_container, worker_count=1)
+    put = writer._queue.put
+    closer = threading.Thread(target=writer.close)
+
+    def slow_put(item, **kwargs):
+        # `close()` starts after this submit passed its `_closed` check.
+        if isinstance(item, dict) and not closer.is_alive():
+            closer.start()
+            time.sleep(0.05)
+        return put(item, **kwargs)
+
+    monkeypatch.setattr(writer._queue, "put", slow_put)
+    document = documents(1)[0]
+    assert writer.submit(document)
+    closer.join(5)
+
+    assert stored_ids(log_container) == {document["id"]}
+
+
+def test_async_writer_holds_callers_past_max_pending(log_container):
+    log_container.client.latency["write"] = 0.05
+    container = AsyncFakeCosmosClient(log_container.client).get_database_client(
+        "AgentLogsDB").get_container_client("ThreadLogs")
+
+    async def scenario():
+        writer = AsyncCosmosLogWriter(container, max_pending=2)
+        for document in documents(2):
+            writer.submit(document)
+        await writer.wait_for_room()
+        room_after = writer.snapshot()["queue_depth"]
+        await writer.close()
+        return room_after, writer.snapshot()
+
+    room_after, stats = asyncio.run(scenario())
+
+    assert room_after < 2
+    assert stats["backpressure_waits"] == 1
+    assert stats["written"] == 2
@@ -0,0 +1,28 @@
+"""Date-range queries over the by-day log copy (logs_by_day.py)."""
+
+import pytest
+
+from agent_logs import log_document
+from logs_by_day import MAX_RANGE_DAYS, DailyLogs, days_between, provision_by_day_container, to_day_document
+
+
+def test_daily_counts_cover_every_day_in_order(database):
+    container = provision_by_day_container(database, "ThreadLogsByDay")
+    for day, log_type in [("2025-01-01", "message"), ("2025-01-01", "run"), ("2025-01-03", "message")]:
+        document = log_document("thread_1", log_type, {})
+        document["timestamp"] = f"{day}T12:00:00"
+        container.upsert_item(body=to_day_document(document))
+    daily_logs = DailyLogs(container, query_workers=3)
+
+    activity = daily_logs.daily_counts("2025-01-01", "2025-01-04")
+    daily_logs.close()
+
+    assert [day["day"] for day in activity] == ["2025-01-01", "2025-01-02", "2025-01-03", "2025-01-04"]
+    assert [day["total"] for day in activity] == [2, 0, 1, 0]
+    assert activity[0]["log_types"] == {"message": 1, "run": 1}
+
+
+def test_range_is_capped():
+    with pytest.raises(ValueError):
+        days_between("2024-01-01", "2025-12-31")
+    assert len(days_between("2025-01-01", "2025-12-31")) < MAX_RANGE_DAYS
@@ -0,0 +1,74 @@
+"""Continuation tokens and cursors of thread-log reads, against the fakes."""
+
+from agent_logs import log_document
+from cosmos_queries import QueryRepository
+
+
+def test_query_pages_resume_from_their_continuation(log_container):
+    for index in range(7):
+        document = log_document("thread_1", "message", {"message_id": f"msg_{index}"})
+        document["timestamp"] = f"2025-01-01T10:00:0{index}"
+        log_container.upsert_item(body=document)
+    repository = QueryRepository()
+
+    pages, continuation = [], None
+    while True:
+        page, continuation = repository.page(log_container, "thread_logs", {"@thread_id": "thread_1"},
+                                             partition_key="thread_1", page_size=3,
+                                             continuation=continuation)
+        pages.append([item["data"]["message_id"] for item in page])
+        if not continuation:
+            break
+
+    assert pages == [["msg_0", "msg_1", "msg_2"], ["msg_3", "msg_4", "msg_5"], ["msg_6"]]
+    assert repository.snapshot()["thread_logs"]["pages"] == 3
+
+
+def chatted_session(client, turns):
+    session_id = client.post("/api/new-session").get_json()["session_id"]
+    for turn in range(turns):
+        client.post("/api/chat", json={"message": f"Question {turn}?", "session_id": session_id})
+    return session_id
+
+
+def test_cosmos_log_pages_cover_the_thread_once(chat_app):
+    app, _, _ = chat_app
+    client = app.app.test_client()
+    session_id = chatted_session(client, 2)
+    app.log_writer.flush()
+
+    everything = client.post("/api/thread-logs", json={"session_id": session_id, "source": "cosmos"}).get_json()
+    paged, continuation = [], None
+    while True:
+        response = client.post("/api/thread-logs", json={
+            "session_id": session_id, "source": "cosmos", "page_size": 2,
+            "continuation": continuation}).get_json()
+        paged.extend(log["id"] for log in response["logs"])
+        continuation = response["continuation"]
+        if not continuation:
+            break
+
+    assert paged == [log["id"] for log in everything["logs"]]
+    assert len(paged) > 2
+    assert response["cursor"] == max(log["timestamp"] for log in everything["logs"])
+
+
+def test_agent_cursors_page_through_messages(chat_app):
+    app, _, _ = chat_app
+    client = app.app.test_client()
+    session_id = chatted_session(client, 2)
+
+    everything = client.post("/api/thread-logs", json={"session_id": session_id}).get_json()
+    paged, runs, cursor, run_cursor = [], [], None, None
+    for _ in range(10):
+        response = client.post("/api/thread-logs", json={
+            "session_id": session_id, "page_size": 1, "since": cursor, "run_since": run_cursor}).get_json()
+        paged.extend(log["id"] for log in response["logs"])
+        runs.extend(run["id"] for run in response["run_info"])
+        cursor, run_cursor = response["cursor"], response["run_cursor"]
+        if not response["has_more"]:
+            break
+
+    assert paged == [log["id"] for log in everything["logs"]]
+    assert runs == [run["id"] for run in everything["run_info"]]
+    assert len(paged) == 4 and len(runs) == 2
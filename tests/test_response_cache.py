@@ -0,0 +1,46 @@
+"""The first-turn answer cache (response_cache.py)."""
+
+from benchmark.fakes import FakeProjectClient
+from response_cache import ResponseCache, agent_fingerprint, normalize_prompt
+
+
+def test_normalized_repeat_is_a_hit():
+    cache = ResponseCache()
+    cache.store("asst_1", "v1", "What's the max for meals?", "$75 per day.")
+
+    assert cache.lookup("asst_1", "v1", "  what's the MAX for meals ") == "$75 per day."
+    assert cache.lookup("asst_1", "v1", "What about taxis?") is None
+    assert cache.lookup("asst_2", "v1", "What's the max for meals?") is None
+    assert (cache.snapshot()["hits"], cache.snapshot()["misses"]) == (1, 2)
+    assert normalize_prompt("Ｍeals？") == "meals"
+
+
+def test_expired_and_evicted_entries_miss():
+    cache = ResponseCache(max_entries=1, ttl=0)
+    cache.store("asst_1", "v1", "Meals?", "$75.")
+    assert cache.lookup("asst_1", "v1", "Meals?") is None
+
+    cache = ResponseCache(max_entries=1)
+    cache.store("asst_1", "v1", "Meals?", "$75.")
+    cache.store("asst_1", "v1", "Taxis?", "Yes.")
+    assert cache.lookup("asst_1", "v1", "Meals?") is None
+    assert cache.lookup("asst_1", "v1", "Taxis?") == "Yes."
+
+
+def test_new_agent_version_drops_older_answers():
+    agent = FakeProjectClient(api_latency=0).agents.get_agent("asst_1")
+    version = agent_fingerprint(agent)
+    cache = ResponseCache()
+    cache.set_agent_version("asst_1", version)
+    cache.store("asst_1", version, "Meals?", "$75.")
+
+    agent.instructions = "Answer in French."
+    edited = agent_fingerprint(agent)
+    assert edited != version
+    cache.set_agent_version("asst_1", edited)
+
+    assert cache.snapshot()["entries"] == 0
+    assert cache.snapshot()["invalidations"] == 1
+    # An answer from a run on the old definition that finishes late is not kept.
+    cache.store("asst_1", version, "Meals?", "$75.")
+    assert cache.lookup("asst_1", version, "Meals?") is None
@@ -0,0 +1,179 @@
+"""The batch runner of run_agent.py against the fake Agents client."""
+
+import json
+import time
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+
+from benchmark.fakes import FakeProjectClient
+from run_agent import BatchRunner, RateLimiter, completed_ids, load_prompts, suggested_wait
+
+RATE_LIMITED = {"code": "rate_limit_exceeded", "message": "Rate limit is exceeded. Try again in 0 seconds."}
+
+
+class _Response:
+    reason = "Too Many Requests"
+
+    def __init__(self, headers):
+        self.status_code = 429
+        self.headers = headers
+
+    def text(self):
+        return ""
+
+
+def throttled(headers=None, message="Rate limit is exceeded."):
+    return HttpResponseError(message=message, response=_Response(headers or {}))
+
+
+@pytest.fixture
+def project():
+    return FakeProjectClient(run_latency=0, api_latency=0, seed=1)
+
+
+def runner(project, **kwargs):
+    return BatchRunner(project, "asst_1", poll_interval=0, backoff_base=0, **kwargs)
+
+
+def rate_limit_runs(project, count):
+    """Make the next `count` runs fail with `rate_limit_exceeded`."""
+    finish_run = project.agents.finish_run
+    left = [count]
+
+    def finish(run):
+        if left[0] > 0:
+            left[0] -= 1
+            run.status = "failed"
+            run.last_error = RATE_LIMITED
+            return run
+        return finish_run(run)
+
+    project.agents.finish_run = finish
+
+
+def test_prompt_files_take_turns_or_a_prompt_field(tmp_path):
+    path = tmp_path / "prompts.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"id": "a", "turns": ["Meals?", "And taxis?"]}),
+        "",
+        json.dumps({"request_id": "b", "question": "Hotels?"}),
+        json.dumps({"body": "Flights?"}),
+    ]), encoding="utf-8")
+
+    assert load_prompts(str(path)) == [
+        {"id": "a", "turns": ["Meals?", "And taxis?"]},
+        {"id": "b", "turns": ["Hotels?"]},
+        {"id": "4", "turns": ["Flights?"]},
+    ]
+    with pytest.raises(ValueError, match="prompts.jsonl:1: no prompt text"):
+        load_prompts(str(path), "question")
+
+
+def test_completed_ids_follow_the_last_result_of_each_prompt(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"id": "a", "status": "completed"}),
+        json.dumps({"id": "b", "status": "completed"}),
+        json.dumps({"id": "b", "status": "failed"}),
+        json.dumps({"id": "c", "status": "failed"}),
+        '{"id": "d", "stat',
+    ]), encoding="utf-8")
+
+    assert completed_ids(str(path)) == {"a"}
+    assert completed_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_resume_skips_completed_prompts_and_retries_failed_ones(project, tmp_path):
+    results = tmp_path / "results.jsonl"
+    results.write_text(json.dumps({"id": "a", "status": "completed"}) + "\n"
+                       + json.dumps({"id": "b", "status": "failed"}) + "\n", encoding="utf-8")
+    prompts = [{"id": prompt_id, "turns": ["Meals?"]} for prompt_id in ("a", "b", "c")]
+
+    report = runner(project, results_path=str(results)).run(prompts)
+
+    assert (report["skipped"], report["completed"], report["failed"]) == (1, 2, 0)
+    assert project.agents.stats["threads.create"] == 2
+    assert completed_ids(str(results)) == {"a", "b", "c"}
+
+
+def test_rate_limited_run_is_retried_on_the_same_thread(project):
+    rate_limit_runs(project, 2)
+    result = runner(project).run_conversation({"id": "a", "turns": ["Meals?"]})
+
+    assert result["status"] == "completed"
+    assert result["turns"][0]["attempts"] == 3
+    assert len(project.agents.thread_runs[result["thread_id"]]) == 3
+
+
+def test_rate_limited_run_gives_up_after_max_retries(project):
+    rate_limit_runs(project, 10)
+    batch = runner(project, max_retries=2)
+    result = batch.run_conversation({"id": "a", "turns": ["Meals?", "And taxis?"]})
+
+    assert result["status"] == "failed"
+    assert len(result["turns"]) == 1 and result["turns"][0]["attempts"] == 3
+    assert "rate_limit_exceeded" in result["error"]
+    assert batch.stats["retries"] == 2
+
+
+def test_throttled_poll_does_not_start_another_run(project, monkeypatch):
+    get = project.agents.runs.get
+    polls = []
+
+    def flaky_get(**kwargs):
+        polls.append(kwargs["run_id"])
+        if len(polls) == 1:
+            raise throttled({"retry-after-ms": "0"})
+        return get(**kwargs)
+
+    monkeypatch.setattr(project.agents.runs, "get", flaky_get)
+    batch = runner(project)
+    result = batch.run_conversation({"id": "a", "turns": ["Meals?"]})
+
+    assert result["status"] == "completed"
+    assert project.agents.stats["runs.create"] == 1
+    assert len(set(polls)) == 1
+    assert batch.stats["throttled"] == 1
+
+
+def test_suggested_wait_reads_headers_then_the_message():
+    assert suggested_wait(throttled({"retry-after-ms": "1500"})) == 1.5
+    assert suggested_wait(throttled({"x-ms-retry-after-ms": "250"})) == 0.25
+    assert suggested_wait(throttled({"retry-after": "7"})) == 7.0
+    assert suggested_wait(throttled({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"},
+                                    "Try again in 20 seconds.")) == 20.0
+    # A rate-limited run's `last_error`.
+    assert suggested_wait(dict(RATE_LIMITED, message="Try again in 3 seconds.")) == 3.0
+    assert suggested_wait("Rate limit is exceeded. Try again in 2.5 seconds.") == 2.5
+    assert suggested_wait(throttled()) is None
+
+
+def test_rate_limiter_spaces_calls_and_pauses():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+    limiter = RateLimiter()
+    limiter.pause(0.05)
+    start = time.monotonic()
+    limiter.acquire()
+    limiter.acquire()
+    assert 0.04 <= time.monotonic() - start < 0.5
+
+
+def test_report_gives_nearest_rank_percentiles(project):
+    batch = runner(project)
+    batch.results = [
+        {"status": "completed", "latency_ms": float(index),
+         "turns": [{"status": "completed", "latency_ms": float(index)}]}
+        for index in range(1, 21)
+    ] + [{"status": "failed", "latency_ms": 999.0, "turns": [{"status": "failed", "latency_ms": 999.0}]}]
+
+    report = batch.report(elapsed=2.0)
+
+    assert report["turn_latency_ms"] == {"p50": 10.0, "p95": 19.0, "p99": 20.0}
+    assert report["conversation_latency_ms"] == {"p50": 10.0, "p95": 19.0, "p99": 20.0}
+    assert (report["conversations_per_s"], report["turns_per_s"]) == (10.5, 10.5)
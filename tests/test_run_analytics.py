@@ -0,0 +1,100 @@
+"""Hourly rollups from the change feed (run_analytics.py) against the fake containers."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from agent_logs import log_document
+from log_format import migrate
+from run_analytics import RunAnalytics, read_rollups, summarize_rollups
+
+
+def run_log(thread_id, run_id, status="completed"):
+    return log_document(thread_id, "run", {
+        "run_id": run_id, "status": status, "model": "gpt-4o",
+        "created_at": "2025-01-01T10:00:00", "completed_at": "2025-01-01T10:00:01"})
+
+
+def message_log(thread_id, message_id):
+    return log_document(thread_id, "message", {
+        "message_id": message_id, "role": "assistant", "content": [{"type": "text", "text": "Yes."}]})
+
+
+def totals(summaries_container):
+    summary = summarize_rollups(read_rollups(summaries_container))
+    return sum(model["runs"] for model in summary["models"]), summary["messages"]["total"]
+
+
+@pytest.fixture
+def logs(log_container):
+    documents = [run_log(f"thread_{index}", f"run_{index}", "failed" if index == 0 else "completed")
+                 for index in range(4)] + [message_log(f"thread_{index}", f"msg_{index}") for index in range(4)]
+    for document in documents:
+        log_container.upsert_item(body=document)
+    return documents
+
+
+def test_rewritten_logs_are_counted_once(log_container, summaries_container, logs):
+    processor = RunAnalytics(log_container, summaries_container)
+    assert processor.run_once() == 8
+    # Retried upserts put the same logs in the change feed again.
+    for document in logs[:3]:
+        log_container.upsert_item(body=document)
+
+    assert processor.run_once() == 3
+    assert processor.stats["duplicates"] == 3
+    assert totals(summaries_container) == (4, 4)
+
+
+def test_compact_migration_is_not_counted_again(log_container, summaries_container, logs):
+    processor = RunAnalytics(log_container, summaries_container)
+    processor.run_once()
+
+    assert migrate(log_container) == 8
+    processor.run_once()
+
+    assert processor.stats["duplicates"] == 8
+    assert totals(summaries_container) == (4, 4)
+
+
+def test_dedup_markers_expire(log_container, summaries_container, logs):
+    RunAnalytics(log_container, summaries_container, dedup_window=3600).run_once()
+
+    markers = [document for document in summaries_container.read_all_items()
+               if document.get("kind") == "counted_log"]
+    assert len(markers) == 8
+    assert {marker["ttl"] for marker in markers} == {7200}
+
+
+def test_late_rewrites_are_skipped_without_a_marker(log_container, summaries_container, logs):
+    written = (datetime.now(timezone.utc) - timedelta(hours=3)).replace(tzinfo=None).isoformat()
+    for document in logs:
+        log_container.upsert_item(body=dict(document, timestamp=written))
+    # Counted when they were written...
+    processor = RunAnalytics(log_container, summaries_container, dedup_window=10 ** 9)
+    processor.run_once()
+    for document in summaries_container.read_all_items():
+        if document.get("kind") == "counted_log":
+            summaries_container.delete_item(item=document["id"], partition_key=document["partition"])
+
+    # ...and migrated long after, once their markers expired.
+    processor.dedup_window = 3600
+    assert migrate(log_container) == 8
+    processor.run_once()
+
+    assert processor.stats["late_rewrites"] == 8
+    assert totals(summaries_container) == (4, 4)
+
+
+def test_a_restarted_processor_resumes_without_double_counting(log_container, summaries_container, logs):
+    first = RunAnalytics(log_container, summaries_container, page_size=3)
+    first.run_once()
+    first.close()
+    for document in logs[4:]:
+        log_container.upsert_item(body=document)
+
+    second = RunAnalytics(log_container, summaries_container, page_size=3)
+    second.run_once()
+
+    assert second.stats["duplicates"] == 4
+    assert totals(summaries_container) == (4, 4)
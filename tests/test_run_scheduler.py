@@ -0,0 +1,101 @@
+"""Polling of async agent runs (run_scheduler.py) against the fake project client."""
+
+import time
+
+import pytest
+
+from benchmark.fakes import FakeProjectClient
+from run_scheduler import RunScheduler
+
+
+@pytest.fixture
+def project():
+    return FakeProjectClient(run_latency=0.05, api_latency=0, seed=1)
+
+
+def start_run(project):
+    thread = project.agents.threads.create()
+    project.agents.messages.create(thread_id=thread.id, role="user", content="Can I expense a taxi?")
+    return thread.id, project.agents.runs.create(thread_id=thread.id, agent_id="asst_test").id
+
+
+def test_completed_run_calls_back(project):
+    completed = []
+
+    def on_complete(handle, run):
+        completed.append(run.status)
+        return {"response": project.agents.thread_messages[handle.thread_id][-1].text_messages[-1].text.value}
+
+    scheduler = RunScheduler(project, on_complete, min_interval=0.01, max_interval=0.02)
+    handle = scheduler.submit(*start_run(project))
+    assert handle.wait(5)
+    scheduler.close()
+
+    assert completed == ["completed"]
+    assert handle.status == "completed"
+    assert handle.to_dict()["response"] == project.agents.answer
+    assert scheduler.in_flight() == 0
+
+
+def test_callback_error_is_reported(project):
+    def on_complete(handle, run):
+        raise RuntimeError("No response from agent")
+
+    scheduler = RunScheduler(project, on_complete, min_interval=0.01, max_interval=0.02)
+    handle = scheduler.submit(*start_run(project))
+    assert handle.wait(5)
+    scheduler.close()
+
+    assert handle.to_dict()["error"] == "No response from agent"
+
+
+def test_persistent_poll_errors_fail_the_run(project):
+    scheduler = RunScheduler(project, min_interval=0.01, max_interval=0.01, max_errors=3)
+    handle = scheduler.submit("thread_missing", "run_missing")
+    assert handle.wait(5)
+    scheduler.close()
+
+    assert handle.status == "failed"
+    assert "3 times" in handle.error
+    assert project.agents.stats["runs.get"] == 3
+
+
+def test_run_past_deadline_fails(project):
+    project.agents.run_latency = 60
+    scheduler = RunScheduler(project, min_interval=0.01, max_interval=0.01, deadline=0.05)
+    handle = scheduler.submit(*start_run(project))
+    assert handle.wait(5)
+    scheduler.close()
+
+    assert handle.status == "failed"
+    assert "after 0.05 seconds" in handle.error
+
+
+def test_finished_runs_expire(project):
+    scheduler = RunScheduler(project, min_interval=0.01, max_interval=0.01, result_ttl=0)
+    handle = scheduler.submit(*start_run(project))
+    assert handle.wait(5)
+    # Expiry runs on the scheduler thread whenever it wakes up for a poll.
+    scheduler.submit(*start_run(project)).wait(5)
+    time.sleep(0.05)
+    scheduler.close()
+
+    assert scheduler.get(handle.run_id) is None
+
+
+def test_status_of_run_started_by_another_worker(chat_app):
+    app, project, _ = chat_app
+    thread_id, run_id = start_run(project)
+    client = app.app.test_client()
+
+    assert client.get(f"/api/run-status?run_id={run_id}").status_code == 404
+    for _ in range(50):
+        payload = client.get(f"/api/run-status?run_id={run_id}&thread_id={thread_id}").get_json()
+        if payload["done"]:
+            break
+        time.sleep(0.01)
+    assert payload["status"] == "completed"
+    assert payload["response"] == project.agents.answer
+
+    missing = client.get(f"/api/run-status?run_id=run_missing&thread_id={thread_id}")
+    assert missing.status_code == 404
@@ -0,0 +1,67 @@
+"""SSE frames of a streamed agent run (agent_logs.RunStream) over the fake stream."""
+
+import json
+
+from azure.ai.agents.models import AgentStreamEvent
+
+from agent_logs import RunStream
+from benchmark.fakes import FakeProjectClient
+
+
+def parse(frame):
+    event, data = frame.strip().split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+def stream_run(failure_rate=0.0):
+    project = FakeProjectClient(run_latency=0, api_latency=0, failure_rate=failure_rate, seed=1)
+    thread = project.agents.threads.create()
+    project.agents.messages.create(thread_id=thread.id, role="user", content="Can I expense a taxi?")
+    logged = []
+    stream = RunStream(thread.id, "session-1",
+                       on_message=lambda thread_id, message: logged.append(("message", message.id)),
+                       on_run=lambda thread_id, run: logged.append(("run", run.status)))
+
+    frames = [stream.start()]
+    with project.agents.runs.stream(thread_id=thread.id, agent_id="asst_test") as events:
+        for event_type, event_data, _ in events:
+            frame = stream.event(event_type, event_data)
+            if frame:
+                frames.append(frame)
+            if stream.failed:
+                break
+    if not stream.failed:
+        frames.append(stream.finish())
+    return project, stream, [parse(frame) for frame in frames], logged
+
+
+def test_completed_run_streams_deltas_then_done():
+    project, stream, frames, logged = stream_run()
+
+    events = [event for event, _ in frames]
+    assert events[0] == "start" and events[-1] == "done"
+    assert set(events[1:-1]) == {"delta"}
+    assert frames[0][1] == {"thread_id": stream.thread_id, "session_id": "session-1"}
+    assert "".join(data["text"] for event, data in frames if event == "delta") == project.agents.answer
+    assert frames[-1][1]["response"] == stream.response == project.agents.answer
+    assert frames[-1][1]["run_id"] == stream.run.id
+    assert [kind for kind, _ in logged] == ["message", "run"]
+
+
+def test_failed_run_ends_with_an_error_frame():
+    _, stream, frames, logged = stream_run(failure_rate=1.0)
+
+    assert frames[-1][0] == "error"
+    assert frames[-1][1]["error"].startswith("Agent run failed")
+    assert stream.response is None
+    assert logged == [("run", "failed")]
+
+
+def test_stream_error_event_stops_the_stream():
+    stream = RunStream("thread_1", "session-1", on_message=None, on_run=None)
+
+    frame = stream.event(AgentStreamEvent.ERROR, "rate limit exceeded")
+
+    assert stream.failed
+    assert parse(frame) == ("error", {"error": "rate limit exceeded"})
+    assert parse(stream.finish()) == ("error", {"error": "No response from agent"})
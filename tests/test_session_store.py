@@ -0,0 +1,119 @@
+"""The Cosmos session claim protocol (session_store.py) against the fake container."""
+
+import threading
+import time
+
+import pytest
+from azure.cosmos import PartitionKey, exceptions
+
+from session_store import CosmosSessionStore
+
+
+@pytest.fixture
+def sessions(database):
+    return database.create_container_if_not_exists(id="Sessions", partition_key=PartitionKey(path="/session_id"))
+
+
+def thread_factory():
+    created = []
+
+    def create_thread():
+        created.append(f"thread_{len(created) + 1}")
+        return created[-1]
+    return created, create_thread
+
+
+def test_concurrent_first_messages_create_one_thread(sessions):
+    # Separate stores stand in for separate workers, so only the claim
+    # document (not the in-process lock) keeps them apart.
+    created, create_thread = thread_factory()
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(
+        CosmosSessionStore(sessions, poll_interval=0.01).get_or_create("session-1", create_thread)))
+        for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert created == ["thread_1"]
+    assert results == ["thread_1"] * 8
+
+
+def test_failed_thread_creation_releases_the_claim(sessions):
+    store = CosmosSessionStore(sessions, claim_timeout=30, poll_interval=0.01)
+
+    def failing_create():
+        raise RuntimeError("agents service unavailable")
+
+    with pytest.raises(RuntimeError):
+        store.get_or_create("session-1", failing_create)
+    assert store._read("session-1") is None
+
+    started = time.monotonic()
+    assert store.get_or_create("session-1", lambda: "thread_ok") == "thread_ok"
+    assert time.monotonic() - started < 1
+
+
+def test_failed_claim_update_releases_the_claim(sessions, monkeypatch):
+    store = CosmosSessionStore(sessions)
+
+    def failing_replace(**kwargs):
+        raise exceptions.CosmosHttpResponseError(status_code=503, message="unavailable")
+
+    monkeypatch.setattr(sessions, "replace_item", failing_replace)
+    with pytest.raises(exceptions.CosmosHttpResponseError):
+        store.get_or_create("session-1", lambda: "thread_1")
+    assert store._read("session-1") is None
+
+
+def test_release_leaves_a_taken_over_claim_alone(sessions):
+    store = CosmosSessionStore(sessions)
+    claim = sessions.create_item(body={"id": "session-1", "session_id": "session-1",
+                                       "thread_id": None, "claimed_at": 0})
+    sessions.replace_item(item="session-1", body=dict(claim, claimed_at=time.time()))
+
+    store._release_claim(claim)
+
+    assert store._read("session-1") is not None
+
+
+def test_stale_claim_is_taken_over(sessions):
+    sessions.create_item(body={"id": "session-1", "session_id": "session-1",
+                               "thread_id": None, "claimed_at": time.time() - 60})
+    store = CosmosSessionStore(sessions, claim_timeout=30)
+
+    assert store.get_or_create("session-1", lambda: "thread_new") == "thread_new"
+    assert store.get("session-1") == "thread_new"
+
+
+def test_missing_session_id_is_rejected(sessions, cosmos):
+    store = CosmosSessionStore(sessions)
+
+    with pytest.raises(ValueError):
+        store.get_or_create(None, lambda: "thread_1")
+    assert "create_item" not in cosmos.snapshot()["operations"]
+
+
+def test_known_new_session_skips_the_read(sessions, cosmos):
+    store = CosmosSessionStore(sessions)
+    assert store.get("session-1") is None
+    reads = cosmos.snapshot()["operations"]["read_item"]
+
+    assert store.get_or_create("session-1", lambda: "thread_1", known_new=True) == "thread_1"
+    assert cosmos.snapshot()["operations"]["read_item"] == reads
+    # A second caller that saw no thread earlier still gets the same one.
+    assert store.get_or_create("session-1", lambda: "thread_2", known_new=True) == "thread_1"
+
+
+def test_claimant_taken_over_mid_creation_returns_the_winners_thread(sessions):
+    store = CosmosSessionStore(sessions, poll_interval=0.01)
+
+    def slow_create():
+        # Another worker takes the claim over and finishes first.
+        sessions.replace_item(item="session-1", body={"id": "session-1", "session_id": "session-1",
+                                                      "thread_id": "thread_winner"})
+        return "thread_loser"
+
+    assert store.get_or_create("session-1", slow_create) == "thread_winner"
+    assert store.get("session-1") == "thread_winner"
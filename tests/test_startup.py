@@ -0,0 +1,47 @@
+"""Background warm-up and the cached agent definition (startup.py)."""
+
+import threading
+
+from startup import CachedAgent
+
+
+def test_cached_agent_refreshes_on_a_timer_without_requests():
+    versions = iter(range(1, 100))
+    refreshed = threading.Event()
+    seen = []
+
+    def on_refresh(agent):
+        seen.append(agent)
+        if len(seen) >= 3:
+            refreshed.set()
+
+    cache = CachedAgent(lambda: next(versions), refresh_interval=0.01, on_refresh=on_refresh)
+    cache.start()
+    try:
+        # Nothing is fetched until the warm-up task's first fetch succeeds.
+        assert not refreshed.wait(0.05) and seen == []
+        assert cache.refresh() == 1
+        assert refreshed.wait(2)
+    finally:
+        cache.close()
+    assert cache.get() == seen[-1] > 1
+
+
+def test_failed_refresh_keeps_the_previous_definition():
+    calls = []
+
+    def load():
+        calls.append(None)
+        if len(calls) > 1:
+            raise RuntimeError("throttled")
+        return "v1"
+
+    cache = CachedAgent(load, refresh_interval=0.01)
+    cache.refresh()
+    cache.start()
+    try:
+        threading.Event().wait(0.1)
+    finally:
+        cache.close()
+    assert len(calls) > 1
+    assert cache.get() == "v1"
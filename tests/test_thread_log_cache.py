@@ -0,0 +1,115 @@
+"""The per-thread agent log cache (thread_log_cache.py) and its use by app.py."""
+
+import time
+
+from thread_log_cache import ThreadLogCache
+
+
+def message(message_id, role):
+    return {"id": message_id, "role": role, "content": []}
+
+
+def run(run_id, status):
+    return {"id": run_id, "status": status}
+
+
+def cached_thread():
+    cache = ThreadLogCache()
+    cache.fill("thread_1", [message("msg_1", "user")], [], started_at=time.monotonic())
+    cache.add_message("thread_1", message("msg_2", "user"), run_pending=True)
+    return cache
+
+
+def test_finished_run_waits_for_its_answer():
+    cache = cached_thread()
+    cache.add_run("thread_1", run("run_1", "completed"))
+    assert cache.get("thread_1") is None
+
+    cache.add_message("thread_1", message("msg_3", "assistant"))
+    messages, runs = cache.get("thread_1")
+    assert [item["id"] for item in messages] == ["msg_1", "msg_2", "msg_3"]
+    assert runs == [run("run_1", "completed")]
+
+
+def test_streamed_answer_waits_for_its_run():
+    cache = cached_thread()
+    cache.add_message("thread_1", message("msg_3", "assistant"))
+    assert cache.get("thread_1") is None
+
+    cache.add_run("thread_1", run("run_1", "completed"))
+    assert cache.get("thread_1") is not None
+
+
+def test_failed_run_has_no_answer_to_wait_for():
+    cache = cached_thread()
+    cache.add_run("thread_1", run("run_1", "failed"))
+
+    assert not cache.run_pending("thread_1")
+    assert cache.get("thread_1") is not None
+
+
+def test_bypassed_entry_still_expires():
+    cache = cached_thread()
+    cache.add_message("thread_1", message("msg_3", "user"), run_pending=True)
+    cache._entries["thread_1"]["expires_at"] = time.monotonic() - 1
+
+    assert not cache.run_pending("thread_1")
+    assert cache.get("thread_1") is None
+    assert cache.snapshot()["threads"] == 0
+
+
+def failing_turn(app, client, session_id, monkeypatch, method, path):
+    """Fill the thread's entry, then send a turn whose run call raises."""
+    thread_id = client.post("/api/thread-logs", json={"session_id": session_id}).get_json()["thread_id"]
+    assert app.thread_log_cache.get(thread_id) is not None
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("service unavailable")
+
+    monkeypatch.setattr(app.project.agents.runs, method, broken)
+    response = client.post(path, json={"message": "And hotels?", "session_id": session_id})
+    response.get_data()
+    return thread_id
+
+
+def test_failed_turn_drops_the_threads_entry(chat_app, monkeypatch):
+    app, _, _ = chat_app
+    client = app.app.test_client()
+    session_id = client.post("/api/new-session").get_json()["session_id"]
+    client.post("/api/chat", json={"message": "Taxi?", "session_id": session_id})
+
+    thread_id = failing_turn(app, client, session_id, monkeypatch, "create_and_process", "/api/chat")
+    assert not app.thread_log_cache.run_pending(thread_id)
+    assert app.thread_log_cache.get(thread_id) is None
+
+    monkeypatch.undo()
+    thread_id = failing_turn(app, client, session_id, monkeypatch, "stream", "/api/chat/stream")
+    assert not app.thread_log_cache.run_pending(thread_id)
+
+    # The next listing refills the entry instead of bypassing it for good.
+    client.post("/api/thread-logs", json={"session_id": session_id})
+    assert app.thread_log_cache.get(thread_id) is not None
+
+
+def test_refresh_with_cursors_lists_only_what_follows(chat_app, monkeypatch):
+    app, _, _ = chat_app
+    client = app.app.test_client()
+    session_id = client.post("/api/new-session").get_json()["session_id"]
+    client.post("/api/chat", json={"message": "Taxi?", "session_id": session_id})
+    first = client.post("/api/thread-logs", json={"session_id": session_id, "page_size": 100}).get_json()
+    app.thread_log_cache.invalidate(first["thread_id"])
+
+    listed = []
+    list_agent_items = app.list_agent_items
+
+    def recording_list(list_method, thread_id, after=None, page_size=None):
+        listed.append((after, page_size))
+        return list_agent_items(list_method, thread_id, after, page_size)
+
+    monkeypatch.setattr(app, "list_agent_items", recording_list)
+    refreshed = client.post("/api/thread-logs", json={
+        "session_id": session_id, "page_size": 100,
+        "since": first["cursor"], "run_since": first["run_cursor"]}).get_json()
+
+    assert sorted(listed) == sorted([(first["cursor"], 100), (first["run_cursor"], 100)])
+    assert refreshed["logs"] == [] and refreshed["run_info"] == []
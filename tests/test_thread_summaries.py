@@ -0,0 +1,74 @@
+"""Incremental thread summaries (thread_summaries.py) against the fake container."""
+
+from agent_logs import log_document
+from thread_summaries import LEGACY_PARTITION, ThreadSummaryStore, summary_partition
+
+
+def log(thread_id, log_type, timestamp, **data):
+    document = log_document(thread_id, log_type, data)
+    document["timestamp"] = timestamp
+    return document
+
+
+def summary(container, thread_id):
+    return container.read_item(item=thread_id, partition_key=summary_partition(thread_id))
+
+
+def test_in_order_batches_cost_one_patch_each(summaries_container, cosmos):
+    store = ThreadSummaryStore(summaries_container)
+    store.apply([log("thread_1", "message", "2025-01-01T10:00:00")])
+    store.apply([log("thread_1", "run", "2025-01-01T10:00:05", status="completed"),
+                 log("thread_1", "message", "2025-01-01T10:00:06")])
+
+    operations = cosmos.snapshot()["operations"]
+    assert operations["patch_item"] == 2
+    assert "replace_item" not in operations
+    stored = summary(summaries_container, "thread_1")
+    assert (stored["message_count"], stored["total_logs"]) == (2, 3)
+    assert stored["last_activity"] == "2025-01-01T10:00:06"
+    assert stored["last_run_status"] == "completed"
+
+
+def test_late_batch_never_moves_a_summary_backwards(summaries_container):
+    store = ThreadSummaryStore(summaries_container)
+    store.apply([log("thread_1", "run", "2025-01-01T10:05:00", status="completed"),
+                 log("thread_1", "message", "2025-01-01T10:05:01")])
+    store.apply([log("thread_1", "message", "2025-01-01T10:00:00"),
+                 log("thread_1", "run", "2025-01-01T10:00:30", status="failed")])
+
+    stored = summary(summaries_container, "thread_1")
+    assert stored["first_activity"] == "2025-01-01T10:00:00"
+    assert stored["last_activity"] == "2025-01-01T10:05:01"
+    assert stored["last_run_status"] == "completed"
+    assert (stored["message_count"], stored["total_logs"]) == (2, 4)
+
+
+def test_listing_pages_across_partitions(summaries_container):
+    store = ThreadSummaryStore(summaries_container)
+    for index in range(25):
+        store.apply([log(f"thread_{index:02d}", "message", f"2025-01-01T10:{index % 10:02d}:00")])
+    assert len({summary_partition(f"thread_{index:02d}") for index in range(25)}) > 1
+
+    listed, continuation = [], None
+    while True:
+        page, continuation = store.list_page(page_size=10, continuation=continuation)
+        listed.extend(page)
+        if not continuation:
+            break
+
+    assert len(listed) == 25 == store.count()
+    assert len({item["thread_id"] for item in listed}) == 25
+    keys = [(item["last_activity"], item["thread_id"]) for item in listed]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_rebuild_moves_legacy_summaries(summaries_container, log_container):
+    log_container.upsert_item(body=log("thread_1", "message", "2025-01-01T10:00:00"))
+    summaries_container.upsert_item(body={"id": "thread_1", "thread_id": "thread_1",
+                                          "partition": LEGACY_PARTITION, "log_type": "thread_summary"})
+    store = ThreadSummaryStore(summaries_container)
+
+    assert store.rebuild(log_container) == 1
+    assert summary(summaries_container, "thread_1")["message_count"] == 1
+    assert [document["partition"] for document in summaries_container.read_all_items()] == [
+        summary_partition("thread_1")]
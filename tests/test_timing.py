@@ -0,0 +1,16 @@
+"""Helpers of timing.py."""
+
+from timing import percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 21))
+    assert percentile(values, 0.50) == 10
+    assert percentile(values, 0.95) == 19
+    assert percentile(values, 0.99) == 20
+    assert percentile(list(range(1, 101)), 0.07) == 7
+    # An exact rank is used as is, not rounded to the nearest even one.
+    assert percentile([1, 2, 3, 4, 5, 6], 0.5) == 3
+    assert percentile([1, 2, 3, 4, 5], 0.5) == 3
+    assert percentile([1, 2], 0.25) == 1
+    assert percentile([], 0.5) is None
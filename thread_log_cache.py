@@ -0,0 +1,168 @@
+"""Per-thread cache of the agent logs shown in the logs panel.
+
+`/api/thread-logs` with `source=agent` used to page through every message
+and every run of the thread on each call and format them again, even when
+nothing had changed since the panel was last opened.  This cache keeps the
+formatted lists per thread:
+
+* an entry is filled from a full listing, and only when every run in it has
+  finished, so it never freezes an in-progress run;
+* the chat path keeps entries current as it goes: the user message, the
+  agent's answer and the finished run are appended to a cached thread
+  (nothing happens for threads that are not cached).  From the user
+  message until the run has finished and, if it completed, its answer was
+  added (in either order), the entry is bypassed, so the panel shows the
+  run while it is in progress and never a finished run without its answer;
+* a fill is discarded if the chat path changed the thread while the
+  listing was in flight, so a slow listing cannot overwrite newer data;
+* a turn that fails part-way drops the entry (`invalidate`), and entries
+  expire after `ttl` seconds even while bypassed, which bounds staleness
+  from changes made by other workers;
+* the cache is an LRU bounded both by thread count and by the total
+  number of cached items.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ThreadLogCache:
+    """LRU cache of formatted `{messages, runs}` per thread, with TTL."""
+
+    def __init__(self, max_threads=500, max_items=50000, ttl=300):
+        self.max_threads = max_threads
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Last time the chat path changed a thread, for discarding stale fills.
+        self._changed = OrderedDict()
+        self._items = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "fills": 0, "extensions": 0,
+                      "stale_fills": 0, "evictions": 0}
+
+    def get(self, thread_id):
+        """Return `(messages, runs)` for a thread, or None."""
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is not None and entry["expires_at"] < time.monotonic():
+                # Also ends the bypass of a turn whose run was never added.
+                self._remove(thread_id)
+                entry = None
+            if entry is None or entry["waiting_for"]:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(thread_id)
+            self.stats["hits"] += 1
+            return list(entry["messages"]), list(entry["runs"])
+
+    def fill(self, thread_id, messages, runs, started_at):
+        """Cache a full listing that was started at `started_at` (monotonic)."""
+        with self._lock:
+            if self._changed.get(thread_id, 0.0) >= started_at:
+                self.stats["stale_fills"] += 1
+                return
+            if len(messages) + len(runs) > self.max_items:
+                return
+            self._remove(thread_id)
+            self._entries[thread_id] = {
+                "messages": list(messages),
+                "runs": list(runs),
+                # What the chat path still has to add: "run" and "answer".
+                "waiting_for": set(),
+                "expires_at": time.monotonic() + self.ttl
+            }
+            self._items += len(messages) + len(runs)
+            self.stats["fills"] += 1
+            self._evict()
+
+    def add_message(self, thread_id, message, run_pending=False):
+        """Append a formatted message to a cached thread.
+
+        `run_pending` marks a user message that a run will answer; the
+        entry is bypassed until that run and its answer are added.
+        """
+        waiting_for = {"run", "answer"} if run_pending else set()
+        done = {"answer"} if message.get("role") == "assistant" else set()
+        self._extend(thread_id, "messages", message, waiting_for, done)
+
+    def add_run(self, thread_id, run):
+        """Add a finished run to a cached thread, replacing an older copy.
+
+        A run that did not complete has no answer to wait for.
+        """
+        done = {"run"} if run.get("status", "").lower() == "completed" else {"run", "answer"}
+        self._extend(thread_id, "runs", run, set(), done)
+
+    def run_pending(self, thread_id):
+        """True while a cached thread waits for a run or its answer."""
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            return bool(entry and entry["waiting_for"] and entry["expires_at"] >= time.monotonic())
+
+    def invalidate(self, thread_id):
+        """Drop a thread's entry."""
+        with self._lock:
+            self._mark_changed(thread_id)
+            self._remove(thread_id)
+
+    def snapshot(self):
+        """Return the cache counters plus the current size."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["threads"] = len(self._entries)
+            stats["items"] = self._items
+        return stats
+
+    def _extend(self, thread_id, field, item, waiting_for, done):
+        with self._lock:
+            self._mark_changed(thread_id)
+            entry = self._entries.get(thread_id)
+            if entry is None:
+                return
+            if waiting_for:
+                entry["waiting_for"] = set(waiting_for)
+            entry["waiting_for"] -= done
+            items = entry[field]
+            for index, existing in enumerate(items):
+                if item["id"] is not None and existing["id"] == item["id"]:
+                    items[index] = item
+                    break
+            else:
+                items.append(item)
+                self._items += 1
+            self.stats["extensions"] += 1
+            self._evict()
+
+    def _mark_changed(self, thread_id):
+        self._changed[thread_id] = time.monotonic()
+        self._changed.move_to_end(thread_id)
+        while len(self._changed) > self.max_threads:
+            self._changed.popitem(last=False)
+
+    def _remove(self, thread_id):
+        entry = self._entries.pop(thread_id, None)
+        if entry is not None:
+            self._items -= len(entry["messages"]) + len(entry["runs"])
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_threads or self._items > self.max_items):
+            thread_id, entry = self._entries.popitem(last=False)
+            self._items -= len(entry["messages"]) + len(entry["runs"])
+            self.stats["evictions"] += 1
+
+
+def page_after(items, after, page_size):
+    """Slice a cached list like the Agents API pages it.
+
+    Returns the items after the one with ID `after` (at most `page_size`),
+    or None when `after` is not in the list.
+    """
+    start = 0
+    if after:
+        ids = [item["id"] for item in items]
+        if after not in ids:
+            return None
+        start = ids.index(after) + 1
+    return items[start:start + page_size] if page_size else items[start:]
@@ -0,0 +1,382 @@
+"""Materialized per-thread summary documents.
+
+`/api/all-threads` used to run a cross-partition `SELECT DISTINCT` and then
+pull every log document of up to 50 threads just to count messages and find
+the first/last timestamps.  Instead, the log writer now keeps one small
+summary document per thread up to date as it writes logs:
+
+    {
+      "id": "<thread_id>",
+      "thread_id": "<thread_id>",
+      "partition": "threads-07",
+      "message_count": 4,
+      "total_logs": 7,
+      "first_activity": "...",
+      "last_activity": "...",
+      "last_run_status": "completed",
+      "last_run_at": "..."
+    }
+
+Summaries are spread over `COSMOS_SUMMARY_BUCKETS` logical partitions
+(`threads-00`, `threads-01`, ...) by a hash of the thread ID, so no single
+partition takes every write or hits the 20 GB logical partition limit.
+Listing pages with a keyset cursor on `(last_activity, thread_id)` rather
+than an SDK continuation token, because cross-partition ORDER BY queries
+cannot be resumed from one.
+
+Each update is normally one conditional `patch_item` call: the counters are
+incremented and the activity fields set only if the batch is not older than
+the summary.  When log batches arrive out of order that condition fails and
+the summary is read and replaced instead, keeping `first_activity` the
+earliest and `last_activity`/`last_run_status` the latest seen.
+
+Run `python thread_summaries.py` to backfill summaries for logs written
+before this existed, or to move summaries of an older version out of the
+single `threads` partition.
+"""
+
+import itertools
+import json
+import os
+import zlib
+from collections import defaultdict
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+from cosmos_queries import queries
+from log_format import iso_timestamp, log_query, log_type_name
+
+SUMMARY_BUCKETS = int(os.getenv("COSMOS_SUMMARY_BUCKETS", "16"))
+# Partition of every summary before they were bucketed.
+LEGACY_PARTITION = "threads"
+# Sorts after every ISO timestamp, so the first page starts at the newest.
+_NEWEST = ["9999-12-31T23:59:59", ""]
+# Read-and-replace attempts when concurrent writers keep changing a summary.
+_REPLACE_ATTEMPTS = 5
+
+
+def summary_partition(thread_id, buckets=SUMMARY_BUCKETS):
+    """The summary partition a thread's summary lives in."""
+    return f"threads-{zlib.crc32(thread_id.encode()) % buckets:02d}"
+
+
+def summary_partitions(buckets=SUMMARY_BUCKETS):
+    """Every summary partition, for the listing and count queries."""
+    return [f"threads-{bucket:02d}" for bucket in range(buckets)]
+
+
+def summarize_documents(documents):
+    """Fold log documents into per-thread summary deltas."""
+    deltas = defaultdict(lambda: {
+        "message_count": 0,
+        "total_logs": 0,
+        "first_activity": None,
+        "last_activity": None,
+        "last_run_status": None,
+        "last_run_at": None,
+        "session_id": None
+    })
+    for document in documents:
+        if document.get("log_type") == "thread_summary":
+            continue
+        delta = deltas[document["thread_id"]]
+        timestamp = document.get("timestamp")
+        delta["total_logs"] += 1
+        if document.get("log_type") == "message":
+            delta["message_count"] += 1
+        if timestamp:
+            if not delta["first_activity"] or timestamp < delta["first_activity"]:
+                delta["first_activity"] = timestamp
+            if not delta["last_activity"] or timestamp > delta["last_activity"]:
+                delta["last_activity"] = timestamp
+        data = document.get("data") or {}
+        if document.get("log_type") == "run" and (
+                not delta["last_run_at"] or (timestamp or "") >= delta["last_run_at"]):
+            delta["last_run_status"] = data.get("status")
+            delta["last_run_at"] = timestamp or ""
+        if document.get("log_type") == "thread_created":
+            delta["session_id"] = data.get("session_id")
+    return deltas
+
+
+class ThreadSummaryStore:
+    """Read and incrementally maintain thread summary documents."""
+
+    def __init__(self, container, buckets=SUMMARY_BUCKETS):
+        self.container = container
+        self.buckets = buckets
+
+    def apply(self, documents):
+        """Fold freshly written log documents into their thread summaries.
+
+        Used as a log writer listener, so it runs off the request path.
+        Not idempotent per `log_format.log_key`: a log written twice (a
+        retried upsert of a compact document overwrites it) is counted
+        twice until `python thread_summaries.py` rebuilds the summary.
+        """
+        for thread_id, delta in summarize_documents(documents).items():
+            try:
+                self._update(thread_id, delta)
+            except Exception as e:
+                print(f"Error updating thread summary for {thread_id}: {e}")
+
+    def list_page(self, page_size=50, continuation=None):
+        """Return one page of summaries, newest activity first.
+
+        Returns `(summaries, continuation_token)`; the token is None on the
+        last page.
+        """
+        parameters = page_parameters(self.buckets, page_size, continuation)
+        summaries = list(itertools.islice(
+            queries.iterate(self.container, "thread_summaries_page", parameters, page_size=page_size + 1),
+            page_size + 1))
+        return finish_page(summaries, page_size)
+
+    def count(self):
+        """Return the number of summarized threads."""
+        return queries.first(
+            self.container,
+            "count_thread_summaries",
+            {"@partitions": summary_partitions(self.buckets)}
+        ) or 0
+
+    def rebuild(self, log_container):
+        """Recompute every summary from the raw logs (backfill/repair)."""
+        documents = queries.iterate(log_container, log_query("summary_fields"))
+        summaries = defaultdict(list)
+        for document in documents:
+            # Compact logs come back with type codes and epoch milliseconds.
+            document["log_type"] = log_type_name(document.get("log_type"))
+            document["timestamp"] = iso_timestamp(document.get("timestamp"))
+            document["data"] = {
+                "status": document.pop("status", None),
+                "session_id": document.pop("session_id", None)
+            }
+            summaries[document["thread_id"]].append(document)
+
+        for thread_id, thread_documents in summaries.items():
+            delta = summarize_documents(thread_documents)[thread_id]
+            self.container.upsert_item(body=new_summary(thread_id, delta, self.buckets))
+
+        # Summaries from before bucketing all sat in one partition.
+        for legacy in list(queries.iterate(self.container, "summary_ids", {"@partition": LEGACY_PARTITION},
+                                           partition_key=LEGACY_PARTITION)):
+            self.container.delete_item(item=legacy["id"], partition_key=LEGACY_PARTITION)
+        return len(summaries)
+
+    def _update(self, thread_id, delta):
+        partition = summary_partition(thread_id, self.buckets)
+        try:
+            self.container.patch_item(
+                item=thread_id,
+                partition_key=partition,
+                patch_operations=summary_patch_operations(delta),
+                filter_predicate=in_order_predicate(delta)
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            try:
+                self.container.create_item(body=new_summary(thread_id, delta, self.buckets))
+            except exceptions.CosmosResourceExistsError:
+                # Another writer created it first; apply our delta on top.
+                self._merge(thread_id, partition, delta)
+        except exceptions.CosmosAccessConditionFailedError:
+            self._merge(thread_id, partition, delta)
+
+    def _merge(self, thread_id, partition, delta):
+        """Apply a delta with read-and-replace, for batches that arrive out of order."""
+        for _ in range(_REPLACE_ATTEMPTS):
+            summary = self.container.read_item(item=thread_id, partition_key=partition)
+            try:
+                self.container.replace_item(
+                    item=thread_id,
+                    body=merge_summary(summary, delta),
+                    etag=summary["_etag"],
+                    match_condition=MatchConditions.IfNotModified
+                )
+                return
+            except exceptions.CosmosAccessConditionFailedError:
+                continue
+        raise RuntimeError(f"Summary of {thread_id} kept changing; delta not applied")
+
+
+class AsyncThreadSummaryStore:
+    """`ThreadSummaryStore` for an `azure.cosmos.aio` container (asgi_app.py)."""
+
+    def __init__(self, container, buckets=SUMMARY_BUCKETS):
+        self.container = container
+        self.buckets = buckets
+
+    async def apply(self, documents):
+        """Fold freshly written log documents into their thread summaries.
+
+        Not idempotent per log key, like `ThreadSummaryStore.apply`.
+        """
+        for thread_id, delta in summarize_documents(documents).items():
+            try:
+                await self._update(thread_id, delta)
+            except Exception as e:
+                print(f"Error updating thread summary for {thread_id}: {e}")
+
+    async def list_page(self, page_size=50, continuation=None):
+        """Return one page of summaries and the continuation token."""
+        parameters = page_parameters(self.buckets, page_size, continuation)
+        summaries = []
+        async for summary in queries.iterate_async(self.container, "thread_summaries_page", parameters,
+                                                   page_size=page_size + 1):
+            summaries.append(summary)
+            if len(summaries) > page_size:
+                break
+        return finish_page(summaries, page_size)
+
+    async def count(self):
+        """Return the number of summarized threads."""
+        return await queries.first_async(
+            self.container,
+            "count_thread_summaries",
+            {"@partitions": summary_partitions(self.buckets)}
+        ) or 0
+
+    async def _update(self, thread_id, delta):
+        partition = summary_partition(thread_id, self.buckets)
+        try:
+            await self.container.patch_item(
+                item=thread_id,
+                partition_key=partition,
+                patch_operations=summary_patch_operations(delta),
+                filter_predicate=in_order_predicate(delta)
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            try:
+                await self.container.create_item(body=new_summary(thread_id, delta, self.buckets))
+            except exceptions.CosmosResourceExistsError:
+                await self._merge(thread_id, partition, delta)
+        except exceptions.CosmosAccessConditionFailedError:
+            await self._merge(thread_id, partition, delta)
+
+    async def _merge(self, thread_id, partition, delta):
+        for _ in range(_REPLACE_ATTEMPTS):
+            summary = await self.container.read_item(item=thread_id, partition_key=partition)
+            try:
+                await self.container.replace_item(
+                    item=thread_id,
+                    body=merge_summary(summary, delta),
+                    etag=summary["_etag"],
+                    match_condition=MatchConditions.IfNotModified
+                )
+                return
+            except exceptions.CosmosAccessConditionFailedError:
+                continue
+        raise RuntimeError(f"Summary of {thread_id} kept changing; delta not applied")
+
+
+def page_parameters(buckets, page_size, continuation):
+    """Query parameters of one summaries page; `continuation` is the last row seen."""
+    before, thread_id = _NEWEST
+    if continuation:
+        try:
+            before, thread_id = json.loads(continuation)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid continuation token")
+    return {
+        "@partitions": summary_partitions(buckets),
+        "@limit": page_size + 1,
+        "@before": before,
+        "@thread_id": thread_id
+    }
+
+
+def finish_page(summaries, page_size):
+    """`(page, continuation)` from up to `page_size + 1` summaries."""
+    if len(summaries) <= page_size:
+        return summaries, None
+    page = summaries[:page_size]
+    return page, json.dumps([page[-1]["last_activity"], page[-1]["thread_id"]])
+
+
+def summary_patch_operations(delta):
+    """Patch operations that apply an in-order summary delta to a summary."""
+    operations = [
+        {"op": "incr", "path": "/message_count", "value": delta["message_count"]},
+        {"op": "incr", "path": "/total_logs", "value": delta["total_logs"]}
+    ]
+    if delta["last_activity"]:
+        operations.append({"op": "set", "path": "/last_activity", "value": delta["last_activity"]})
+    if delta["last_run_status"]:
+        operations.append({"op": "set", "path": "/last_run_status", "value": delta["last_run_status"]})
+        operations.append({"op": "set", "path": "/last_run_at", "value": delta["last_run_at"]})
+    if delta["session_id"]:
+        operations.append({"op": "set", "path": "/session_id", "value": delta["session_id"]})
+    return operations
+
+
+def in_order_predicate(delta):
+    """Patch condition under which `summary_patch_operations` is safe to apply.
+
+    It holds when the delta starts no earlier and ends no earlier than what
+    the summary has seen, so setting the activity fields moves them forward.
+    Timestamps are ISO strings the app generated, so they quote safely.
+    """
+    conditions = []
+    if delta["first_activity"]:
+        conditions.append(f"c.first_activity <= '{delta['first_activity']}'")
+    if delta["last_activity"]:
+        conditions.append(f"c.last_activity <= '{delta['last_activity']}'")
+    if delta["last_run_status"]:
+        conditions.append(f"(NOT IS_DEFINED(c.last_run_at) OR c.last_run_at <= '{delta['last_run_at']}')")
+    return "FROM c WHERE " + " AND ".join(conditions) if conditions else None
+
+
+def merge_summary(summary, delta):
+    """A stored summary with a delta of any age folded in."""
+    merged = {key: value for key, value in summary.items() if not key.startswith("_")}
+    merged["message_count"] = merged.get("message_count", 0) + delta["message_count"]
+    merged["total_logs"] = merged.get("total_logs", 0) + delta["total_logs"]
+    if delta["first_activity"] and (not merged.get("first_activity")
+                                    or delta["first_activity"] < merged["first_activity"]):
+        merged["first_activity"] = delta["first_activity"]
+    if delta["last_activity"] and (not merged.get("last_activity")
+                                   or delta["last_activity"] > merged["last_activity"]):
+        merged["last_activity"] = delta["last_activity"]
+    if delta["last_run_status"] and (not merged.get("last_run_at")
+                                     or delta["last_run_at"] >= merged["last_run_at"]):
+        merged["last_run_status"] = delta["last_run_status"]
+        merged["last_run_at"] = delta["last_run_at"]
+    if delta["session_id"]:
+        merged["session_id"] = delta["session_id"]
+    return merged
+
+
+def new_summary(thread_id, delta, buckets=SUMMARY_BUCKETS):
+    """A complete summary document for a thread seen for the first time."""
+    return {
+        "id": thread_id,
+        "thread_id": thread_id,
+        "partition": summary_partition(thread_id, buckets),
+        "log_type": "thread_summary",
+        "message_count": delta["message_count"],
+        "total_logs": delta["total_logs"],
+        "first_activity": delta["first_activity"],
+        "last_activity": delta["last_activity"],
+        "last_run_status": delta["last_run_status"],
+        # Empty rather than null, so the in-order condition can compare it.
+        "last_run_at": delta["last_run_at"] or "",
+        "session_id": delta["session_id"]
+    }
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from azure.cosmos import CosmosClient
+
+    from cosmos_provisioning import provision_summaries_container
+
+    load_dotenv()
+    client = CosmosClient(os.getenv("COSMOS_ENDPOINT"), os.getenv("COSMOS_KEY"))
+    database = client.get_database_client(os.getenv("COSMOS_DATABASE_NAME", "AgentLogsDB"))
+    summary_container = provision_summaries_container(
+        database, os.getenv("COSMOS_SUMMARIES_CONTAINER_NAME", "ThreadSummaries"), apply_to_existing=True)
+    store = ThreadSummaryStore(summary_container)
+    rebuilt = store.rebuild(database.get_container_client(
+        os.getenv("COSMOS_CONTAINER_NAME", "ThreadLogs")))
+    print(f"✓ Rebuilt {rebuilt} thread summaries")
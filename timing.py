@@ -0,0 +1,154 @@
+"""Latency breakdown of the chat pipeline.
+
+One `/api/chat` call makes several Azure AI calls (thread, message, run,
+message list) plus Cosmos DB writes, and only the total used to be visible.
+Each of those calls is now wrapped in a `span(stage)`:
+
+* every span is observed in a per-stage histogram, exported in Prometheus
+  text format at `/metrics` together with the Cosmos DB RU charges;
+* spans that run inside a request are also collected in that request's
+  trace.  The app attaches the trace to the run log document in Cosmos DB
+  (`data.timings`) and, with `SERVER_TIMING_ENABLED=true`, sends it as a
+  `Server-Timing` header that browser devtools show in the network panel.
+
+No client library is needed; the text format is simple enough to write out
+directly.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Histogram buckets in seconds, from a fast Cosmos point write to a long
+# agent run.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_trace = ContextVar("timing_trace", default=None)
+
+
+class Histograms:
+    """Prometheus-style histograms keyed by one label value."""
+
+    def __init__(self, name, help_text, label, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._charges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds, request_charge=None):
+        """Record one duration, and optionally the RU charge it cost."""
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {
+                    "buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+            if request_charge:
+                self._charges[label_value] = self._charges.get(label_value, 0.0) + request_charge
+
+    def render(self):
+        """Return the histograms in Prometheus text exposition format."""
+        with self._lock:
+            series = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._series.items()}
+            charges = dict(self._charges)
+
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            for bound, count in zip(self.buckets, values["buckets"]):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values["count"]}')
+            lines.append(f"{self.name}_sum{{{label}}} {values['sum']:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {values['count']}")
+        if charges:
+            lines.extend(counter_lines(
+                "cosmos_request_charge_total",
+                "Cosmos DB request units consumed, per stage.",
+                self.label,
+                charges
+            ))
+        return lines
+
+
+def counter_lines(name, help_text, label, samples, metric_type="counter"):
+    """Format `{label_value: number}` samples as one Prometheus metric family."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for label_value, value in sorted(samples.items()):
+        lines.append(f'{name}{{{label}="{_escape(label_value)}"}} {value}')
+    return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared histograms used by the app and the log writer.
+stages = Histograms("chat_stage_duration_seconds",
+                    "Time spent in each chat pipeline stage.", "stage")
+endpoints = Histograms("http_request_duration_seconds",
+                       "Time to produce a response (streams: until the first byte), per endpoint.",
+                       "endpoint")
+
+
+def start_trace():
+    """Begin collecting the spans of the current request."""
+    trace = []
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    """Return the current request's spans, or None outside a request."""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage):
+    """Time a block as `stage`.
+
+    Yields a dict; set `request_charge` on it to attribute Cosmos DB RUs.
+    """
+    details = {}
+    start = time.perf_counter()
+    try:
+        yield details
+    finally:
+        record(stage, time.perf_counter() - start, details.get("request_charge"))
+
+
+def record(stage, seconds, request_charge=None):
+    """Observe a duration measured by the caller, like a finished span."""
+    stages.observe(stage, seconds, request_charge)
+    trace = _current_trace.get()
+    if trace is not None:
+        entry = {"stage": stage, "ms": round(seconds * 1000, 1)}
+        if request_charge:
+            entry["request_charge"] = request_charge
+        trace.append(entry)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list, or None if it is empty."""
+    if not sorted_values:
+        return None
+    # Rounding first keeps float noise (0.07 * 100 = 7.000000000000001)
+    # from bumping the rank.
+    rank = math.ceil(round(fraction * len(sorted_values), 9))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def server_timing(trace):
+    """Format a trace as a `Server-Timing` header, one entry per stage."""
+    totals = {}
+    for entry in trace:
+        totals[entry["stage"]] = totals.get(entry["stage"], 0.0) + entry["ms"]
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in totals.items())